@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import metrics
+from namespaces import DEFAULT_NAMESPACE
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+
+
+class SemanticAnswerCache:
+    """In-memory cache of answers keyed by question embedding.
+
+    A lookup hits when a cached question has cosine similarity >= threshold with the new
+    one and is younger than ttl seconds. Entries are evicted least recently used first and
+    remember the namespace and sources their answer was built from, so questions only hit
+    answers from their own namespace and re-ingesting or deleting a source drops only the
+    answers that depended on it."""
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._next_id = 0
+        # Stacked unit vectors of all entries, rebuilt lazily after changes
+        self._matrix = None
+        self._matrix_ids = []
+        self._matrix_namespaces = None
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _rebuild_matrix(self):
+        self._matrix_ids = list(self._entries)
+        if self._matrix_ids:
+            self._matrix = np.stack([self._entries[id]["vector"] for id in self._matrix_ids])
+            self._matrix_namespaces = np.array([self._entries[id]["namespace"] for id in self._matrix_ids])
+        else:
+            self._matrix = None
+
+    def _remove(self, ids):
+        for id in ids:
+            self._entries.pop(id, None)
+        if ids:
+            self._matrix = None
+
+    def get(self, vector, namespace=DEFAULT_NAMESPACE):
+        """Return the cached entry for the most similar question asked in namespace, or None"""
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        now = time.time()
+        with self._lock:
+            expired = [id for id, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+            self._remove(expired)
+            if self._matrix is None:
+                self._rebuild_matrix()
+            if self._matrix is not None:
+                scores = np.where(self._matrix_namespaces == namespace, self._matrix @ query, -np.inf)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    id = self._matrix_ids[best]
+                    self._entries.move_to_end(id)
+                    self.stats["hits"] += 1
+                    metrics.inc("answer_cache_requests_total", result="hit")
+                    return dict(self._entries[id], similarity=float(scores[best]))
+            self.stats["misses"] += 1
+        metrics.inc("answer_cache_requests_total", result="miss")
+        return None
+
+    def put(self, vector, question, answer, sources, namespace=DEFAULT_NAMESPACE):
+        vector = np.asarray(vector, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            self._entries[self._next_id] = {
+                "vector": vector,
+                "question": question,
+                "answer": answer,
+                "sources": frozenset(sources),
+                "namespace": namespace,
+                "created_at": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self, source_path=None, namespace=DEFAULT_NAMESPACE):
+        """Drop a namespace's answers built from source_path, or all of them when source_path is None"""
+        with self._lock:
+            self._remove([
+                id for id, entry in self._entries.items()
+                if entry["namespace"] == namespace and (source_path is None or source_path in entry["sources"])
+            ])
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries))
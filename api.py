@@ -0,0 +1,253 @@
+import os
+from typing import List, Optional
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from crawler import CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES
+from hnsw_index import index_settings, submit_index_rebuild
+from jobs import get_job_queue
+from namespaces import UnknownNamespace, list_namespaces, normalize_namespace, require_namespace
+from qa_pipeline import BATCH_LLM_CONCURRENCY, get_engine, llm_config_error
+from snapshots import (
+    SNAPSHOT_DTYPE,
+    list_snapshots,
+    save_snapshot,
+    snapshot_file,
+    submit_snapshot_export,
+    submit_snapshot_import,
+)
+from sources import (
+    SOURCES_PAGE_SIZE,
+    chunk_report,
+    delete_source,
+    list_sources,
+    save_upload,
+    submit_crawl_ingestion,
+    submit_file_ingestion,
+    submit_url_ingestion,
+)
+
+# Largest batch accepted by /api/ask/batch
+API_MAX_BATCH = int(os.getenv("API_MAX_BATCH", "64"))
+
+# Blocking endpoints are plain functions, which FastAPI runs on its thread pool; the ask
+# endpoints are async so waiting on the LLM never ties up a thread
+router = APIRouter(prefix="/api")
+
+
+# Every endpoint takes an optional namespace; leaving it out uses the default namespace
+
+
+class UrlRequest(BaseModel):
+    url: str
+    namespace: Optional[str] = None
+
+
+class CrawlRequest(BaseModel):
+    # A page to start from or a sitemap.xml
+    url: str
+    namespace: Optional[str] = None
+    max_depth: int = CRAWL_MAX_DEPTH
+    max_pages: int = CRAWL_MAX_PAGES
+
+
+class IndexRebuildRequest(BaseModel):
+    namespace: Optional[str] = None
+    # Settings left out keep their current value
+    space: Optional[str] = None
+    max_neighbors: Optional[int] = None
+    ef_construction: Optional[int] = None
+    ef_search: Optional[int] = None
+
+
+class SnapshotExportRequest(BaseModel):
+    namespace: Optional[str] = None
+    # float16 or float32
+    dtype: str = SNAPSHOT_DTYPE
+
+
+class AskRequest(BaseModel):
+    question: str
+    # Questions with the same session_id share conversation history
+    session_id: Optional[str] = None
+    namespace: Optional[str] = None
+
+
+class BatchAskRequest(BaseModel):
+    questions: List[str]
+    concurrency: Optional[int] = None
+    namespace: Optional[str] = None
+
+
+def _require_llm():
+    error = llm_config_error()
+    if error:
+        raise HTTPException(status_code=503, detail=error)
+
+
+def _namespace(namespace, existing=False):
+    """Validated namespace name. Only ingestion creates a namespace, so endpoints that read
+    one pass existing=True and get a 404 for a name nothing has been ingested into."""
+    try:
+        return require_namespace(namespace) if existing else normalize_namespace(namespace)
+    except UnknownNamespace as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/namespaces")
+def get_namespaces():
+    return {"namespaces": list_namespaces()}
+
+
+@router.post("/ingest/file", status_code=202)
+def ingest_file(file: UploadFile = File(...), namespace: Optional[str] = Form(None)):
+    namespace = _namespace(namespace)
+    file_path = save_upload(file.file, file.filename, namespace)
+    return {"job_id": submit_file_ingestion(file_path, namespace), "source": file_path, "namespace": namespace}
+
+
+@router.post("/ingest/url", status_code=202)
+def ingest_url(request: UrlRequest):
+    namespace = _namespace(request.namespace)
+    url = request.url.strip()
+    if not url:
+        raise HTTPException(status_code=400, detail="url must not be empty")
+    return {"job_id": submit_url_ingestion(url, namespace), "source": url, "namespace": namespace}
+
+
+@router.post("/ingest/crawl", status_code=202)
+def ingest_crawl(request: CrawlRequest):
+    namespace = _namespace(request.namespace)
+    url = request.url.strip()
+    if not url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="url must be an http(s) URL")
+    if request.max_depth < 0 or request.max_pages < 1:
+        raise HTTPException(status_code=400, detail="max_depth must be >= 0 and max_pages >= 1")
+    job_id = submit_crawl_ingestion(url, namespace, max_depth=request.max_depth, max_pages=request.max_pages)
+    return {"job_id": job_id, "source": url, "namespace": namespace}
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    return {"cancelled": get_job_queue().cancel(job_id)}
+
+
+@router.get("/sources")
+def get_sources(
+    source_type: Optional[str] = None, offset: int = 0, limit: int = SOURCES_PAGE_SIZE, namespace: Optional[str] = None
+):
+    """Registered sources (optionally only "file" or "url"), one page at a time"""
+    sources, total = list_sources(
+        source_type, offset=max(offset, 0), limit=min(max(limit, 1), 1000), namespace=_namespace(namespace)
+    )
+    return {"sources": sources, "total": total, "offset": offset}
+
+
+@router.get("/sources/report")
+def get_chunk_report(source: Optional[str] = None, namespace: Optional[str] = None):
+    """Chunk count and token size distribution per source"""
+    return chunk_report(source, namespace=_namespace(namespace, existing=True))
+
+
+@router.delete("/sources")
+def remove_source(source: str, namespace: Optional[str] = None):
+    result = delete_source(source, _namespace(namespace))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Unknown source: {source}")
+    return {"result": result}
+
+
+@router.get("/index")
+def get_index(namespace: Optional[str] = None):
+    """HNSW settings and chunk count of a namespace's collection"""
+    return index_settings(_namespace(namespace, existing=True))
+
+
+@router.post("/index/rebuild", status_code=202)
+def rebuild_index(request: IndexRebuildRequest):
+    """Rebuild a namespace's index with new HNSW settings in the background and swap it in"""
+    namespace = _namespace(request.namespace, existing=True)
+    try:
+        job_id = submit_index_rebuild(
+            namespace, space=request.space, max_neighbors=request.max_neighbors,
+            ef_construction=request.ef_construction, ef_search=request.ef_search,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job_id, "namespace": namespace}
+
+
+@router.get("/snapshots")
+def get_snapshots():
+    return {"snapshots": list_snapshots()}
+
+
+@router.post("/snapshots/export", status_code=202)
+def export_snapshot(request: SnapshotExportRequest):
+    """Write a snapshot of a namespace in the background; download it from /api/snapshots/{name}"""
+    namespace = _namespace(request.namespace, existing=True)
+    try:
+        job_id, path = submit_snapshot_export(namespace, request.dtype)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job_id, "name": os.path.basename(path), "namespace": namespace}
+
+
+@router.get("/snapshots/{name}")
+def download_snapshot(name: str):
+    path = snapshot_file(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Unknown snapshot: {name}")
+    return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
+
+
+@router.post("/snapshots/import", status_code=202)
+def import_snapshot(
+    file: UploadFile = File(...), namespace: Optional[str] = Form(None), force: bool = Form(False),
+):
+    """Replace a namespace (by default the snapshot's own) with an uploaded snapshot in the background"""
+    namespace = _namespace(namespace) if namespace else None
+    try:
+        path = save_snapshot(file.file, file.filename)
+        job_id = submit_snapshot_import(path, namespace, force=force)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job_id, "name": os.path.basename(path)}
+
+
+@router.post("/ask")
+async def ask(request: AskRequest):
+    _require_llm()
+    namespace = _namespace(request.namespace, existing=True)
+    engine = get_engine()
+    if request.session_id is None:
+        return (await engine.answer_batch([request.question], namespace=namespace))[0]
+
+    # Follow-ups need the session's history and condensing, which run on the sync path
+    info = {}
+    answer = await run_in_threadpool(
+        lambda: "".join(engine.stream_answer(request.question, f"api:{request.session_id}", info, namespace=namespace))
+    )
+    return {"answer": answer, "sources": info.get("sources", []), "cached": info.get("cached", False)}
+
+
+@router.post("/ask/batch")
+async def ask_batch(request: BatchAskRequest):
+    _require_llm()
+    namespace = _namespace(request.namespace, existing=True)
+    if not request.questions or len(request.questions) > API_MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {API_MAX_BATCH} questions")
+    concurrency = min(max(request.concurrency or BATCH_LLM_CONCURRENCY, 1), BATCH_LLM_CONCURRENCY)
+    answers = await get_engine().answer_batch(request.questions, concurrency=concurrency, namespace=namespace)
+    return {"answers": answers}
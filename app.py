@@ -1,181 +1,115 @@
 import os
-import shutil
+import time
+# Imported first so the startup breakdown covers every import below
+from startup import STARTED_AT, get_startup_status, phase, record_phase, start_warmup
 import gradio as gr
-from ingestion import load_and_ingest_file, load_and_ingest_url, clear_database, delete_embeddings_by_source
-from qa_pipeline import answer_question
-
-INGESTED_URLS_FILE = "./ingested_urls.txt"
-UPLOAD_DIR = "./uploads"
-
-
-def handle_file_upload(file):
-    filename = os.path.basename(file.name)
-    file_path = f"./uploads/{filename}"
-    upload_dir = "uploads"
-    os.makedirs("./uploads", exist_ok=True)
-    destination = os.path.join(upload_dir, filename)
-    shutil.copy2(file.name, destination)
-    load_and_ingest_file(file_path)
-    return "File processed and embedded successfully."
-
-
-def handle_url_ingestion(url):
-    load_and_ingest_url(url)
-    save_url(url)
-    return "URL content processed and embedded successfully."
-
-
-def handle_file_upload_with_progress(file):
-    """File upload with progress indicator"""
-    if not file:
-        return "No file selected.", gr.update(visible=False)
-    
-    try:
-        #  Copy file
-        filename = os.path.basename(file.name)
-        file_path = f"./uploads/{filename}"
-        upload_dir = "uploads"
-        os.makedirs("./uploads", exist_ok=True)
-        destination = os.path.join(upload_dir, filename)
-        shutil.copy2(file.name, destination)
-        
-        # Process and embed
-        load_and_ingest_file(file_path)
-        
-        return f"File '{filename}' processed and embedded successfully!", gr.update(visible=True)
-    except Exception as e:
-        return f"Error processing file: {str(e)}", gr.update(visible=True)
-
-
-def handle_url_ingestion_with_progress(url):
-    """URL ingestion with progress indicator"""
-    if not url or not url.strip():
-        return "No URL provided.", gr.update(visible=False)
-    
-    try:
-        # Ingest URL content
-        load_and_ingest_url(url.strip())
-        
-        # Save URL to file
-        save_url(url.strip())
-        
-        return f"URL '{url.strip()}' processed and embedded successfully!", gr.update(visible=True)
-    except Exception as e:
-        return f"Error processing URL: {str(e)}", gr.update(visible=True)
-
-
-def handle_question(question):
-    return answer_question(question)
-
-
-def list_uploaded_files():
-    files = []
-    for filename in os.listdir(UPLOAD_DIR):
-        full_path = os.path.join(UPLOAD_DIR, filename)
-        if os.path.isfile(full_path):
-            files.append(full_path)
-    return files
-
-
-def save_url(url: str):
-    with open(INGESTED_URLS_FILE, "a") as f:
-        f.write(url.strip() + "\n")
-
-
-def get_saved_urls() -> str:
-    if not os.path.exists(INGESTED_URLS_FILE):
-        return "<i>No URLs ingested yet.</i>"
-
-    links_html = ""
-    with open(INGESTED_URLS_FILE, "r") as f:
-        for i, line in enumerate(f):
-            url = line.strip()
-            links_html += f'<div style="margin: 2px 0; padding: 8px; border: 1px solid #ddd; border-radius: 5px; background-color: #f9f9f9;"><a href="{url}" target="_blank">{url}</a></div>'
-    return links_html
-
-
-def get_saved_urls_list():
-    """Get list of ingested URLs for dropdown"""
-    urls = []
-    if os.path.exists(INGESTED_URLS_FILE):
-        with open(INGESTED_URLS_FILE, "r") as f:
-            for line in f:
-                url = line.strip()
-                if url:
-                    urls.append(url)
-    return urls
-
-
-def delete_url_by_url(url_to_delete: str):
-    """Delete URL by its actual URL string and its embeddings"""
-    if not os.path.exists(INGESTED_URLS_FILE):
-        return "No URLs to delete."
-    
-    try:
-        with open(INGESTED_URLS_FILE, "r") as f:
-            urls = f.readlines()
-        
-        # Find and remove the URL
-        found = False
-        for i, url in enumerate(urls):
-            if url.strip() == url_to_delete:
-                urls.pop(i)
-                found = True
-                break
-        
-        if found:
-            with open(INGESTED_URLS_FILE, "w") as f:
-                f.writelines(urls)
-            
-            # Delete embeddings for this URL
-            embeddings_result = delete_embeddings_by_source(url_to_delete)
-            
-            return f"Deleted URL: {url_to_delete}\n{embeddings_result}"
-        else:
-            return f"URL not found: {url_to_delete}"
-    except Exception as e:
-        return f"Error deleting URL: {str(e)}"
-
-
-
-def delete_uploaded_file(filename: str):
-    """Delete an uploaded file and its embeddings"""
-    try:
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        if os.path.exists(file_path):
-            # Delete the file
-            os.remove(file_path)
-            
-            # Delete embeddings for this file
-            embeddings_result = delete_embeddings_by_source(file_path)
-            
-            return f"Deleted file: {filename}\n{embeddings_result}"
-        else:
-            return f"File not found: {filename}"
-    except Exception as e:
-        return f"Error deleting file: {str(e)}"
-
-
-def get_uploaded_files_list():
-    """Get list of uploaded files with delete buttons"""
-    files = []
-    if os.path.exists(UPLOAD_DIR):
-        for filename in os.listdir(UPLOAD_DIR):
-            full_path = os.path.join(UPLOAD_DIR, filename)
-            if os.path.isfile(full_path):
-                files.append(filename)
-    return files
-
-
-with gr.Blocks() as demo:
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from api import router as api_router
+from crawler import CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES
+from ingestion import clear_database
+from jobs import TERMINAL_STATUSES, get_job_queue
+from metrics import render_prometheus
+from namespaces import DEFAULT_NAMESPACE, list_namespaces, namespace_exists
+from qa_pipeline import answer_question_stream, llm_config_error
+from source_registry import get_source_registry
+from sources import (
+    clear_uploads,
+    delete_uploaded_file,
+    delete_url_by_url,
+    get_saved_urls_list,
+    get_uploaded_files_list,
+    page_count,
+    save_upload,
+    submit_crawl_ingestion,
+    submit_file_ingestion,
+    submit_url_ingestion,
+)
+
+record_phase("imports", time.perf_counter() - STARTED_AT)
+
+JOB_POLL_INTERVAL = 0.5
+
+
+def render_job_status(job):
+    """Progress HTML for an ingestion job record"""
+    if job is None:
+        return "<div style='text-align: center; color: #ff6b6b;'>❌ Unknown job</div>"
+
+    elapsed = ""
+    if job["started_at"]:
+        elapsed = f" · {(job['finished_at'] or time.time()) - job['started_at']:.1f}s"
+    counts = f"{job['chunks_processed']} chunks processed, {job['chunks_added']} embedded{elapsed}"
+    if job["kind"] == "crawl":
+        counts = f"{job['pages_done']} pages ingested, {job['pages_skipped']} skipped, {counts}"
+
+    if job["status"] == "queued":
+        return "<div style='text-align: center; color: #666;'>⏳ Queued, waiting for a free worker...</div>"
+    if job["status"] == "running":
+        return f"""
+        <div style='text-align: center; color: #4CAF50;'>
+            <div style='margin-bottom: 10px;'>🔄 Processing... {counts}</div>
+            <div style='display: inline-block; width: 20px; height: 20px; border: 3px solid #f3f3f3; border-top: 3px solid #4CAF50; border-radius: 50%; animation: spin 1s linear infinite;'></div>
+            <style>
+                @keyframes spin {{
+                    0% {{ transform: rotate(0deg); }}
+                    100% {{ transform: rotate(360deg); }}
+                }}
+            </style>
+        </div>
+        """
+    if job["status"] == "done":
+        return f"<div style='text-align: center; color: #4CAF50;'>✅ Done: {counts}, {job['chunks_deleted']} removed</div>"
+    if job["status"] == "cancelled":
+        return f"<div style='text-align: center; color: #ff9800;'>⏹️ Cancelled after {counts}</div>"
+    return f"<div style='text-align: center; color: #ff6b6b;'>❌ Error: {job['error']}</div>"
+
+
+def poll_job(job_id, success_message):
+    """Yield (result, status HTML, job id) updates until the job finishes"""
+    while True:
+        job = get_job_queue().get(job_id)
+        status_html = render_job_status(job)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            break
+        yield gr.update(visible=False), status_html, job_id
+        time.sleep(JOB_POLL_INTERVAL)
+
+    if job is not None and job["status"] == "done":
+        message = success_message
+    elif job is not None and job["status"] == "cancelled":
+        message = "⏹️ Ingestion cancelled."
+    else:
+        message = f"❌ Error: {job['error'] if job else 'unknown job'}"
+    yield gr.update(value=message, visible=True), status_html, None
+
+
+def cancel_job(job_id):
+    if job_id and get_job_queue().cancel(job_id):
+        return "<div style='text-align: center; color: #ff9800;'>⏹️ Cancelling...</div>"
+    return gr.update()
+
+
+with phase("ui"), gr.Blocks() as demo:
     gr.Markdown("# 📘 Developer Docs Assistant")
+    # Ingestion, data management and questions all work on the selected namespace
+    namespace = gr.Dropdown(
+        label="Namespace",
+        info="Pick a namespace or type a new name (lowercase letters, digits, '-' and '_')",
+        choices=list_namespaces(),
+        value=DEFAULT_NAMESPACE,
+        allow_custom_value=True,
+    )
 
     with gr.Tab("Upload Document"):
         with gr.Row():
             with gr.Column(scale=2):
                 file = gr.File(label="Upload Document", file_types=[".pdf", ".txt", ".md", ".markdown"])
                 upload_btn = gr.Button("📤 Ingest File", variant="primary")
+                upload_cancel_btn = gr.Button("⏹️ Cancel")
                 upload_output = gr.Textbox(label="Upload Result", visible=False)
+                upload_job = gr.State(None)
                 
                 # Progress indicator
                 upload_progress = gr.HTML(
@@ -192,56 +126,50 @@ with gr.Blocks() as demo:
                 4. **Check Status**: Monitor the progress indicator
                 """)
 
-        def handle_upload_with_progress(file):
+        def handle_upload_with_progress(file, namespace):
             if not file:
-                return (
-                    "⚠️ Please select a file first.", 
-                    gr.update(visible=True),
-                    gr.update(value="<div style='text-align: center; color: #ff6b6b;'>❌ No file selected</div>")
+                yield (
+                    gr.update(value="⚠️ Please select a file first.", visible=True),
+                    gr.update(value="<div style='text-align: center; color: #ff6b6b;'>❌ No file selected</div>"),
+                    None
                 )
-            
-            # Show processing status
-            progress_html = """
-            <div style='text-align: center; color: #4CAF50;'>
-                <div style='margin-bottom: 10px;'>🔄 Processing file...</div>
-                <div style='display: inline-block; width: 20px; height: 20px; border: 3px solid #f3f3f3; border-top: 3px solid #4CAF50; border-radius: 50%; animation: spin 1s linear infinite;'></div>
-                <style>
-                    @keyframes spin {
-                        0% { transform: rotate(0deg); }
-                        100% { transform: rotate(360deg); }
-                    }
-                </style>
-            </div>
-            """
-            
+                return
+
             try:
-                result = handle_file_upload_with_progress(file)
-                success_html = f"""
-                <div style='text-align: center; color: #4CAF50;'>
-                    ✅ {result[0]}
-                </div>
-                """
-                return result[0], gr.update(visible=True), gr.update(value=success_html)
+                job_id = submit_file_ingestion(save_upload(file.name, file.name, namespace), namespace)
             except Exception as e:
                 error_html = f"""
                 <div style='text-align: center; color: #ff6b6b;'>
                     ❌ Error: {str(e)}
                 </div>
                 """
-                return f"❌ Error: {str(e)}", gr.update(visible=True), gr.update(value=error_html)
+                yield gr.update(value=f"❌ Error: {str(e)}", visible=True), gr.update(value=error_html), None
+                return
 
+            filename = os.path.basename(file.name)
+            yield from poll_job(job_id, f"File '{filename}' processed and embedded successfully!")
+
+        # Polling only waits on the job queue, which bounds the actual ingestion work
         upload_btn.click(
             handle_upload_with_progress,
-            inputs=file,
-            outputs=[upload_output, upload_output, upload_progress]
+            inputs=[file, namespace],
+            outputs=[upload_output, upload_progress, upload_job],
+            concurrency_limit=None
         )
+        upload_cancel_btn.click(cancel_job, inputs=upload_job, outputs=upload_progress)
 
     with gr.Tab("Ingest from URL"):
         with gr.Row():
             with gr.Column(scale=2):
                 url_input = gr.Textbox(label="Document URL", placeholder="https://example.com/document")
+                with gr.Row():
+                    crawl_checkbox = gr.Checkbox(label="Crawl linked pages on the same site", value=False)
+                    crawl_depth = gr.Slider(0, 5, value=CRAWL_MAX_DEPTH, step=1, label="Link depth")
+                    crawl_max_pages = gr.Number(value=CRAWL_MAX_PAGES, precision=0, minimum=1, label="Max pages")
                 url_btn = gr.Button("🌐 Ingest URL", variant="primary")
+                url_cancel_btn = gr.Button("⏹️ Cancel")
                 url_output = gr.Textbox(label="URL Processing Result", visible=False)
+                url_job = gr.State(None)
                 
                 # Progress indicator
                 url_progress = gr.HTML(
@@ -256,55 +184,69 @@ with gr.Blocks() as demo:
                 2. **Click Ingest**: Content will be fetched and processed
                 3. **Wait**: Processing may take a few moments
                 4. **Check Status**: Monitor the progress indicator
+
+                Tick **Crawl** to also ingest pages linked from it on the same site, or enter a
+                sitemap.xml URL to ingest the pages it lists. robots.txt is respected and
+                duplicate pages are skipped.
                 """)
 
-        def handle_url_ingestion_with_progress_ui(url):
+        def handle_url_ingestion_with_progress_ui(url, crawl, depth, max_pages, namespace):
             if not url or not url.strip():
-                return (
-                    "⚠️ Please enter a valid URL.", 
-                    gr.update(visible=True),
-                    gr.update(value="<div style='text-align: center; color: #ff6b6b;'>❌ No URL provided</div>")
+                yield (
+                    gr.update(value="⚠️ Please enter a valid URL.", visible=True),
+                    gr.update(value="<div style='text-align: center; color: #ff6b6b;'>❌ No URL provided</div>"),
+                    None
                 )
-            
-            # Show processing status
-            progress_html = """
-            <div style='text-align: center; color: #4CAF50;'>
-                <div style='margin-bottom: 10px;'>🔄 Fetching and processing URL...</div>
-                <div style='display: inline-block; width: 20px; height: 20px; border: 3px solid #f3f3f3; border-top: 3px solid #4CAF50; border-radius: 50%; animation: spin 1s linear infinite;'></div>
-                <style>
-                    @keyframes spin {
-                        0% { transform: rotate(0deg); }
-                        100% { transform: rotate(360deg); }
-                    }
-                </style>
-            </div>
-            """
-            
+                return
+
             try:
-                result = handle_url_ingestion_with_progress(url.strip())
-                success_html = f"""
-                <div style='text-align: center; color: #4CAF50;'>
-                    ✅ {result[0]}
-                </div>
-                """
-                return result[0], gr.update(visible=True), gr.update(value=success_html)
+                if crawl:
+                    job_id = submit_crawl_ingestion(
+                        url.strip(), namespace, max_depth=int(depth), max_pages=max(1, int(max_pages or 1))
+                    )
+                else:
+                    job_id = submit_url_ingestion(url.strip(), namespace)
             except Exception as e:
                 error_html = f"""
                 <div style='text-align: center; color: #ff6b6b;'>
                     ❌ Error: {str(e)}
                 </div>
                 """
-                return f"❌ Error: {str(e)}", gr.update(visible=True), gr.update(value=error_html)
+                yield gr.update(value=f"❌ Error: {str(e)}", visible=True), gr.update(value=error_html), None
+                return
+
+            message = f"Crawl of '{url.strip()}' finished!" if crawl else f"URL '{url.strip()}' processed and embedded successfully!"
+            yield from poll_job(job_id, message)
 
         url_btn.click(
             handle_url_ingestion_with_progress_ui,
-            inputs=url_input,
-            outputs=[url_output, url_output, url_progress]
+            inputs=[url_input, crawl_checkbox, crawl_depth, crawl_max_pages, namespace],
+            outputs=[url_output, url_progress, url_job],
+            concurrency_limit=None
         )
+        url_cancel_btn.click(cancel_job, inputs=url_job, outputs=url_progress)
 
     with gr.Tab("Manage Data"):
         gr.Markdown("# 🗂️ Data Management")
         
+        def refresh_files(page=1, namespace=DEFAULT_NAMESPACE):
+            """Dropdown and page selector updates for one page of uploaded files"""
+            pages = page_count("file", namespace)
+            page = min(max(int(page or 1), 1), pages)
+            return (
+                gr.update(choices=get_uploaded_files_list(page, namespace), value=None),
+                gr.update(value=page, maximum=pages, label=f"Page (of {pages})"),
+            )
+
+        def refresh_urls(page=1, namespace=DEFAULT_NAMESPACE):
+            """Dropdown and page selector updates for one page of ingested URLs"""
+            pages = page_count("url", namespace)
+            page = min(max(int(page or 1), 1), pages)
+            return (
+                gr.update(choices=get_saved_urls_list(page, namespace), value=None),
+                gr.update(value=page, maximum=pages, label=f"Page (of {pages})"),
+            )
+
         with gr.Row():
             with gr.Column(scale=1):
                 gr.Markdown("### 📁 Uploaded Files")
@@ -313,105 +255,88 @@ with gr.Blocks() as demo:
                     choices=get_uploaded_files_list(),
                     interactive=True
                 )
+                file_page = gr.Number(label=f"Page (of {page_count('file')})", value=1, minimum=1, precision=0)
                 delete_file_btn = gr.Button("🗑️ Delete Selected File", variant="stop")
                 file_delete_output = gr.Textbox(label="File Delete Result", visible=False)
                 
-                def delete_selected_file(filename):
+                def delete_selected_file(filename, page, namespace):
                     if filename:
-                        result = delete_uploaded_file(filename)
+                        result = delete_uploaded_file(filename, namespace)
                         # Refresh the dropdown
-                        new_choices = get_uploaded_files_list()
-                        return gr.update(value=result, visible=True), gr.update(choices=new_choices)
-                    return gr.update(value="No file selected", visible=True), gr.update()
+                        return (gr.update(value=result, visible=True), *refresh_files(page, namespace))
+                    return gr.update(value="No file selected", visible=True), gr.update(), gr.update()
                 
                 delete_file_btn.click(
                     delete_selected_file,
-                    inputs=file_dropdown,
-                    outputs=[file_delete_output, file_dropdown]
+                    inputs=[file_dropdown, file_page, namespace],
+                    outputs=[file_delete_output, file_dropdown, file_page]
                 )
+                file_page.input(refresh_files, inputs=[file_page, namespace], outputs=[file_dropdown, file_page])
                 
                 refresh_files_btn = gr.Button("🔄 Refresh File List")
-                refresh_files_btn.click(
-                    lambda: gr.update(choices=get_uploaded_files_list()),
-                    outputs=file_dropdown
-                )
+                refresh_files_btn.click(refresh_files, inputs=[file_page, namespace], outputs=[file_dropdown, file_page])
             
             with gr.Column(scale=1):
                 gr.Markdown("### 🌐 Ingested URLs")
-                # url_links_display = gr.HTML(value=get_saved_urls())
                 url_dropdown = gr.Dropdown(
                     label="Select URL to Delete",
                     choices=get_saved_urls_list(),
                     interactive=True
                 )
+                url_page = gr.Number(label=f"Page (of {page_count('url')})", value=1, minimum=1, precision=0)
                 delete_url_btn = gr.Button("🗑️ Delete Selected URL", variant="stop")
                 url_delete_output = gr.Textbox(label="URL Delete Result", visible=False)
                 
-                def delete_selected_url(url):
+                def delete_selected_url(url, page, namespace):
                     if url:
-                        result = delete_url_by_url(url)
-                        # Refresh the dropdown and display
-                        new_choices = get_saved_urls_list()
-                        new_display = get_saved_urls()
-                        return gr.update(value=result, visible=True), gr.update(choices=new_choices), gr.update(value=new_display)
+                        result = delete_url_by_url(url, namespace)
+                        # Refresh the dropdown
+                        return (gr.update(value=result, visible=True), *refresh_urls(page, namespace))
                     return gr.update(value="No URL selected", visible=True), gr.update(), gr.update()
                 
                 delete_url_btn.click(
                     delete_selected_url,
-                    inputs=url_dropdown,
-                    outputs=[url_delete_output, url_dropdown]
+                    inputs=[url_dropdown, url_page, namespace],
+                    outputs=[url_delete_output, url_dropdown, url_page]
                 )
+                url_page.input(refresh_urls, inputs=[url_page, namespace], outputs=[url_dropdown, url_page])
                 
                 refresh_urls_btn = gr.Button("🔄 Refresh URL List")
-                refresh_urls_btn.click(
-                    lambda: (gr.update(choices=get_saved_urls_list()), gr.update(value=get_saved_urls())),
-                    outputs=[url_dropdown]
-                )
+                refresh_urls_btn.click(refresh_urls, inputs=[url_page, namespace], outputs=[url_dropdown, url_page])
         
         gr.Markdown("---")
         gr.Markdown("### ⚠️ Nuclear Option - Clear All Data")
-        gr.Markdown("**Warning**: This will delete ALL uploaded files, ingested URLs, and clear the entire vector database. This action cannot be undone.")
+        gr.Markdown("**Warning**: This will delete ALL uploaded files and ingested URLs of the selected namespace and clear its vector database. This action cannot be undone.")
         
         with gr.Row():
             clear_all_btn = gr.Button("💥 Clear All Data", variant="stop", size="lg")
             clear_output = gr.Textbox(label="Clear All Result", visible=False)
         
-        def clear_all_data():
-            # Clear database
-            db_result = clear_database()
+        def clear_all_data(namespace):
+            if not namespace_exists(namespace):
+                return f"Namespace {namespace} has no data to clear.\n"
+            url_count = get_source_registry(namespace).count("url")
+
+            # Clear database, lexical index and source registry
+            db_result = clear_database(namespace)
             
             # Clear uploaded files
-            file_result = ""
-            if os.path.exists(UPLOAD_DIR):
-                for filename in os.listdir(UPLOAD_DIR):
-                    file_path = os.path.join(UPLOAD_DIR, filename)
-                    if os.path.isfile(file_path):
-                        try:
-                            os.remove(file_path)
-                            file_result += f"Deleted file: {filename}\n"
-                        except Exception as e:
-                            file_result += f"Error deleting {filename}: {str(e)}\n"
-            
-            # Clear ingested URLs
-            url_result = ""
-            if os.path.exists(INGESTED_URLS_FILE):
-                try:
-                    os.remove(INGESTED_URLS_FILE)
-                    url_result = "Deleted ingested URLs file\n"
-                except Exception as e:
-                    url_result = f"Error deleting URLs file: {str(e)}\n"
+            file_result = clear_uploads(namespace)
             
-            return f"Database: {db_result}\nFiles: {file_result}URLs: {url_result}"
+            return f"Database: {db_result}\nFiles: {file_result}URLs: removed {url_count} ingested URLs\n"
         
         clear_all_btn.click(
             clear_all_data,
+            inputs=namespace,
             outputs=clear_output
         )
         
-        # Load initial data
-        demo.load(fn=lambda: gr.update(choices=get_uploaded_files_list()), outputs=file_dropdown)
-        demo.load(fn=lambda: gr.update(choices=get_saved_urls_list()), outputs=url_dropdown)
-        # demo.load(fn=get_saved_urls, outputs=url_links_display)
+        # Load initial data, and reload it for another namespace
+        demo.load(fn=refresh_files, outputs=[file_dropdown, file_page])
+        demo.load(fn=refresh_urls, outputs=[url_dropdown, url_page])
+        demo.load(fn=lambda: gr.update(choices=list_namespaces()), outputs=namespace)
+        namespace.change(lambda namespace: refresh_files(1, namespace), inputs=namespace, outputs=[file_dropdown, file_page])
+        namespace.change(lambda namespace: refresh_urls(1, namespace), inputs=namespace, outputs=[url_dropdown, url_page])
 
     with gr.Tab("Ask a Question"):
         with gr.Row():
@@ -421,10 +346,49 @@ with gr.Blocks() as demo:
                 answer_output = gr.Markdown(label="Answer", value="Answer will appear here...")
             
         
-        def handle_question_with_sources(question):
-            return answer_question(question)
+        def handle_question_with_sources(question, namespace, request: gr.Request):
+            error = llm_config_error()
+            if error:
+                yield f"❌ Error: {error}"
+                return
+            if not namespace_exists(namespace):
+                yield f"❌ Error: Nothing has been ingested into namespace {namespace} yet."
+                return
+            # Each browser session keeps its own conversation history
+            yield from answer_question_stream(question, session_id=request.session_hash, namespace=namespace)
         
-        ask_btn.click(handle_question_with_sources, inputs=question_input, outputs=answer_output)
+        ask_btn.click(handle_question_with_sources, inputs=[question_input, namespace], outputs=answer_output)
+
+
+def create_app():
+    """FastAPI app serving the Gradio UI at /, the JSON API under /api, Prometheus metrics
+    at /metrics and liveness/readiness probes at /healthz and /ready.
+
+    Models are loaded in the background, so the UI is up before the app can answer;
+    /ready returns 503 with the startup breakdown until warm-up has finished."""
+    app = FastAPI()
+    app.include_router(api_router)
+
+    @app.get("/metrics")
+    def prometheus_metrics():
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    def ready():
+        status = get_startup_status()
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+    start_warmup()
+    return gr.mount_gradio_app(app, demo, path="/")
 
 
-demo.launch()
+if __name__ == "__main__":
+    uvicorn.run(
+        create_app(),
+        host=os.getenv("GRADIO_SERVER_NAME", "127.0.0.1"),
+        port=int(os.getenv("GRADIO_SERVER_PORT", "7860")),
+    )
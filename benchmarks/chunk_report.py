@@ -0,0 +1,115 @@
+"""Report chunk counts and token sizes per source, for tuning chunking and index footprint.
+
+Without arguments the report covers what is already in ./chroma_db (run this from the app
+directory). Given files, they are chunked without embedding anything, once per --chunk-tokens
+value, so settings can be compared before re-ingesting; --legacy adds the old fixed
+500-character splitter for reference.
+"""
+import argparse
+import json
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_documents(path):
+    """Documents of one file or URL, loaded the way ingestion loads them, plus the text format"""
+    if path.startswith(("http://", "https://")):
+        import requests
+        from bs4 import BeautifulSoup
+        from langchain_core.documents import Document
+        from chunking import html_to_markdown
+
+        response = requests.get(path, timeout=30)
+        response.raise_for_status()
+        return [Document(page_content=html_to_markdown(BeautifulSoup(response.text, "html.parser")))], "markdown"
+
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        return PyPDFLoader(path).load(), "pdf"
+    if ext in (".html", ".htm"):
+        from bs4 import BeautifulSoup
+        from langchain_core.documents import Document
+        from chunking import html_to_markdown
+
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return [Document(page_content=html_to_markdown(BeautifulSoup(f.read(), "html.parser")))], "markdown"
+    return TextLoader(path).load(), "markdown" if ext in (".md", ".markdown") else "text"
+
+
+def dry_run(paths, chunk_tokens_options, overlap_tokens, min_tokens, legacy):
+    from chunking import StructuredSplitter, chunk_stats
+    from context_builder import count_tokens
+
+    documents = {path: load_documents(path) for path in paths}
+    configs = {f"tokens={size}": size for size in chunk_tokens_options}
+    if legacy:
+        configs["legacy 500 chars"] = None
+
+    report = {}
+    for name, size in configs.items():
+        sources = {}
+        for path, (docs, text_format) in documents.items():
+            if size is None:
+                from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+                chunks = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50).split_documents(docs)
+            else:
+                splitter = StructuredSplitter(text_format, chunk_tokens=size, overlap_tokens=overlap_tokens,
+                                              min_tokens=min_tokens)
+                chunks = list(splitter.split_documents(docs))
+            sources[path] = [count_tokens(chunk.page_content) for chunk in chunks]
+        report[name] = {
+            "sources": {path: chunk_stats(tokens, min_tokens) for path, tokens in sources.items()},
+            "total": chunk_stats([tokens for counts in sources.values() for tokens in counts], min_tokens),
+        }
+    return report
+
+
+def print_table(title, report):
+    print(title)
+    print(f"  {'source':58s} {'chunks':>7s} {'tokens':>8s} {'min':>5s} {'p50':>5s} {'p95':>5s} {'max':>5s} {'small':>6s}")
+    for path, stats in list(report["sources"].items()) + [("TOTAL", report["total"])]:
+        if not stats["chunks"]:
+            print(f"  {path[-58:]:58s} {0:7d}")
+            continue
+        print(
+            f"  {path[-58:]:58s} {stats['chunks']:7d} {stats['tokens']:8d} {stats['min']:5d} {stats['p50']:5d} "
+            f"{stats['p95']:5d} {stats['max']:5d} {stats['small']:6d}"
+        )
+
+
+def main():
+    sys.path.insert(0, REPO_DIR)
+    from chunking import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, MIN_CHUNK_TOKENS
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="files or URLs to chunk without ingesting")
+    parser.add_argument("--chunk-tokens", default=str(CHUNK_TOKENS), help="comma-separated chunk sizes to compare")
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--min-tokens", type=int, default=MIN_CHUNK_TOKENS)
+    parser.add_argument("--legacy", action="store_true", help="also chunk with the old 500-character splitter")
+    parser.add_argument("--source", help="report only this source from the collection")
+    parser.add_argument("--output", help="write the report as JSON here")
+    args = parser.parse_args()
+
+    if args.paths:
+        sizes = [int(size) for size in args.chunk_tokens.split(",")]
+        report = dry_run(args.paths, sizes, args.overlap_tokens, args.min_tokens, args.legacy)
+        for name, config_report in report.items():
+            print_table(name, config_report)
+    else:
+        from sources import chunk_report
+
+        report = chunk_report(args.source)
+        print_table("chroma_db", report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
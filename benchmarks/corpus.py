@@ -0,0 +1,126 @@
+import json
+import os
+import random
+
+TOPICS = ["auth", "billing", "storage", "queues", "search", "webhooks", "users", "projects", "logs", "exports"]
+VERBS = ["create", "list", "update", "delete", "retry", "cancel", "fetch", "sync", "archive", "restore"]
+FILLER = (
+    "The endpoint is idempotent when an Idempotency-Key header is supplied. Requests are "
+    "authenticated with a bearer token and responses are paginated with an opaque cursor. "
+    "Clients should back off exponentially on 429 responses and respect the Retry-After header. "
+)
+
+
+def _doc_facts(rng, index):
+    """The API names, error codes and flags documented in one synthetic page"""
+    topic = TOPICS[index % len(TOPICS)]
+    facts = []
+    for j in range(4):
+        verb = rng.choice(VERBS)
+        facts.append({
+            "function": f"{topic}_{verb}_{index}_{j}",
+            "error": f"ERR_{topic.upper()}_{index:04d}{j}",
+            "flag": f"--{topic}-{verb}-limit-{index}{j}",
+            "limit": rng.randint(5, 5000),
+        })
+    return topic, facts
+
+
+def _sections(rng, topic, facts):
+    sections = []
+    for fact in facts:
+        body = (
+            f"Call `{fact['function']}()` to {fact['function'].split('_')[1]} {topic} resources. "
+            f"It fails with {fact['error']} when more than {fact['limit']} items are sent in one request. "
+            f"Raise the limit with the {fact['flag']} flag. " + FILLER * rng.randint(1, 3)
+        )
+        code = f"client.{fact['function']}(batch_size={fact['limit']})"
+        sections.append((fact["function"], body, code))
+    return sections
+
+
+def write_markdown(path, topic, sections):
+    with open(path, "w") as f:
+        f.write(f"# {topic.title()} API\n\n")
+        for title, body, code in sections:
+            f.write(f"## {title}\n\n{body}\n\n```python\n{code}\n```\n\n")
+
+
+def write_html(path, topic, sections):
+    with open(path, "w") as f:
+        f.write(f"<html lang='en'><head><title>{topic.title()} API</title></head><body>\n")
+        f.write(f"<h1>{topic.title()} API</h1>\n")
+        for title, body, code in sections:
+            f.write(f"<h2>{title}</h2>\n<p>{body}</p>\n<pre><code>{code}</code></pre>\n")
+        f.write("</body></html>\n")
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, topic, sections, lines_per_page=40, width=90):
+    """Write a minimal multi-page PDF with one Helvetica text line per row"""
+    lines = [f"{topic.title()} API"]
+    for title, body, code in sections:
+        lines.append(title)
+        words = body.split()
+        line = ""
+        for word in words:
+            if len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        lines.extend([line, code, ""])
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in pages:
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL\n" + "".join(f"({_pdf_escape(line)}) '\n" for line in page) + "ET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{id} 0 R' for id in page_ids)}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(directory, num_docs, seed=0):
+    """Write num_docs pages (cycling Markdown, HTML, PDF) plus questions.jsonl into directory.
+
+    Returns (list of file paths, list of {"question", "source", "answer"} dicts)."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    questions = []
+    for index in range(num_docs):
+        topic, facts = _doc_facts(rng, index)
+        sections = _sections(rng, topic, facts)
+        kind = ("md", "html", "pdf")[index % 3]
+        path = os.path.join(directory, f"{topic}_{index:05d}.{kind}")
+        {"md": write_markdown, "html": write_html, "pdf": write_pdf}[kind](path, topic, sections)
+        paths.append(path)
+        fact = rng.choice(facts)
+        questions.append({"question": f"What does {fact['error']} mean?", "source": path, "answer": str(fact["limit"])})
+        questions.append({"question": f"Which flag raises the limit of {fact['function']}?", "source": path, "answer": fact["flag"]})
+
+    with open(os.path.join(directory, "questions.jsonl"), "w") as f:
+        for question in questions:
+            f.write(json.dumps(question) + "\n")
+    return paths, questions
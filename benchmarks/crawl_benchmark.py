@@ -0,0 +1,155 @@
+"""Crawl a generated docs site served from a local HTTP server and check the crawler's behaviour.
+
+The site has an index page linking to every doc page, a "print view" copy of each page under
+another URL, a /private/ section disallowed by robots.txt and a sitemap.xml. The crawl runs in a
+temporary directory, so the app's ./chroma_db is untouched, once from the index page and once
+from the sitemap; both must ingest every doc page once, skip every copy and never request
+/private/. Hugging Face downloads are disabled, so the embedding model must already be in the
+local cache; use --fake-embeddings to measure the crawler without it.
+"""
+import argparse
+import functools
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+
+def generate_site(directory, num_pages, seed=0):
+    """Write the site into directory and return the paths of its doc pages"""
+    sys.path.insert(0, BENCHMARK_DIR)
+    from corpus import _doc_facts, _sections
+
+    rng = random.Random(seed)
+    for subdirectory in ("docs", "print", "private"):
+        os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+    pages = []
+    for index in range(num_pages):
+        topic, facts = _doc_facts(rng, index)
+        name = f"{topic}_{index:05d}.html"
+        body = "".join(
+            f"<h2>{title}</h2>\n<p>{text}</p>\n<pre><code>{code}</code></pre>\n"
+            for title, text, code in _sections(rng, topic, facts)
+        )
+        # Same text under two URLs; only the navigation markup differs
+        page = (
+            f"<html><head><title>{topic.title()} API</title></head><body>\n"
+            f"<nav><a href='../index.html'>Home</a> <a href='../print/{name}'>Print</a> "
+            f"<a href='../private/notes.html#top'>Notes</a> <a href='../logo.png'>Logo</a></nav>\n"
+            f"<h1>{topic.title()} API</h1>\n{body}</body></html>\n"
+        )
+        with open(os.path.join(directory, "docs", name), "w") as f:
+            f.write(page)
+        with open(os.path.join(directory, "print", name), "w") as f:
+            f.write(page.replace("<nav>", "<nav class='print'>"))
+        pages.append(f"/docs/{name}")
+
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        links = "\n".join(f"<li><a href='{page}'>{page}</a></li>" for page in pages)
+        f.write(f"<html><head><title>Docs</title></head><body><h1>Docs</h1><ul>{links}</ul></body></html>\n")
+    with open(os.path.join(directory, "private", "notes.html"), "w") as f:
+        f.write("<html><body><h1>Private notes</h1><p>Must never be crawled.</p></body></html>\n")
+    with open(os.path.join(directory, "robots.txt"), "w") as f:
+        f.write("User-agent: *\nDisallow: /private/\n")
+    with open(os.path.join(directory, "sitemap.xml"), "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        f.write("".join(f"<url><loc>{{base}}{page}</loc></url>\n" for page in pages))
+        f.write("</urlset>\n")
+    return pages
+
+
+def serve_site(directory, latency):
+    """Serve directory on a local port, delaying each response by latency seconds.
+
+    Returns (base URL, list of requested paths)."""
+    requested = []
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requested.append(self.path)
+            time.sleep(latency)
+            super().do_GET()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    # The sitemap lists absolute URLs, which are only known once the port is
+    sitemap = os.path.join(directory, "sitemap.xml")
+    with open(sitemap) as f:
+        text = f.read()
+    with open(sitemap, "w") as f:
+        f.write(text.replace("{base}", base_url))
+    return base_url, requested
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50, help="Doc pages on the generated site")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate-limit", type=float, default=0, help="Requests per second per host, 0 for none")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Server delay per response")
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="devdocs-crawl-")
+    try:
+        pages = generate_site(os.path.join(workdir, "site"), args.pages)
+        base_url, requested = serve_site(os.path.join(workdir, "site"), args.latency_ms / 1000)
+        os.makedirs(os.path.join(workdir, "app"))
+        os.chdir(os.path.join(workdir, "app"))
+        os.environ.update({
+            "HF_HUB_OFFLINE": "1",
+            "TRANSFORMERS_OFFLINE": "1",
+            "CRAWL_CONCURRENCY": str(args.concurrency),
+            "CRAWL_RATE_LIMIT": str(args.rate_limit),
+        })
+        sys.path.insert(0, REPO_DIR)
+        if args.fake_embeddings:
+            import langchain_huggingface
+            from langchain_core.embeddings import DeterministicFakeEmbedding
+
+            # vectorstore imports the class when the model is first loaded
+            langchain_huggingface.HuggingFaceEmbeddings = lambda **kwargs: DeterministicFakeEmbedding(size=768)
+
+        from crawler import crawl_and_ingest
+        from source_registry import get_source_registry
+
+        failures = []
+        # A second namespace per run so the sitemap crawl cannot reuse the first crawl's chunks
+        for namespace, root in (("from-index", "/index.html"), ("from-sitemap", "/sitemap.xml")):
+            requested.clear()
+            stats = crawl_and_ingest(base_url + root, namespace, max_depth=2, max_pages=args.pages * 3)
+            ingested = {record["source_path"] for record in get_source_registry(namespace).list("url", limit=10 * args.pages)}
+            # Doc pages link back to the index, so both crawls reach it
+            expected = {base_url + page for page in pages + ["/index.html"]}
+            print(
+                f"{root}: {stats['pages_done']} pages ingested, {stats['pages_skipped']} skipped {stats['skipped']}, "
+                f"{len(requested)} requests in {stats['seconds']:.2f}s "
+                f"({stats['pages_fetched'] / stats['seconds']:.1f} pages/s, {stats['chunks_added']} chunks)"
+            )
+            if ingested != expected:
+                failures.append(f"{root}: ingested {len(ingested)} sources, expected {len(expected)}")
+            if any(path.startswith("/private/") for path in requested):
+                failures.append(f"{root}: requested a path disallowed by robots.txt")
+            if any(path.endswith(".png") for path in requested):
+                failures.append(f"{root}: requested a non-page asset")
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1 if failures else 0)
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Compare embedding backends and models against the fp32 reference on the ingested corpus.
+
+Chunks are sampled from ./chroma_db (run this from the app directory), embedded with the
+reference model and with every candidate, and the same queries are answered by exact cosine
+search over each set of vectors. Recall@k is the share of the reference's top k that a candidate
+also returns, so 1.0 means the candidate retrieves exactly what the fp32 model does.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_chunks(max_chunks, seed):
+    """Random sample of chunk texts from the collection, without loading the embedding model"""
+    import chromadb
+    from vectorstore import CHROMA_DB_DIR, COLLECTION_NAME
+
+    collection = chromadb.PersistentClient(path=CHROMA_DB_DIR).get_collection(COLLECTION_NAME)
+    ids = collection.get(include=[])["ids"]
+    ids = random.Random(seed).sample(ids, min(max_chunks, len(ids)))
+    texts = []
+    for i in range(0, len(ids), 1000):
+        texts.extend(collection.get(ids=ids[i:i + 1000], include=["documents"])["documents"])
+    return texts
+
+
+def load_queries(path, chunks, count, seed):
+    """Questions from a JSONL file, or the opening words of random chunks as stand-in queries"""
+    if path:
+        with open(path) as f:
+            return [json.loads(line)["question"] for line in f if line.strip()][:count]
+    rng = random.Random(seed + 1)
+    return [" ".join(text.split()[:12]) for text in rng.sample(chunks, min(count, len(chunks)))]
+
+
+def _normalize(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def evaluate(model, backend, chunks, queries, k):
+    """Embed chunks and queries with one configuration; return its top-k ids per query and timings"""
+    from vectorstore import build_embeddings
+
+    started = time.perf_counter()
+    embeddings = build_embeddings(model, backend)
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    documents = _normalize(embeddings.embed_documents(chunks))
+    encode_seconds = time.perf_counter() - started
+
+    query_ms = []
+    vectors = []
+    for query in queries:
+        started = time.perf_counter()
+        vectors.append(embeddings.embed_query(query))
+        query_ms.append((time.perf_counter() - started) * 1000)
+
+    scores = _normalize(vectors) @ documents.T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return top, {
+        "model": model,
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "chunks_per_second": len(chunks) / encode_seconds if encode_seconds else 0.0,
+        "query_p50_ms": float(np.percentile(query_ms, 50)),
+    }
+
+
+def main():
+    sys.path.insert(0, REPO_DIR)
+    from vectorstore import model_name
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reference", default=f"{model_name}@torch", help="model@backend to compare against")
+    parser.add_argument(
+        "--candidates",
+        default="onnx,onnx-int8,sentence-transformers/all-MiniLM-L6-v2@torch",
+        help="comma-separated backends or model@backend pairs (model defaults to the reference model)",
+    )
+    parser.add_argument("--max-chunks", type=int, default=2000, help="chunks sampled from the collection")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--questions", help="JSONL file with a question field, e.g. benchmarks questions.jsonl")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.max_chunks, args.seed)
+    if not chunks:
+        sys.exit("The collection is empty; ingest some documents first.")
+    queries = load_queries(args.questions, chunks, args.queries, args.seed)
+    k = min(args.k, len(chunks))
+    print(f"Comparing on {len(chunks)} chunks and {len(queries)} queries, recall@{k}", file=sys.stderr)
+
+    reference_model, reference_backend = args.reference.rsplit("@", 1)
+    reference_top, reference = evaluate(reference_model, reference_backend, chunks, queries, k)
+    results = [dict(reference, recall=1.0, top1_agreement=1.0)]
+    for spec in args.candidates.split(","):
+        model, backend = spec.rsplit("@", 1) if "@" in spec else (reference_model, spec)
+        top, result = evaluate(model, backend, chunks, queries, k)
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(top, reference_top)]
+        result["recall"] = float(np.mean(overlap))
+        result["top1_agreement"] = float(np.mean(top[:, 0] == reference_top[:, 0]))
+        results.append(result)
+
+    print(f"{'model@backend':60s} {'recall':>7s} {'top1':>6s} {'chunks/s':>9s} {'query p50':>10s} {'speedup':>8s}")
+    for result in results:
+        speedup = result["chunks_per_second"] / reference["chunks_per_second"] if reference["chunks_per_second"] else 0.0
+        print(
+            f"{result['model'] + '@' + result['backend']:60s} {result['recall']:7.3f} {result['top1_agreement']:6.3f} "
+            f"{result['chunks_per_second']:9.1f} {result['query_p50_ms']:8.1f}ms {speedup:7.2f}x"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Sweep HNSW ef_search and k against a labelled question set, reporting recall@k vs latency.
+
+The vectors of a namespace's collection in ./chroma_db (run this from the app directory) are
+copied into a scratch Chroma directory, once per --max-neighbors/--ef-construction combination,
+so the app's index is only read. For every ef_search and k the labelled questions are run
+against the dense HNSW search alone:
+
+  recall@k      share of questions with a chunk of their labelled source in the top k
+  ann_recall@k  share of the exact (brute-force) top k that HNSW also returned
+  p50/p95 ms    latency of one query
+
+Questions are JSONL lines {"question": ..., "source": source_path}, e.g. the questions.jsonl
+written by benchmarks/corpus.py. Apply a chosen setting with POST /api/index/rebuild.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+
+def _ints(text):
+    return [int(value) for value in text.split(",")]
+
+
+def load_collection(namespace, batch_size=5000):
+    """(ids, normalized vectors, source paths, HNSW settings) of a namespace's collection"""
+    from hnsw_index import index_settings
+    from vectorstore import get_vectordb
+
+    collection = get_vectordb(namespace)._collection
+    ids, vectors, sources = [], [], []
+    while True:
+        result = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=len(ids))
+        if not result["ids"]:
+            break
+        ids.extend(result["ids"])
+        vectors.append(np.asarray(result["embeddings"], dtype=np.float32))
+        sources.extend((metadata or {}).get("source_path", "") for metadata in result["metadatas"])
+    if not ids:
+        sys.exit(f"Collection of namespace {namespace!r} is empty")
+    matrix = np.concatenate(vectors)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return ids, matrix, sources, index_settings(namespace)["hnsw"]
+
+
+def exact_neighbours(vectors, queries, k):
+    """Row indices of the exact top k for each query; on unit vectors cosine, inner product and
+    L2 all rank alike"""
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def sweep(ids, vectors, sources, questions, query_vectors, settings, ef_values, k_values, batch_size=5000):
+    """Result rows for one build configuration"""
+    import chromadb
+    from chromadb.api.client import SharedSystemClient
+    from vectorstore import hnsw_configuration
+
+    exact = exact_neighbours(vectors, query_vectors, max(k_values))
+    position = {id: i for i, id in enumerate(ids)}
+    scratch = tempfile.mkdtemp(prefix="devdocs-hnsw-")
+    rows = []
+    try:
+        client = chromadb.PersistentClient(path=scratch)
+        collection = client.create_collection("sweep", configuration=hnsw_configuration(**settings))
+        started = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            collection.add(ids=ids[i:i + batch_size], embeddings=vectors[i:i + batch_size])
+        build_seconds = time.perf_counter() - started
+
+        for ef_search in ef_values:
+            # Chroma keeps a loaded index's ef_search, so reopen the index after changing it
+            client.get_collection("sweep").modify(configuration={"hnsw": {"ef_search": ef_search}})
+            SharedSystemClient.clear_system_cache()
+            client = chromadb.PersistentClient(path=scratch)
+            collection = client.get_collection("sweep")
+            collection.query(query_embeddings=query_vectors[:1], n_results=1, include=[])  # load the index
+            for k in k_values:
+                latencies = []
+                hits = 0
+                overlap = 0
+                for question, vector, truth in zip(questions, query_vectors, exact):
+                    started = time.perf_counter()
+                    result = collection.query(query_embeddings=[vector], n_results=k, include=[])
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    found = result["ids"][0]
+                    hits += any(sources[position[id]] == question["source"] for id in found)
+                    overlap += len({position[id] for id in found} & set(truth[:k].tolist()))
+                rows.append({
+                    **settings,
+                    "ef_search": ef_search,
+                    "k": k,
+                    "recall": hits / len(questions),
+                    "ann_recall": overlap / (len(questions) * min(k, len(ids))),
+                    "p50_ms": percentile(latencies, 50),
+                    "p95_ms": percentile(latencies, 95),
+                    "build_seconds": build_seconds,
+                })
+    finally:
+        SharedSystemClient.clear_system_cache()
+        shutil.rmtree(scratch, ignore_errors=True)
+    return rows
+
+
+def print_table(rows):
+    print(f"  {'M':>4s} {'ef_c':>5s} {'ef_s':>5s} {'k':>3s} {'recall':>7s} {'ann':>6s} {'p50 ms':>7s} {'p95 ms':>7s}")
+    for row in rows:
+        print(
+            f"  {row['max_neighbors']:4d} {row['ef_construction']:5d} {row['ef_search']:5d} {row['k']:3d} "
+            f"{row['recall']:7.3f} {row['ann_recall']:6.3f} {row['p50_ms']:7.2f} {row['p95_ms']:7.2f}"
+        )
+
+
+def main():
+    sys.path.insert(0, REPO_DIR)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", required=True, help="labelled questions (JSONL)")
+    parser.add_argument("--namespace", default=None)
+    parser.add_argument("--ef-search", default="10,20,40,80,160", help="comma-separated ef_search values")
+    parser.add_argument("--k", default="1,3,5,10", help="comma-separated k values")
+    parser.add_argument("--max-neighbors", help="comma-separated M values (default: the collection's)")
+    parser.add_argument("--ef-construction", help="comma-separated values (default: the collection's)")
+    parser.add_argument("--space", help="cosine, l2 or ip (default: the collection's)")
+    parser.add_argument("--limit", type=int, default=200, help="questions used from the file")
+    parser.add_argument("--output", help="write the rows as JSON here")
+    args = parser.parse_args()
+
+    from namespaces import normalize_namespace
+    from vectorstore import get_embeddings
+
+    namespace = normalize_namespace(args.namespace)
+    with open(args.questions) as f:
+        questions = [json.loads(line) for line in f if line.strip()][:args.limit]
+    ids, vectors, sources, current = load_collection(namespace)
+    query_vectors = np.asarray(get_embeddings().embed_queries([q["question"] for q in questions]), dtype=np.float32)
+    query_vectors /= np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+    print(f"{len(ids)} chunks, {len(questions)} questions; current settings {current}")
+
+    rows = []
+    for max_neighbors in _ints(args.max_neighbors) if args.max_neighbors else [current["max_neighbors"]]:
+        for ef_construction in _ints(args.ef_construction) if args.ef_construction else [current["ef_construction"]]:
+            settings = {
+                "space": args.space or current["space"],
+                "max_neighbors": max_neighbors,
+                "ef_construction": ef_construction,
+                "ef_search": current["ef_search"],
+            }
+            config_rows = sweep(ids, vectors, sources, questions, query_vectors, settings, _ints(args.ef_search), _ints(args.k))
+            print(f"M={max_neighbors} ef_construction={ef_construction} (built in {config_rows[0]['build_seconds']:.2f}s)")
+            print_table(config_rows)
+            rows.extend(config_rows)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANSWER = "According to the documentation, the limit can be raised with the matching flag."
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions endpoint returning a canned answer"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _chunk(self, delta, finish_reason=None):
+        payload = {
+            "id": "stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n".encode()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        prompt = json.dumps(request["messages"])
+        text = "What is the limit?" if "Standalone question" in prompt else STUB_ANSWER
+        words = text.split(" ")
+        time.sleep(server.first_token_delay)
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            events = [self._chunk({"role": "assistant", "content": ""})]
+            events += [self._chunk({"content": word + " "}) for word in words]
+            events += [self._chunk({}, "stop"), b"data: [DONE]\n\n"]
+            for event in events:
+                self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                self.wfile.flush()
+                time.sleep(server.token_delay)
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        time.sleep(server.token_delay * len(words))
+        body = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(words), "total_tokens": len(prompt) // 4 + len(words)},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_llm_stub(first_token_delay=0.05, token_delay=0.005):
+    """Serve the stub on a free local port in a daemon thread and return its base URL"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.first_token_delay = first_token_delay
+    server.token_delay = token_delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
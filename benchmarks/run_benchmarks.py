@@ -0,0 +1,256 @@
+"""Offline benchmark of ingestion, retrieval and end-to-end QA on a synthetic docs corpus.
+
+Each corpus size runs in a fresh subprocess inside a temporary directory, so the app's
+./chroma_db and cache files never touch the working tree and peak RSS is measured per size.
+The LLM is replaced by a local OpenAI-compatible stub and Hugging Face downloads are disabled,
+so the embedding (and, unless --no-rerank, reranker) model must already be in the local cache.
+Use --fake-embeddings to benchmark everything except the embedding model.
+"""
+import argparse
+import functools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# Metric name -> True if higher is better
+METRICS = {
+    "ingest_chunks_per_second": True,
+    "ingest_seconds": False,
+    "peak_rss_mb": False,
+    "chroma_db_mb": False,
+    "lexical_index_mb": False,
+    "retrieval_p50_ms": False,
+    "retrieval_p95_ms": False,
+    "retrieval_p99_ms": False,
+    "retrieval_recall": True,
+    "answer_ttft_p50_ms": False,
+    "answer_p50_ms": False,
+    "answer_p95_ms": False,
+    "answer_p99_ms": False,
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def directory_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def _serve_directory(directory):
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_worker(args):
+    """Benchmark one corpus size in the current process and write the results as JSON"""
+    sys.path[:0] = [REPO_DIR, BENCHMARK_DIR]
+    from corpus import generate_corpus
+    from llm_stub import start_llm_stub
+
+    workdir = tempfile.mkdtemp(prefix="devdocs-bench-")
+    try:
+        paths, questions = generate_corpus(os.path.join(workdir, "corpus"), args.worker, seed=args.seed)
+        docs_url = _serve_directory(os.path.join(workdir, "corpus"))
+        os.makedirs(os.path.join(workdir, "app"))
+        os.chdir(os.path.join(workdir, "app"))
+
+        os.environ.update({
+            "HF_HUB_OFFLINE": "1",
+            "TRANSFORMERS_OFFLINE": "1",
+            "GROQ_API_KEY": "benchmark",
+            "GROQ_API_BASE": start_llm_stub(args.llm_first_token_ms / 1000, args.llm_token_ms / 1000),
+            "RERANK_ENABLED": "false" if args.no_rerank else "true",
+            # Every measured question should reach retrieval and the LLM
+            "ANSWER_CACHE_THRESHOLD": "2",
+        })
+        if args.fake_embeddings:
+            import langchain_huggingface
+            from langchain_core.embeddings import DeterministicFakeEmbedding
+
+            # vectorstore imports the class when the model is first loaded
+            langchain_huggingface.HuggingFaceEmbeddings = lambda **kwargs: DeterministicFakeEmbedding(size=768)
+
+        from ingestion import load_and_ingest_file, load_and_ingest_url
+        from qa_pipeline import answer_question_stream
+        from retrieval import retrieve
+
+        # HTML pages go through the URL loader, served from a local HTTP server
+        sources = {}
+        for path in paths:
+            if path.endswith(".html"):
+                sources[path] = f"{docs_url}/{os.path.basename(path)}"
+        for question in questions:
+            question["source"] = sources.get(question["source"], question["source"])
+
+        started = time.perf_counter()
+        chunks = 0
+        for path in paths:
+            if path in sources:
+                summary = load_and_ingest_url(sources[path])
+            else:
+                summary = load_and_ingest_file(path)
+            chunks += summary["added"]
+        ingest_seconds = time.perf_counter() - started
+
+        sample = questions[:args.queries]
+        retrieve(sample[0]["question"])  # warm up models and caches
+        retrieval_ms = []
+        hits = 0
+        for question in sample:
+            started = time.perf_counter()
+            docs = retrieve(question["question"])
+            retrieval_ms.append((time.perf_counter() - started) * 1000)
+            hits += any(doc.metadata.get("source_path") == question["source"] for doc in docs)
+
+        list(answer_question_stream(sample[0]["question"], session_id="bench-warmup"))
+        ttft_ms = []
+        answer_ms = []
+        for i, question in enumerate(sample[:args.answers]):
+            started = time.perf_counter()
+            first = None
+            for _ in answer_question_stream(question["question"], session_id=f"bench-{i}"):
+                if first is None:
+                    first = time.perf_counter()
+            answer_ms.append((time.perf_counter() - started) * 1000)
+            ttft_ms.append(((first or time.perf_counter()) - started) * 1000)
+
+        results = {
+            "documents": len(paths),
+            "chunks": chunks,
+            "ingest_seconds": ingest_seconds,
+            "ingest_chunks_per_second": chunks / ingest_seconds if ingest_seconds else 0.0,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "chroma_db_mb": directory_mb("chroma_db"),
+            # SQLite keeps recent writes in the -wal file
+            "lexical_index_mb": sum(
+                os.path.getsize(name) for name in os.listdir(".") if name.startswith("lexical_index.db")
+            ) / (1024 * 1024),
+            "retrieval_p50_ms": percentile(retrieval_ms, 50),
+            "retrieval_p95_ms": percentile(retrieval_ms, 95),
+            "retrieval_p99_ms": percentile(retrieval_ms, 99),
+            "retrieval_recall": hits / len(sample) if sample else 0.0,
+            "answer_ttft_p50_ms": percentile(ttft_ms, 50),
+            "answer_p50_ms": percentile(answer_ms, 50),
+            "answer_p95_ms": percentile(answer_ms, 95),
+            "answer_p99_ms": percentile(answer_ms, 99),
+        }
+        with open(args.result_file, "w") as f:
+            json.dump(results, f)
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_size(size, args):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_file = f.name
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "--worker", str(size),
+        "--result-file", result_file,
+        "--queries", str(args.queries),
+        "--answers", str(args.answers),
+        "--seed", str(args.seed),
+        "--llm-first-token-ms", str(args.llm_first_token_ms),
+        "--llm-token-ms", str(args.llm_token_ms),
+    ]
+    if args.fake_embeddings:
+        command.append("--fake-embeddings")
+    if args.no_rerank:
+        command.append("--no-rerank")
+    # Worker logs go to stderr so they do not mix with the report
+    subprocess.run(command, check=True, stdout=sys.stderr)
+    with open(result_file) as f:
+        results = json.load(f)
+    os.remove(result_file)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print each metric against the baseline and return the list of regressions"""
+    regressions = []
+    for size, metrics in results.items():
+        if size not in baseline:
+            print(f"\n{size} documents: no baseline")
+            continue
+        print(f"\n{size} documents vs baseline")
+        for name, higher_is_better in METRICS.items():
+            old, new = baseline[size].get(name), metrics.get(name)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((size, name, old, new))
+            print(f"  {name:26s} {old:12.2f} -> {new:12.2f}  ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="30,150", help="comma-separated corpus sizes in documents")
+    parser.add_argument("--queries", type=int, default=50, help="retrieval queries per size")
+    parser.add_argument("--answers", type=int, default=20, help="end-to-end questions per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fake-embeddings", action="store_true", help="use deterministic fake embeddings")
+    parser.add_argument("--no-rerank", action="store_true", help="disable the cross-encoder stage")
+    parser.add_argument("--llm-first-token-ms", type=float, default=50.0, help="stub LLM latency to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=5.0, help="stub LLM latency per token")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--save-baseline", help="write results JSON as the new baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        run_worker(args)
+        return
+
+    results = {}
+    for size in (int(size) for size in args.sizes.split(",")):
+        print(f"Benchmarking {size} documents...", file=sys.stderr)
+        results[str(size)] = run_size(size, args)
+
+    print(json.dumps(results, indent=2))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
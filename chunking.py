@@ -0,0 +1,274 @@
+import os
+import re
+from bs4 import Comment, NavigableString
+from langchain_core.documents import Document
+from context_builder import count_tokens
+
+# Chunk size limits in tokens (tiktoken cl100k_base). Sections shorter than MIN_CHUNK_TOKENS are
+# merged with the next one instead of becoming chunks of their own; the overlap is only used
+# when a long paragraph has to be split
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+MIN_CHUNK_TOKENS = int(os.getenv("MIN_CHUNK_TOKENS", "64"))
+
+MARKDOWN_HEADING_RE = re.compile(r"^ {0,3}(#{1,6})\s+(.+?)(?:\s+#+)?\s*$")
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+# Numbered headings such as "2.3 Authentication" in text extracted from PDFs
+NUMBERED_HEADING_RE = re.compile(r"^(\d{1,2}(?:\.\d{1,2})*)\.?\s+[A-Z][^.!?:;]{1,78}$")
+
+# Oversized blocks are broken at lines, then sentences, then words
+_SPLITTERS = [re.compile(r"[^\n]*\n?"), re.compile(r".+?(?:[.!?](?=\s)|$)\s*"), re.compile(r"\S+\s*")]
+
+_HTML_SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "head", "iframe"}
+_HTML_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "body", "br", "dd", "details", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "form", "header", "hr", "html", "main", "nav", "ol", "p",
+    "section", "summary", "ul",
+}
+
+
+def html_to_markdown(soup):
+    """Render parsed HTML as Markdown-style text, keeping headings, code blocks, tables and list
+    items as separate blocks so the splitter can follow the page structure"""
+    blocks = []
+    inline = []
+
+    def flush(prefix=""):
+        text = " ".join("".join(inline).split())
+        inline.clear()
+        if text:
+            blocks.append(prefix + text)
+
+    def walk(node):
+        for child in node.children:
+            if isinstance(child, Comment):
+                continue
+            if isinstance(child, NavigableString):
+                inline.append(str(child))
+                continue
+            name = child.name
+            if name in _HTML_SKIP_TAGS:
+                continue
+            if re.fullmatch(r"h[1-6]", name):
+                flush()
+                title = " ".join(child.get_text(" ").split())
+                if title:
+                    blocks.append("#" * int(name[1]) + " " + title)
+            elif name == "pre":
+                flush()
+                code = child.get_text().strip("\n")
+                if code.strip():
+                    blocks.append(f"```\n{code}\n```")
+            elif name == "table":
+                flush()
+                rows = []
+                for row in child.find_all("tr"):
+                    cells = [" ".join(cell.get_text(" ").split()) for cell in row.find_all(["th", "td"])]
+                    rows.append("| " + " | ".join(cells) + " |")
+                if rows:
+                    blocks.append("\n".join(rows))
+            elif name == "li":
+                flush()
+                walk(child)
+                flush("- ")
+            elif name in _HTML_BLOCK_TAGS:
+                flush()
+                walk(child)
+                flush()
+            else:
+                walk(child)
+
+    walk(soup)
+    flush()
+    return "\n\n".join(blocks)
+
+
+def _lines(text):
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        yield offset, offset + len(line), line
+        offset += len(line)
+
+
+def _blocks(text, text_format, headings):
+    """Split one document into (start, end, kind, section path) blocks.
+
+    kind is "heading", "code", "table" or "text". headings is the (level, title) stack of the
+    enclosing sections; it is updated in place so sections carry on into the next document of
+    the same source, e.g. the next PDF page."""
+    blocks = []
+    current = None
+    fence = None
+
+    def close():
+        nonlocal current
+        if current is not None:
+            blocks.append((current[0], current[1], current[2], tuple(title for _, title in headings)))
+            current = None
+
+    for start, end, line in _lines(text):
+        stripped = line.strip()
+        if fence is not None:
+            current[1] = end
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+                close()
+            continue
+
+        heading = None
+        if text_format == "markdown":
+            match = FENCE_RE.match(line)
+            if match:
+                close()
+                fence = match.group(1)
+                current = [start, end, "code"]
+                continue
+            match = MARKDOWN_HEADING_RE.match(line)
+            if match:
+                heading = (len(match.group(1)), match.group(2))
+        elif text_format == "pdf":
+            match = NUMBERED_HEADING_RE.match(stripped)
+            if match:
+                heading = (match.group(1).count(".") + 1, stripped)
+        if heading is not None:
+            close()
+            headings[:] = [h for h in headings if h[0] < heading[0]] + [heading]
+            current = [start, end, "heading"]
+            close()
+            continue
+
+        if not stripped:
+            close()
+            continue
+        kind = "table" if text_format == "markdown" and stripped.startswith("|") else "text"
+        if current is not None and current[2] != kind:
+            close()
+        if current is None:
+            current = [start, end, kind]
+        else:
+            current[1] = end
+    close()
+    return blocks
+
+
+def _split_oversized(text, start, end, max_tokens, level=0):
+    """Break text[start:end] into (start, end, tokens) pieces of at most max_tokens"""
+    if level == len(_SPLITTERS):
+        # A single word longer than the limit (minified code, base64): cut it by length
+        step = max(max_tokens * 4, 1)
+        for piece_start in range(start, end, step):
+            piece_end = min(piece_start + step, end)
+            yield piece_start, piece_end, count_tokens(text[piece_start:piece_end])
+        return
+    for match in _SPLITTERS[level].finditer(text, start, end):
+        piece_start, piece_end = match.span()
+        if piece_start == piece_end:
+            continue
+        tokens = count_tokens(text[piece_start:piece_end])
+        if tokens > max_tokens:
+            yield from _split_oversized(text, piece_start, piece_end, max_tokens, level + 1)
+        else:
+            yield piece_start, piece_end, tokens
+
+
+def _common_path(paths):
+    prefix = paths[0]
+    for path in paths[1:]:
+        n = 0
+        while n < min(len(prefix), len(path)) and prefix[n] == path[n]:
+            n += 1
+        prefix = prefix[:n]
+    return prefix or paths[0]
+
+
+class StructuredSplitter:
+    """Token-sized splitter that follows document structure.
+
+    Chunks end at section boundaries (Markdown headings, numbered PDF headings) and never cut
+    through a code block or table unless it alone exceeds the chunk size. Every chunk is a
+    contiguous slice of its document, so start_index stays valid for merging neighbours, and
+    carries its section_path and chunk_tokens in metadata.
+
+    text_format is "markdown" (also used for HTML rendered by html_to_markdown), "pdf" or
+    "text". One splitter should be used per source, since it tracks the current section across
+    that source's documents."""
+
+    def __init__(self, text_format="text", chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                 min_tokens=MIN_CHUNK_TOKENS):
+        self.text_format = text_format
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+        self._headings = []
+
+    def split_documents(self, docs):
+        for doc in docs:
+            text = doc.page_content
+            for start, end, path in self._pack(text, _blocks(text, self.text_format, self._headings)):
+                chunk = text[start:end].rstrip()
+                if not chunk.strip():
+                    continue
+                # start_index lets the context builder stitch neighbouring chunks back together
+                metadata = dict(doc.metadata, start_index=start, chunk_tokens=count_tokens(chunk))
+                if path:
+                    metadata["section_path"] = " > ".join(path)
+                yield Document(page_content=chunk, metadata=metadata)
+
+    def _pack(self, text, blocks):
+        """Group consecutive blocks into (start, end, section path) chunks of at most chunk_tokens"""
+        chunks = []
+        current = []
+        used = 0
+
+        def emit():
+            chunks.append((current[0][0], current[-1][1], _common_path([item[3] for item in current])))
+
+        for parent, (start, end, kind, path) in enumerate(blocks):
+            tokens = count_tokens(text[start:end])
+            pieces = [(start, end, tokens)] if tokens <= self.chunk_tokens else _split_oversized(
+                text, start, end, self.chunk_tokens
+            )
+            for index, (piece_start, piece_end, piece_tokens) in enumerate(pieces):
+                # A heading starts a new chunk unless the current one is too small to stand alone
+                new_section = kind == "heading" and used >= self.min_tokens
+                if current and (new_section or used + piece_tokens > self.chunk_tokens):
+                    emit()
+                    # Repeat the tail of a paragraph that continues into the next chunk
+                    carried = []
+                    if index > 0 and kind == "text":
+                        carried_tokens = 0
+                        for item in reversed(current):
+                            if item[4] != parent or carried_tokens + item[2] > self.overlap_tokens:
+                                break
+                            carried.insert(0, item)
+                            carried_tokens += item[2]
+                        if carried_tokens + piece_tokens > self.chunk_tokens:
+                            carried = []
+                    current = carried
+                    used = sum(item[2] for item in current)
+                current.append((piece_start, piece_end, piece_tokens, path, parent))
+                used += piece_tokens
+        if current:
+            emit()
+        return chunks
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def chunk_stats(token_counts, min_tokens=MIN_CHUNK_TOKENS):
+    """Count and token size distribution of a set of chunks"""
+    if not token_counts:
+        return {"chunks": 0, "tokens": 0}
+    return {
+        "chunks": len(token_counts),
+        "tokens": sum(token_counts),
+        "min": min(token_counts),
+        "p50": _percentile(token_counts, 50),
+        "p95": _percentile(token_counts, 95),
+        "max": max(token_counts),
+        "mean": round(sum(token_counts) / len(token_counts), 1),
+        "small": sum(1 for tokens in token_counts if tokens < min_tokens),
+    }
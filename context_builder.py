@@ -0,0 +1,129 @@
+import os
+import threading
+from langchain_core.documents import Document
+
+# Token budgets for the retrieved context and for the chat history used to condense questions
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1000"))
+TOKEN_ENCODING = "cl100k_base"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception as e:
+                # tiktoken downloads its BPE files on first use; without them fall back to ~4 chars/token
+                print(f"tiktoken unavailable ({str(e)}), estimating tokens from length")
+                _encoding = False
+        return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if not encoding:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens):
+    encoding = _get_encoding()
+    if not encoding:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def fit_history(messages, budget=HISTORY_TOKEN_BUDGET):
+    """Keep the most recent messages that fit in budget; older turns are dropped.
+
+    Returns (messages, tokens)."""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        tokens = count_tokens(message.content)
+        if used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    return kept, used
+
+
+def merge_chunks(docs):
+    """Drop duplicate chunks and merge overlapping or adjacent chunks of the same source.
+
+    Chunks carry start_index from the splitter, so neighbours from the same source and page
+    can be stitched back together without repeating their shared overlap. The merged chunks
+    keep the rank of their best-ranked member."""
+    groups = {}
+    order = []
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("source_path"), doc.metadata.get("page"))
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append((rank, doc))
+
+    merged = []
+    for key in order:
+        spans = []
+        for rank, doc in groups[key]:
+            text = doc.page_content
+            if any(text in span["text"] for span in spans):
+                continue
+            start = doc.metadata.get("start_index")
+            spans.append({
+                "rank": rank,
+                "start": start,
+                "end": start + len(text) if start is not None else None,
+                "text": text,
+                "metadata": doc.metadata,
+            })
+
+        positioned = sorted((span for span in spans if span["start"] is not None), key=lambda span: span["start"])
+        stitched = []
+        for span in positioned:
+            previous = stitched[-1] if stitched else None
+            if previous is not None and span["start"] <= previous["end"]:
+                overlap = previous["end"] - span["start"]
+                previous["text"] += span["text"][overlap:]
+                previous["end"] = max(previous["end"], span["end"])
+                previous["rank"] = min(previous["rank"], span["rank"])
+            else:
+                stitched.append(dict(span))
+        stitched.extend(span for span in spans if span["start"] is None)
+        merged.extend(stitched)
+
+    merged.sort(key=lambda span: span["rank"])
+    return [Document(page_content=span["text"], metadata=span["metadata"]) for span in merged]
+
+
+def build_context(docs, budget=CONTEXT_TOKEN_BUDGET):
+    """Merge the retrieved chunks and fit them into budget tokens, best-ranked first.
+
+    Returns (context string, tokens, documents used)."""
+    used_docs = []
+    parts = []
+    used = 0
+    separator_tokens = count_tokens("\n\n")
+    for doc in merge_chunks(docs):
+        remaining = budget - used - (separator_tokens if parts else 0)
+        if remaining <= 0:
+            break
+        tokens = count_tokens(doc.page_content)
+        text = doc.page_content
+        if tokens > remaining:
+            text = truncate_tokens(text, remaining)
+            tokens = remaining
+        parts.append(text)
+        used_docs.append(doc)
+        used += tokens + (separator_tokens if len(parts) > 1 else 0)
+    return "\n\n".join(parts), used, used_docs
@@ -0,0 +1,380 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from urllib.parse import urldefrag, urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+from xml.etree import ElementTree
+import httpx
+import numpy as np
+from bs4 import BeautifulSoup
+import metrics
+from ingestion import EMBED_WORKERS, page_document, store_embeddings
+from jobs import JobCancelled
+from namespaces import DEFAULT_NAMESPACE, normalize_namespace
+
+# Links are followed this many hops from the root page (pages listed in a sitemap are depth 0),
+# and at most CRAWL_MAX_PAGES URLs are fetched per crawl
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "200"))
+# Requests in flight at once over the crawler's pooled connections
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+# Requests per second to one host; a robots.txt Crawl-delay can only make it slower
+CRAWL_RATE_LIMIT = float(os.getenv("CRAWL_RATE_LIMIT", "2"))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "DevDocsChat-Crawler/1.0")
+# Pages whose shingle sets have at least this estimated Jaccard similarity with a page already
+# crawled are near duplicates and skipped
+CRAWL_NEAR_DUPLICATE_SIMILARITY = float(os.getenv("CRAWL_NEAR_DUPLICATE_SIMILARITY", "0.8"))
+# Words per shingle, and MinHash signature length split into LSH bands of MINHASH_ROWS hashes
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 128
+MINHASH_ROWS = 4
+CRAWL_TIMEOUT = 30
+
+# Links to these are assets or downloads, not pages
+SKIPPED_EXTENSIONS = {
+    ".css", ".dmg", ".exe", ".gif", ".gz", ".ico", ".jpeg", ".jpg", ".js", ".mp3", ".mp4", ".pdf",
+    ".png", ".svg", ".tar", ".tgz", ".ttf", ".webp", ".woff", ".woff2", ".zip",
+}
+
+
+def normalize_url(url):
+    """URL without its fragment and with a lowercase scheme and host, to recognise pages already seen"""
+    parts = urlsplit(urldefrag(url)[0])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+
+# Fixed seed, so signatures are comparable across crawls and processes
+_minhash_rng = np.random.default_rng(0)
+_MINHASH_MASKS = _minhash_rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64) << np.uint64(1)
+# Odd, so each multiply-shift hash permutes the shingle hashes before the shift
+_MINHASH_MULTIPLIERS = (
+    _minhash_rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+)
+
+
+def minhash(text, shingle_size=SHINGLE_SIZE):
+    """MinHash signature of the set of overlapping word shingles in a page's text, ignoring case
+    and punctuation. The share of equal positions in two signatures estimates the Jaccard
+    similarity of the pages, so copies that differ only in some boilerplate (a timestamp, a nav
+    badge, a print-view header) score close to 1 while different pages score low."""
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+         for shingle in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    # One multiply-shift hash per permutation; uint64 arithmetic wraps around as intended
+    return (((hashes[:, None] ^ _MINHASH_MASKS) * _MINHASH_MULTIPLIERS) >> np.uint64(32)).min(axis=0)
+
+
+class NearDuplicateIndex:
+    """MinHash signatures of the pages kept so far in a crawl.
+
+    Signatures are split into bands of MINHASH_ROWS hashes (locality-sensitive hashing): pages as
+    similar as the threshold almost always agree on a whole band, so a new page is only compared
+    with the pages that share a band with it rather than with every page kept."""
+
+    def __init__(self, threshold=CRAWL_NEAR_DUPLICATE_SIMILARITY, rows=MINHASH_ROWS):
+        self.threshold = threshold
+        self.rows = rows
+        self._buckets = {}
+
+    def add(self, signature):
+        """Keep a signature unless it is a near duplicate of one already kept; returns whether it was kept"""
+        keys = [(start, signature[start:start + self.rows].tobytes()) for start in range(0, len(signature), self.rows)]
+        for key in keys:
+            for other in self._buckets.get(key, ()):
+                if (signature == other).mean() >= self.threshold:
+                    return False
+        for key in keys:
+            self._buckets.setdefault(key, []).append(signature)
+        return True
+
+
+def parse_sitemap(content):
+    """(page URLs, nested sitemap URLs) listed in a sitemap or sitemap index"""
+    pages = []
+    sitemaps = []
+    for entry in ElementTree.fromstring(content):
+        # Tags carry the sitemaps.org namespace, e.g. {http://www.sitemaps.org/...}loc
+        loc = next((child.text.strip() for child in entry if child.tag.endswith("loc") and child.text), None)
+        if loc:
+            (sitemaps if entry.tag.endswith("sitemap") else pages).append(loc)
+    return pages, sitemaps
+
+
+def _is_sitemap(response):
+    if "xml" not in response.headers.get("content-type", "") and not response.url.path.endswith(".xml"):
+        return False
+    head = response.text[:2000]
+    return "<urlset" in head or "<sitemapindex" in head
+
+
+def parse_page(html, url, headers):
+    """(Document, outgoing links) of an HTML page. The Document is None when the page's robots
+    meta tag says noindex, and there are no links when it says nofollow."""
+    soup = BeautifulSoup(html, "html.parser")
+    meta = soup.find("meta", attrs={"name": re.compile(r"^robots$", re.I)})
+    directives = meta.get("content", "").lower() if meta else ""
+    links = []
+    if "nofollow" not in directives:
+        base = soup.find("base", href=True)
+        base_url = urljoin(url, base["href"]) if base else url
+        links = [urljoin(base_url, link["href"]) for link in soup.find_all("a", href=True)]
+    doc = None if "noindex" in directives else page_document(soup, url, headers)
+    return doc, links
+
+
+class HostRateLimiter:
+    """Spaces out requests to each host by at least 1 / rate seconds, or the host's Crawl-delay.
+
+    Only used from one event loop, so reserving a slot needs no lock."""
+
+    def __init__(self, rate=CRAWL_RATE_LIMIT):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._intervals = {}
+        self._next_slot = {}
+
+    def slow_down(self, host, seconds):
+        self._intervals[host] = max(seconds, self.interval)
+
+    async def wait(self, host):
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self._intervals.get(host, self.interval)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Crawler:
+    """Concurrent crawl of one site, starting from a page or a sitemap.
+
+    Workers share one pooled HTTP client; requests to each host are rate limited and checked
+    against its robots.txt. Links are followed breadth-first on the root's host up to max_depth,
+    and a page whose text is a near duplicate (see minhash) of a page already kept is skipped.
+    Each new page is passed to ingest_page(document) on a worker thread as soon as it is parsed;
+    the hand-off queue is bounded, so fetching pauses while ingestion catches up.
+
+    progress(pages_done=..., pages_skipped=..., chunks_processed=..., ...) is called after every
+    page, and a set cancel_event stops the crawl with JobCancelled."""
+
+    def __init__(
+        self, root_url, ingest_page, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES,
+        concurrency=CRAWL_CONCURRENCY, rate_limit=CRAWL_RATE_LIMIT, ingest_workers=EMBED_WORKERS,
+        user_agent=CRAWL_USER_AGENT, near_duplicate_similarity=CRAWL_NEAR_DUPLICATE_SIMILARITY,
+        progress=None, cancel_event=None,
+    ):
+        self.root_url = normalize_url(root_url)
+        if urlsplit(self.root_url).scheme not in ("http", "https"):
+            raise ValueError(f"Not an http(s) URL: {root_url}")
+        # The root's host, plus the host it redirects to (e.g. example.com -> www.example.com)
+        self.hosts = {urlsplit(self.root_url).netloc}
+        self.ingest_page = ingest_page
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.ingest_workers = ingest_workers
+        self.user_agent = user_agent
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.stats = {
+            "pages_fetched": 0, "pages_done": 0, "pages_skipped": 0, "skipped": {},
+            "chunks_processed": 0, "chunks_added": 0, "chunks_deleted": 0, "seconds": 0.0,
+        }
+        self._limiter = HostRateLimiter(rate_limit)
+        self._robots = {}
+        self._seen_urls = set()
+        self._fingerprints = NearDuplicateIndex(near_duplicate_similarity)
+
+    def _schedule(self, url, depth):
+        url = normalize_url(url)
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or parts.netloc not in self.hosts:
+            return
+        if os.path.splitext(parts.path)[1].lower() in SKIPPED_EXTENSIONS:
+            return
+        if url in self._seen_urls or len(self._seen_urls) >= self.max_pages:
+            return
+        self._seen_urls.add(url)
+        self._fetch_queue.put_nowait((url, depth))
+
+    def _report(self):
+        if self.progress is not None:
+            self.progress(**{key: self.stats[key] for key in (
+                "pages_done", "pages_skipped", "chunks_processed", "chunks_added", "chunks_deleted"
+            )})
+
+    def _skip(self, reason):
+        self.stats["pages_skipped"] += 1
+        self.stats["skipped"][reason] = self.stats["skipped"].get(reason, 0) + 1
+        metrics.inc("crawl_pages_total", outcome=reason)
+        self._report()
+
+    async def _robots_for(self, url):
+        """robots.txt rules of a URL's host, fetched once per crawl"""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        # Concurrent callers await the same fetch
+        task = self._robots.get(origin)
+        if task is None:
+            task = self._robots[origin] = asyncio.ensure_future(self._fetch_robots(origin, parts.netloc))
+        return await task
+
+    async def _fetch_robots(self, origin, host):
+        # Same rules as RobotFileParser.read(): no robots.txt allows everything, 401/403 nothing
+        parser = RobotFileParser(origin + "/robots.txt")
+        await self._limiter.wait(host)
+        try:
+            response = await self._client.get(origin + "/robots.txt")
+        except httpx.HTTPError:
+            parser.allow_all = True
+            return parser
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+            delay = parser.crawl_delay(self.user_agent)
+            if delay:
+                self._limiter.slow_down(host, float(delay))
+        return parser
+
+    async def _crawl_page(self, url, depth):
+        if not (await self._robots_for(url)).can_fetch(self.user_agent, url):
+            self._skip("disallowed")
+            return
+        await self._limiter.wait(urlsplit(url).netloc)
+        with metrics.span("crawl.fetch") as fetch_span:
+            response = await self._client.get(url)
+            fetch_span["status"] = response.status_code
+        final_url = normalize_url(str(response.url))
+        if final_url != url:
+            if url == self.root_url:
+                self.hosts.add(urlsplit(final_url).netloc)
+            if urlsplit(final_url).netloc not in self.hosts:
+                self._skip("offsite")
+                return
+            if final_url in self._seen_urls:
+                self._skip("duplicate")
+                return
+            self._seen_urls.add(final_url)
+        if response.status_code >= 400:
+            self._skip("http_error")
+            return
+
+        if _is_sitemap(response):
+            pages, sitemaps = parse_sitemap(response.content)
+            for listed in sitemaps + pages:
+                self._schedule(listed, depth)
+            return
+        if "html" not in response.headers.get("content-type", ""):
+            self._skip("not_html")
+            return
+
+        self.stats["pages_fetched"] += 1
+        doc, links = await asyncio.to_thread(parse_page, response.text, final_url, response.headers)
+        if depth < self.max_depth:
+            for link in links:
+                self._schedule(link, depth + 1)
+        if doc is None:
+            self._skip("noindex")
+            return
+        if not self._fingerprints.add(await asyncio.to_thread(minhash, doc.page_content)):
+            self._skip("duplicate")
+            return
+        await self._ingest_queue.put(doc)
+
+    async def _fetch_worker(self):
+        while True:
+            url, depth = await self._fetch_queue.get()
+            try:
+                await self._crawl_page(url, depth)
+            except Exception as e:
+                print(f"Error crawling {url}: {str(e)}")
+                self._skip("failed")
+            finally:
+                self._fetch_queue.task_done()
+
+    async def _ingest_worker(self):
+        while True:
+            doc = await self._ingest_queue.get()
+            try:
+                summary = await asyncio.to_thread(self.ingest_page, doc)
+                self.stats["pages_done"] += 1
+                self.stats["chunks_processed"] += summary["added"] + summary["unchanged"]
+                self.stats["chunks_added"] += summary["added"]
+                self.stats["chunks_deleted"] += summary["deleted"]
+                metrics.inc("crawl_pages_total", outcome="ingested")
+                self._report()
+            except JobCancelled:
+                pass
+            except Exception as e:
+                print(f"Error ingesting {doc.metadata.get('source')}: {str(e)}")
+                self._skip("failed")
+            finally:
+                self._ingest_queue.task_done()
+
+    async def _drain(self):
+        # Ingestion never schedules fetches, so once fetching is done only the hand-off queue is left
+        await self._fetch_queue.join()
+        await self._ingest_queue.join()
+
+    async def run(self):
+        """Crawl until no pages are left or max_pages is reached, returning the crawl stats"""
+        started = time.perf_counter()
+        self._fetch_queue = asyncio.Queue()
+        self._ingest_queue = asyncio.Queue(maxsize=self.ingest_workers * 2)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(
+            headers={"User-Agent": self.user_agent}, follow_redirects=True, timeout=CRAWL_TIMEOUT, limits=limits,
+        ) as client:
+            self._client = client
+            self._schedule(self.root_url, 0)
+            workers = [asyncio.create_task(self._fetch_worker()) for _ in range(self.concurrency)]
+            workers += [asyncio.create_task(self._ingest_worker()) for _ in range(self.ingest_workers)]
+            drained = asyncio.ensure_future(self._drain())
+            try:
+                while not drained.done():
+                    await asyncio.wait([drained], timeout=0.25)
+                    if self.cancel_event is not None and self.cancel_event.is_set():
+                        raise JobCancelled()
+            finally:
+                for task in workers + [drained]:
+                    task.cancel()
+                await asyncio.gather(*workers, drained, return_exceptions=True)
+        self.stats["seconds"] = time.perf_counter() - started
+        return self.stats
+
+
+def crawl_and_ingest(
+    root_url, namespace=DEFAULT_NAMESPACE, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES,
+    progress=None, cancel_event=None,
+):
+    """Crawl a site into a namespace, storing every page as its own URL source. Returns crawl stats."""
+    namespace = normalize_namespace(namespace)
+
+    def ingest_page(doc):
+        return store_embeddings(
+            [doc], source_type="url", source_path=doc.metadata["source"], text_format="markdown",
+            cancel_event=cancel_event, namespace=namespace,
+        )
+
+    print(f"Crawling {root_url} (depth {max_depth}, up to {max_pages} pages)")
+    crawler = Crawler(
+        root_url, ingest_page, max_depth=max_depth, max_pages=max_pages, progress=progress, cancel_event=cancel_event,
+    )
+    with metrics.trace(), metrics.span("ingest.crawl"):
+        stats = asyncio.run(crawler.run())
+    skipped = ", ".join(f"{count} {reason}" for reason, count in sorted(stats["skipped"].items()))
+    print(
+        f"Crawled {root_url}: {stats['pages_done']} pages ingested, {stats['pages_skipped']} skipped"
+        f"{f' ({skipped})' if skipped else ''}, {stats['chunks_added']} chunks added in {stats['seconds']:.2f}s."
+    )
+    return stats
+
+
+metrics.describe("crawl_pages_total", "Pages handled by the crawler, by outcome")
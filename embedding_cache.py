@@ -0,0 +1,135 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+import metrics
+
+EMBEDDING_CACHE_PATH = "./embedding_cache.db"
+QUERY_CACHE_SIZE = 1024
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that stores vectors on disk keyed by (model, normalization, text hash)
+    so unchanged chunks are never embedded twice. Queries also go through an in-memory LRU."""
+
+    def __init__(self, embeddings, model_name, normalize, path=EMBEDDING_CACHE_PATH, query_cache_size=QUERY_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.normalize = int(bool(normalize))
+        self.query_cache_size = query_cache_size
+        self._lock = threading.Lock()
+        self._queries = OrderedDict()
+        self.stats = {"document_hits": 0, "document_misses": 0, "query_hits": 0, "query_misses": 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                normalized INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, normalized, text_hash)
+            )"""
+        )
+        self._conn.commit()
+
+    def _lookup(self, hashes):
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND normalized = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [self.model_name, self.normalize, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def _store(self, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, normalized, text_hash, vector) VALUES (?, ?, ?, ?)",
+                [(self.model_name, self.normalize, key, array("f", vector).tobytes()) for key, vector in items],
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        found = self._lookup(list(set(hashes)))
+
+        # Embed each unseen text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            with metrics.span("embedding.model", kind="documents", texts=len(missing)):
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self._store(new_items)
+            found.update(new_items)
+
+        with self._lock:
+            self.stats["document_misses"] += len(missing)
+            self.stats["document_hits"] += len(texts) - len(missing)
+        metrics.inc("embedding_cache_requests_total", len(texts) - len(missing), kind="document", result="hit")
+        metrics.inc("embedding_cache_requests_total", len(missing), kind="document", result="miss")
+        return [found[key] for key in hashes]
+
+    def embed_queries(self, texts):
+        """Embed several queries, running the model once for all that are not cached"""
+        keys = [text_hash(text) for text in texts]
+        with self._lock:
+            found = {key: self._queries[key] for key in set(keys) if key in self._queries}
+        unseen = [key for key in set(keys) if key not in found]
+        if unseen:
+            found.update(self._lookup(unseen))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            with metrics.span("embedding.model", kind="query", texts=len(missing)):
+                if len(missing) == 1:
+                    vectors = [self.embeddings.embed_query(next(iter(missing.values())))]
+                else:
+                    # The sentence-transformers models used here embed queries and documents alike
+                    vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self._store(new_items)
+            found.update(new_items)
+
+        with self._lock:
+            self.stats["query_misses"] += len(missing)
+            self.stats["query_hits"] += len(texts) - len(missing)
+            for key in keys:
+                self._queries[key] = found[key]
+                self._queries.move_to_end(key)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        metrics.inc("embedding_cache_requests_total", len(texts) - len(missing), kind="query", result="hit")
+        metrics.inc("embedding_cache_requests_total", len(missing), kind="query", result="miss")
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def format_stats(self):
+        stats = self.get_stats()
+        return (
+            f"Embedding cache: {stats['document_hits']} chunk hits / {stats['document_misses']} misses, "
+            f"{stats['query_hits']} query hits / {stats['query_misses']} misses"
+        )
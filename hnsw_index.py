@@ -0,0 +1,223 @@
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+from jobs import JobCancelled, get_job_queue
+from namespaces import DEFAULT_NAMESPACE, list_namespaces, normalize_namespace
+from vectorstore import (
+    HNSW_SPACE,
+    RETIRED_SUFFIX,
+    collection_name,
+    collection_write_lock,
+    get_vectordb,
+    hnsw_configuration,
+    reopen_vectordb,
+    track_writes,
+)
+
+# A rebuilt index is filled under this suffix before it is swapped in
+REBUILD_SUFFIX = "__rebuild"
+# Seconds the replaced collection is kept after a swap, so queries already running on it can finish
+INDEX_SWAP_GRACE_SECONDS = int(os.getenv("INDEX_SWAP_GRACE_SECONDS", "60"))
+HNSW_SETTINGS = ("space", "max_neighbors", "ef_construction", "ef_search")
+# Queue a rebuild at startup for collections whose vectors were stored before embeddings were
+# normalized; with 0 they are only reported
+INDEX_AUTO_UPGRADE = os.getenv("INDEX_AUTO_UPGRADE", "1") == "1"
+# Chunks whose vector norms are checked per collection; the oldest chunks come first
+UPGRADE_CHECK_SAMPLE = 100
+
+_rebuilding_lock = threading.Lock()
+_rebuilding = set()
+
+
+def index_settings(namespace=DEFAULT_NAMESPACE):
+    """Collection name, chunk count and HNSW settings of a namespace's index"""
+    collection = get_vectordb(namespace)._collection
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    return {
+        "collection": collection.name,
+        "chunks": collection.count(),
+        "hnsw": {key: hnsw.get(key) for key in HNSW_SETTINGS},
+    }
+
+
+def _new_settings(namespace, overrides):
+    """Current HNSW settings with the given non-None overrides applied, validated"""
+    settings = dict(index_settings(namespace)["hnsw"])
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    hnsw_configuration(**settings)
+    return settings
+
+
+def _normalized(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _copy(source, target, ids):
+    """Copy chunks by id from one collection to another, normalizing their vectors.
+    Returns the ids missing from source, e.g. deleted since they were listed."""
+    result = source.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+    if result["ids"]:
+        target.upsert(
+            ids=result["ids"],
+            embeddings=_normalized(result["embeddings"]),
+            documents=result["documents"],
+            metadatas=result["metadatas"],
+        )
+    return set(ids) - set(result["ids"])
+
+
+def all_ids(collection):
+    """Ids of every chunk in a collection, read in one call. Paging with limit/offset would skip
+    chunks when others are deleted between pages, and those are not among the tracked writes."""
+    return collection.get(include=[])["ids"]
+
+
+def _catch_up(source, target, written, batch_size):
+    """Apply to target the writes made to source since it was copied, given the ids they touched
+    (see track_writes): ids still in source are copied again, the others deleted from target."""
+    written = sorted(written)
+    deleted = set()
+    for i in range(0, len(written), batch_size):
+        deleted |= _copy(source, target, written[i:i + batch_size])
+    deleted = sorted(deleted)
+    for i in range(0, len(deleted), batch_size):
+        target.delete(ids=deleted[i:i + batch_size])
+    return len(written) - len(deleted), len(deleted)
+
+
+def _delete_collection(client, name):
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+
+
+@contextmanager
+def index_maintenance(namespace):
+    """Held while a namespace's collection is being rebuilt or replaced; only one at a time"""
+    with _rebuilding_lock:
+        if namespace in _rebuilding:
+            raise RuntimeError(f"The index of namespace {namespace!r} is already being rebuilt or replaced")
+        _rebuilding.add(namespace)
+    try:
+        yield
+    finally:
+        with _rebuilding_lock:
+            _rebuilding.discard(namespace)
+
+
+def staging_collection(namespace, settings):
+    """New empty collection with the given HNSW settings, to be filled and then passed to swap_in"""
+    client = get_vectordb(namespace)._client
+    name = collection_name(namespace)
+    # Left over from an interrupted rebuild, or still in its grace period
+    _delete_collection(client, name + REBUILD_SUFFIX)
+    _delete_collection(client, name + RETIRED_SUFFIX)
+    return client.create_collection(name + REBUILD_SUFFIX, configuration=hnsw_configuration(**settings))
+
+
+def discard_staging(namespace):
+    _delete_collection(get_vectordb(namespace)._client, collection_name(namespace) + REBUILD_SUFFIX)
+
+
+def swap_in(namespace, staging):
+    """Give a staging collection the namespace's collection name, retiring the current collection.
+    Must be called with collection_write_lock(namespace) held."""
+    vectordb = get_vectordb(namespace)
+    name = collection_name(namespace)
+    vectordb._collection.modify(name=name + RETIRED_SUFFIX)
+    staging.modify(name=name)
+    reopen_vectordb(namespace)
+    timer = threading.Timer(INDEX_SWAP_GRACE_SECONDS, _delete_collection, (vectordb._client, name + RETIRED_SUFFIX))
+    timer.daemon = True
+    timer.start()
+
+
+def rebuild_index(
+    namespace=DEFAULT_NAMESPACE, space=None, max_neighbors=None, ef_construction=None, ef_search=None,
+    batch_size=1000, progress=None, cancel_event=None,
+):
+    """Rebuild a namespace's HNSW index with new settings and swap it in without downtime.
+
+    Chunks are copied with their stored vectors (normalized on the way, which also fixes vectors
+    stored before embeddings were normalized) into a new collection while queries and ingestion
+    keep using the current one, and the ids of chunks written or deleted meanwhile are tracked.
+    Writes are then held just long enough to re-copy those chunks and swap the collection names,
+    so the time they wait depends on the writes made during the copy, not on the collection
+    size. The old collection is deleted INDEX_SWAP_GRACE_SECONDS later. Settings left as None
+    keep their current value."""
+    namespace = normalize_namespace(namespace)
+    settings = _new_settings(namespace, {
+        "space": space, "max_neighbors": max_neighbors, "ef_construction": ef_construction, "ef_search": ef_search,
+    })
+    with index_maintenance(namespace):
+        staging = staging_collection(namespace, settings)
+        name = collection_name(namespace)
+        print(f"Rebuilding index of {name} with {settings}")
+        try:
+            with track_writes(namespace) as written:
+                source = get_vectordb(namespace)._collection
+                ids = all_ids(source)
+                copied = 0
+                for i in range(0, len(ids), batch_size):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise JobCancelled()
+                    batch = ids[i:i + batch_size]
+                    copied += len(batch) - len(_copy(source, staging, batch))
+                    if progress is not None:
+                        progress(chunks_processed=copied, chunks_added=copied)
+
+                # Only the chunks written since tracking started are read while writes are held
+                with collection_write_lock(namespace):
+                    source = get_vectordb(namespace)._collection
+                    changed, deleted = _catch_up(source, staging, written, batch_size)
+                    if staging.count() != source.count():
+                        raise RuntimeError(f"Rebuilt index has {staging.count()} chunks, expected {source.count()}")
+                    swap_in(namespace, staging)
+        except BaseException:
+            discard_staging(namespace)
+            raise
+
+        if progress is not None:
+            progress(chunks_processed=copied + changed, chunks_added=copied + changed, chunks_deleted=deleted)
+        print(f"Swapped in rebuilt index of {name}: {staging.count()} chunks ({changed} caught up after the copy).")
+        return index_settings(namespace)
+
+
+def submit_index_rebuild(namespace=DEFAULT_NAMESPACE, **settings):
+    """Queue a background rebuild of a namespace's index, returning the job id.
+    Invalid settings raise ValueError before anything is queued."""
+    namespace = normalize_namespace(namespace)
+    _new_settings(namespace, settings)
+
+    def run(progress, cancel_event):
+        return rebuild_index(namespace, progress=progress, cancel_event=cancel_event, **settings)
+
+    return get_job_queue().submit("reindex", collection_name(namespace), run)
+
+
+def needs_upgrade(namespace=DEFAULT_NAMESPACE):
+    """Whether a namespace's collection holds vectors stored before embeddings were normalized"""
+    sample = get_vectordb(namespace)._collection.get(include=["embeddings"], limit=UPGRADE_CHECK_SAMPLE)["embeddings"]
+    if sample is None or len(sample) == 0:
+        return False
+    norms = np.linalg.norm(np.asarray(sample, dtype=np.float32), axis=1)
+    return bool(np.abs(norms - 1).max() > 1e-3)
+
+
+def check_index_upgrades(rebuild=INDEX_AUTO_UPGRADE):
+    """Warning text if any namespace's collection mixes unnormalized vectors (and usually the old
+    l2 space) with normalized ones, whose scores do not compare. Unless rebuild is False, a
+    rebuild with the HNSW_SPACE metric is queued for each, which normalizes every vector."""
+    outdated = [namespace for namespace in list_namespaces() if needs_upgrade(namespace)]
+    if not outdated:
+        return None
+    names = ", ".join(collection_name(namespace) for namespace in outdated)
+    message = f"Collections {names} hold vectors stored before embeddings were normalized"
+    if not rebuild:
+        return f"{message}; rebuild them with POST /api/index/rebuild (space {HNSW_SPACE})."
+    for namespace in outdated:
+        submit_index_rebuild(namespace, space=HNSW_SPACE)
+    return f"{message}; rebuilding them in the background."
@@ -1,86 +1,319 @@
+import contextvars
+import hashlib
 import os
-from langchain_community.document_loaders import WebBaseLoader, PyPDFLoader, TextLoader, UnstructuredMarkdownLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-
-CHROMA_DB_DIR = "./chroma_db"
-
-model_name = "sentence-transformers/all-mpnet-base-v2"
-model_kwargs = {'device': 'cpu'}
-encode_kwargs = {'normalize_embeddings': False}
-embeddings = HuggingFaceEmbeddings(
-    model_name=model_name,
-    model_kwargs=model_kwargs
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+import metrics
+from embedding_cache import text_hash
+from chunking import StructuredSplitter, html_to_markdown
+from jobs import JobCancelled
+from lexical_index import get_lexical_index
+from namespaces import DEFAULT_NAMESPACE, create_namespace, namespace_exists, normalize_namespace
+from source_registry import get_source_registry
+from vectorstore import (
+    EMBEDDING_TAG,
+    LEGACY_EMBEDDING_MODEL,
+    collection_write_lock,
+    get_embeddings,
+    get_vectordb,
+    mark_written,
+    notify_collection_change,
 )
 
+# Chunks per embedding call and number of embedding calls run concurrently
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+
+
+def _timed_load(docs):
+    """Yield documents from a lazy loader, timing each load step"""
+    iterator = iter(docs)
+    while True:
+        with metrics.span("ingest.load"):
+            doc = next(iterator, None)
+        if doc is None:
+            return
+        yield doc
+
+
+def load_and_ingest_file(file_path, progress=None, cancel_event=None, namespace=DEFAULT_NAMESPACE):
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
 
-def load_and_ingest_file(file_path):
     print(f"Loading file: {file_path}")
     ext = os.path.splitext(file_path)[1].lower()
     if ext == ".pdf":
         loader = PyPDFLoader(file_path)
-    elif ext in [".md", ".markdown"]:
-        loader = UnstructuredMarkdownLoader(file_path)
+        text_format = "pdf"
     else:
+        # Markdown is read as-is so the splitter sees its headings and code fences
         loader = TextLoader(file_path)
-    docs = loader.load()
-    store_embeddings(docs, source_type="file", source_path=file_path)
+        text_format = "markdown" if ext in [".md", ".markdown"] else "text"
+    # lazy_load streams pages so large PDFs are never held in memory at once
+    docs = _timed_load(loader.lazy_load())
+    with metrics.trace(), metrics.span("ingest.file", extension=ext):
+        return store_embeddings(
+            docs, source_type="file", source_path=file_path, text_format=text_format,
+            progress=progress, cancel_event=cancel_event, namespace=namespace,
+        )
+
+
+def _get_url_validators(url, namespace):
+    """ETag/Last-Modified stored with the chunks of a previously ingested URL"""
+    if not namespace_exists(namespace):
+        return {}
+    result = get_vectordb(namespace)._collection.get(where={"source_path": url}, limit=1, include=["metadatas"])
+    if not result["metadatas"]:
+        return {}
+    metadata = result["metadatas"][0]
+    return {key: metadata[key] for key in ("etag", "last_modified") if key in metadata}
+
+
+def page_document(soup, url, headers):
+    """Document for a parsed HTML page, keeping its ETag/Last-Modified for conditional re-fetches"""
+    from langchain_community.document_loaders.web_base import _build_metadata
+
+    metadata = _build_metadata(soup, url)
+    # Set before building the Document, which keeps its own copy of the metadata
+    if headers.get("ETag"):
+        metadata["etag"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        metadata["last_modified"] = headers["Last-Modified"]
+    return Document(page_content=html_to_markdown(soup), metadata=metadata)
+
 
+def load_and_ingest_url(url, progress=None, cancel_event=None, namespace=DEFAULT_NAMESPACE):
+    from langchain_community.document_loaders import WebBaseLoader
 
-def load_and_ingest_url(url):
     loader = WebBaseLoader(url)
-    docs = loader.load()
-    store_embeddings(docs, source_type="url", source_path=url)
-
-
-def store_embeddings(docs, source_type="file", source_path=""):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = text_splitter.split_documents(docs)
-    
-    # Add metadata to each chunk
-    for chunk in chunks:
-        chunk.metadata["source_type"] = source_type
-        chunk.metadata["source_path"] = source_path
-
-    vectordb = Chroma(
-        collection_name="docs_collection",
-        embedding_function=embeddings,
-        persist_directory=CHROMA_DB_DIR,  # Where to save data locally, remove if not necessary
+    validators = _get_url_validators(url, namespace)
+    headers = {}
+    if "etag" in validators:
+        headers["If-None-Match"] = validators["etag"]
+    if "last_modified" in validators:
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    with metrics.span("ingest.fetch_url") as fetch_span:
+        response = loader.session.get(url, headers=headers, timeout=30)
+        fetch_span["status"] = response.status_code
+    if response.status_code == 304:
+        metrics.inc("ingest_url_not_modified_total")
+        print(f"URL not modified since last ingestion: {url}")
+        return {"added": 0, "deleted": 0, "unchanged": 0, "seconds": 0.0, "chunks_per_second": 0.0, "not_modified": True}
+    response.raise_for_status()
+    response.encoding = response.apparent_encoding
+
+    with metrics.span("ingest.parse_html"):
+        soup = BeautifulSoup(response.text, loader.default_parser)
+        docs = [page_document(soup, url, response.headers)]
+    with metrics.trace(), metrics.span("ingest.url"):
+        return store_embeddings(
+            docs, source_type="url", source_path=url, text_format="markdown",
+            progress=progress, cancel_event=cancel_event, namespace=namespace,
+        )
+
+
+def chunk_id(source_path, text):
+    """Stable chunk ID derived from the source and the chunk content"""
+    return f"{text_hash(source_path)[:16]}-{text_hash(text)[:32]}"
+
+
+def _split(docs, text_splitter, source_type, source_path, content_hash):
+    """Lazily split documents into (chunk_id, chunk) pairs, one document at a time,
+    feeding each document's text into content_hash"""
+    for doc in docs:
+        content_hash.update(doc.page_content.encode("utf-8"))
+        for chunk in text_splitter.split_documents([doc]):
+            # Add metadata to each chunk
+            chunk.metadata["source_type"] = source_type
+            chunk.metadata["source_path"] = source_path
+            chunk.metadata["embedding_model"] = EMBEDDING_TAG
+            yield chunk_id(source_path, chunk.page_content), chunk
+
+
+def _embed_batch(batch):
+    texts = [chunk.page_content for _, chunk in batch]
+    with metrics.span("ingest.embed_batch", chunks=len(batch)):
+        return batch, get_embeddings().embed_documents(texts)
+
+
+def _write_batch(namespace, lexical_index, batch, vectors):
+    ids = [id for id, _ in batch]
+    texts = [chunk.page_content for _, chunk in batch]
+    with metrics.span("ingest.write_batch", chunks=len(batch)), collection_write_lock(namespace):
+        # Looked up under the lock, since an index swap replaces the collection
+        get_vectordb(namespace)._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=texts,
+            metadatas=[chunk.metadata for _, chunk in batch],
+        )
+        lexical_index.add(ids, texts, [chunk.metadata["source_path"] for _, chunk in batch])
+        mark_written(namespace, ids)
+
+
+def _update_metadata(namespace, updates):
+    with collection_write_lock(namespace):
+        get_vectordb(namespace)._collection.update(
+            ids=[id for id, _ in updates], metadatas=[metadata for _, metadata in updates]
+        )
+        mark_written(namespace, [id for id, _ in updates])
+
+
+def store_embeddings(
+    docs, source_type="file", source_path="", text_format="text", progress=None, cancel_event=None,
+    namespace=DEFAULT_NAMESPACE,
+):
+    """Sync the chunks of one source into a namespace's collection, embedding only new chunks.
+
+    docs may be any iterable (e.g. a loader's lazy_load()); documents are split as they
+    arrive, new chunks are embedded in batches on a thread pool and each batch is written
+    to Chroma as soon as it is embedded, so memory stays flat for large documents.
+
+    progress(chunks_processed=..., chunks_added=...) is called after every batch, and a set
+    cancel_event stops ingestion with JobCancelled before the next batch.
+
+    text_format ("markdown", "pdf" or "text") tells the splitter which structure to follow.
+
+    Returns counts of added, deleted and unchanged chunks and the throughput."""
+    started = time.perf_counter()
+    text_splitter = StructuredSplitter(text_format)
+    namespace = create_namespace(namespace)
+    lexical_index = get_lexical_index(namespace)
+    registry = get_source_registry(namespace)
+    existing = get_vectordb(namespace)._collection.get(where={"source_path": source_path}, include=["metadatas"])
+    existing_metadata = dict(zip(existing["ids"], existing["metadatas"]))
+
+    seen = set()
+    added = updated = 0
+    pending = deque()
+    batch = []
+    updates = []
+    max_pending = EMBED_WORKERS * 2
+    content_hash = hashlib.sha256()
+
+    def drain(limit):
+        nonlocal added
+        while len(pending) > limit:
+            done_batch, vectors = pending.popleft().result()
+            _write_batch(namespace, lexical_index, done_batch, vectors)
+            added += len(done_batch)
+
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+        for id, chunk in _split(docs, text_splitter, source_type, source_path, content_hash):
+            if id in seen:
+                continue
+            seen.add(id)
+            # Chunks embedded by another model are re-embedded even if their text is unchanged
+            stored_model = existing_metadata.get(id, {}).get("embedding_model", LEGACY_EMBEDDING_MODEL)
+            if id in existing_metadata and stored_model == EMBEDDING_TAG:
+                # Unchanged text whose metadata moved on (page numbers, URL validators) is updated in place
+                if existing_metadata[id] != chunk.metadata:
+                    updates.append((id, chunk.metadata))
+                    updated += 1
+                    if len(updates) >= EMBED_BATCH_SIZE:
+                        _update_metadata(namespace, updates)
+                        updates = []
+                continue
+
+            batch.append((id, chunk))
+            if len(batch) >= EMBED_BATCH_SIZE:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+                pending.append(executor.submit(contextvars.copy_context().run, _embed_batch, batch))
+                batch = []
+                # Bound the number of in-flight batches so memory does not grow with document size
+                drain(max_pending)
+                if progress is not None:
+                    progress(chunks_processed=len(seen), chunks_added=added)
+        if batch:
+            pending.append(executor.submit(contextvars.copy_context().run, _embed_batch, batch))
+        drain(0)
+    if updates:
+        _update_metadata(namespace, updates)
+
+    stale_ids = [id for id in existing_metadata if id not in seen]
+    if stale_ids:
+        with collection_write_lock(namespace):
+            get_vectordb(namespace)._collection.delete(ids=stale_ids)
+            lexical_index.delete(stale_ids)
+            mark_written(namespace, stale_ids)
+    if seen:
+        registry.upsert(source_path, source_type, content_hash.hexdigest(), len(seen), EMBEDDING_TAG)
+    else:
+        registry.remove(source_path)
+    if progress is not None:
+        progress(chunks_processed=len(seen), chunks_added=added, chunks_deleted=len(stale_ids))
+
+    elapsed = time.perf_counter() - started
+    metrics.observe("ingest_seconds", elapsed, source_type=source_type)
+    metrics.inc("ingest_chunks_total", added, result="added")
+    metrics.inc("ingest_chunks_total", len(stale_ids), result="deleted")
+    metrics.inc("ingest_chunks_total", len(seen) - added, result="unchanged")
+    summary = {
+        "added": added,
+        "deleted": len(stale_ids),
+        "unchanged": len(seen) - added,
+        "seconds": elapsed,
+        "chunks_per_second": added / elapsed if elapsed > 0 else 0.0,
+    }
+    print(
+        f"Stored {len(seen)} chunks in VectorDB "
+        f"({summary['added']} added, {summary['deleted']} deleted, {summary['unchanged']} unchanged) "
+        f"in {elapsed:.2f}s, {summary['chunks_per_second']:.1f} chunks/s."
     )
-    vectordb.add_documents(chunks)
-    print(f"Stored {len(chunks)} chunks in VectorDB.")
+    print(get_embeddings().format_stats())
+    if added or stale_ids or updated:
+        notify_collection_change(source_path, namespace)
+    return summary
 
 
-def delete_embeddings_by_source(source_path):
+def delete_embeddings_by_source(source_path, namespace=DEFAULT_NAMESPACE):
     """Delete embeddings for a specific source file or URL"""
     try:
-        vectordb = Chroma(
-            collection_name="docs_collection",
-            embedding_function=embeddings,
-            persist_directory=CHROMA_DB_DIR,
-        )
-        # Delete documents where source_path matches
-        vectordb._collection.delete(where={"source_path": source_path})
+        namespace = normalize_namespace(namespace)
+        with collection_write_lock(namespace):
+            collection = get_vectordb(namespace)._collection
+            # Deleted by id, so an index rebuild running meanwhile knows which chunks went
+            ids = collection.get(where={"source_path": source_path}, include=[])["ids"]
+            if ids:
+                collection.delete(ids=ids)
+            get_lexical_index(namespace).delete_source(source_path)
+            mark_written(namespace, ids)
+        get_source_registry(namespace).remove(source_path)
         print(f"Deleted embeddings for source: {source_path}")
+        notify_collection_change(source_path, namespace)
         return f"Deleted embeddings for: {source_path}"
     except Exception as e:
         print(f"Error deleting embeddings: {str(e)}")
         return f"Error deleting embeddings: {str(e)}"
 
 
-def clear_database():
-    """Clear all documents from the vector database"""
+def clear_database(namespace=DEFAULT_NAMESPACE):
+    """Clear all documents of a namespace from the vector database"""
     try:
-        vectordb = Chroma(
-            collection_name="docs_collection",
-            embedding_function=embeddings,
-            persist_directory=CHROMA_DB_DIR,
-        )
-        vectordb._collection.delete(where={})
+        namespace = normalize_namespace(namespace)
+        with collection_write_lock(namespace):
+            collection = get_vectordb(namespace)._collection
+            # Chroma rejects an empty where filter, so delete every id page by page
+            while True:
+                ids = collection.get(include=[], limit=5000)["ids"]
+                if not ids:
+                    break
+                collection.delete(ids=ids)
+                mark_written(namespace, ids)
+            get_lexical_index(namespace).clear()
+        get_source_registry(namespace).clear()
         print("Database cleared successfully.")
+        notify_collection_change(namespace=namespace)
         return "Database cleared successfully."
     except Exception as e:
         print(f"Error clearing database: {str(e)}")
         return f"Error clearing database: {str(e)}"
 
+
+metrics.describe("ingest_seconds", "Time to sync one source into the collection")
+metrics.describe("ingest_chunks_total", "Chunks processed by ingestion, by outcome")
+metrics.describe("ingest_url_not_modified_total", "URL ingestions skipped by a 304 Not Modified")
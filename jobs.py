@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_DB_PATH = "./jobs.db"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+
+TERMINAL_STATUSES = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested"""
+
+
+class JobQueue:
+    """Background ingestion jobs run on a bounded worker pool, with records persisted to SQLite.
+
+    A job function is called as fn(progress, cancel_event): progress(**counts) updates the
+    job's chunk (and, for crawls, page) counts and cancel_event is set when the job should stop."""
+
+    def __init__(self, path=JOBS_DB_PATH, max_workers=INGEST_WORKERS):
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._futures = {}
+        self._cancel_events = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                source TEXT NOT NULL,
+                status TEXT NOT NULL,
+                chunks_processed INTEGER NOT NULL DEFAULT 0,
+                chunks_added INTEGER NOT NULL DEFAULT 0,
+                chunks_deleted INTEGER NOT NULL DEFAULT 0,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                pages_skipped INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )"""
+        )
+        # Page counts of crawl jobs were added later; older jobs.db files get the columns here
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("pages_done", "pages_skipped"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+        # Jobs that were in flight when the previous process exited will never finish
+        self._conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Interrupted by restart', finished_at = ? "
+            "WHERE status IN ('queued', 'running')",
+            (time.time(),),
+        )
+        self._conn.commit()
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+            self._conn.commit()
+
+    def submit(self, kind, source, fn):
+        """Queue fn to run in the background and return the new job id"""
+        job_id = uuid.uuid4().hex
+        cancel_event = threading.Event()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, source, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, source, time.time()),
+            )
+            self._conn.commit()
+            self._cancel_events[job_id] = cancel_event
+            self._futures[job_id] = self._executor.submit(self._run, job_id, fn, cancel_event)
+        return job_id
+
+    def _run(self, job_id, fn, cancel_event):
+        def progress(**counts):
+            self._update(job_id, **counts)
+
+        try:
+            if cancel_event.is_set():
+                raise JobCancelled()
+            self._update(job_id, status="running", started_at=time.time())
+            result = fn(progress=progress, cancel_event=cancel_event)
+            self._update(job_id, status="done", finished_at=time.time())
+            return result
+        except JobCancelled:
+            self._update(job_id, status="cancelled", finished_at=time.time())
+        except Exception as e:
+            print(f"Ingestion job {job_id} failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._cancel_events.pop(job_id, None)
+
+    def cancel(self, job_id):
+        """Request cancellation; queued jobs never start, running jobs stop at the next batch"""
+        with self._lock:
+            cancel_event = self._cancel_events.get(job_id)
+            future = self._futures.get(job_id)
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        if future is not None and future.cancel():
+            self._update(job_id, status="cancelled", finished_at=time.time())
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._cancel_events.pop(job_id, None)
+        return True
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, limit=20):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the shared JobQueue, creating it on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
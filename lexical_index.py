@@ -0,0 +1,161 @@
+import os
+import re
+import sqlite3
+import threading
+from namespaces import DEFAULT_NAMESPACE, HandleCache, namespace_path
+
+LEXICAL_INDEX_PATH = "./lexical_index.db"
+
+# Words that match nearly every chunk and only slow down OR queries
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "of", "on", "or", "the", "to", "what", "when", "where", "which", "why", "with",
+}
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+
+
+class LexicalIndex:
+    """BM25 index of chunk text kept next to a namespace's collection, backed by SQLite FTS5.
+
+    Chunks are keyed by the same IDs as in Chroma. The '_' character is kept inside tokens
+    so identifiers like MAX_RETRIES or ERR_RATE_LIMIT match exactly."""
+
+    def __init__(self, path=LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                source_path TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source_path ON chunks (source_path)")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(text, tokenize=\"unicode61 tokenchars '_'\")"
+        )
+        self._conn.commit()
+
+    def _delete_rowids(self, rowids):
+        for i in range(0, len(rowids), 500):
+            batch = rowids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM chunks_fts WHERE rowid IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM chunks WHERE rowid IN ({placeholders})", batch)
+
+    def _rowids_for_ids(self, ids):
+        rowids = []
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT rowid FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            rowids.extend(row[0] for row in rows)
+        return rowids
+
+    def add(self, ids, texts, source_paths):
+        """Insert or replace chunks"""
+        with self._lock:
+            self._delete_rowids(self._rowids_for_ids(list(ids)))
+            for id, text, source_path in zip(ids, texts, source_paths):
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, source_path) VALUES (?, ?)", (id, source_path)
+                )
+                self._conn.execute("INSERT INTO chunks_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+            self._conn.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete_rowids(self._rowids_for_ids(list(ids)))
+            self._conn.commit()
+
+    def delete_source(self, source_path):
+        with self._lock:
+            rows = self._conn.execute("SELECT rowid FROM chunks WHERE source_path = ?", (source_path,)).fetchall()
+            self._delete_rowids([row[0] for row in rows])
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks_fts")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, query, k=20):
+        """Return up to k chunk IDs ranked by BM25"""
+        tokens = [token for token in TOKEN_PATTERN.findall(query) if token.lower() not in STOPWORDS]
+        if not tokens:
+            return []
+        match = " OR ".join(f'"{token}"' for token in dict.fromkeys(tokens))
+        with self._lock:
+            # Rank inside FTS5 first so the LIMIT is applied before touching the ID table
+            rowids = [row[0] for row in self._conn.execute(
+                "SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY rank LIMIT ?", (match, k)
+            ).fetchall()]
+            if not rowids:
+                return []
+            ids = dict(self._conn.execute(
+                f"SELECT rowid, chunk_id FROM chunks WHERE rowid IN ({','.join('?' * len(rowids))})", rowids
+            ).fetchall())
+        return [ids[rowid] for rowid in rowids if rowid in ids]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def replace_with(self, path):
+        """Swap in the index file at path, built by a staging_lexical_index and closed, in place
+        of this one. Takes as long as renaming a file, however many chunks either index holds."""
+        with self._lock:
+            # Nothing may stay in the write-ahead log, or it would be applied to the new file
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+            os.replace(path, self.path)
+            self._connect()
+
+    def rebuild_from_collection(self, collection, batch_size=1000):
+        """Re-index every chunk stored in a Chroma collection"""
+        self.clear()
+        offset = 0
+        while True:
+            result = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not result["ids"]:
+                break
+            self.add(
+                result["ids"],
+                result["documents"],
+                [(metadata or {}).get("source_path", "") for metadata in result["metadatas"]],
+            )
+            offset += len(result["ids"])
+        print(f"Rebuilt lexical index with {offset} chunks.")
+
+
+def staging_lexical_index(namespace):
+    """New empty LexicalIndex next to a namespace's index, to be filled, closed and passed to
+    replace_with, so searches keep using the current index meanwhile"""
+    path = namespace_path(namespace, LEXICAL_INDEX_PATH) + ".staging"
+    discard_staging_lexical_index(path)
+    return LexicalIndex(path)
+
+
+def discard_staging_lexical_index(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+_indexes = HandleCache(lambda namespace: LexicalIndex(namespace_path(namespace, LEXICAL_INDEX_PATH)))
+
+
+def get_lexical_index(namespace=DEFAULT_NAMESPACE):
+    """Return the LexicalIndex of a namespace, opening it on first use"""
+    return _indexes.get(namespace)
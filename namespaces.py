@@ -0,0 +1,107 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Used when no namespace is given; it keeps docs_collection and the original ./*.db files
+DEFAULT_NAMESPACE = "default"
+# Every other namespace keeps its SQLite stores and uploads under NAMESPACES_DIR/<name>/
+NAMESPACES_DIR = "./namespaces"
+# Namespaces whose collection, lexical index and registry handles stay open at once
+MAX_OPEN_NAMESPACES = int(os.getenv("MAX_OPEN_NAMESPACES", "32"))
+
+# Also a valid suffix for Chroma collection names, which must start and end alphanumeric
+NAMESPACE_PATTERN = re.compile(r"^[a-z0-9](?:[a-z0-9_-]{0,61}[a-z0-9])?$")
+
+
+def normalize_namespace(namespace):
+    """Validated namespace name; None or an empty string means the default namespace"""
+    namespace = (namespace or "").strip().lower() or DEFAULT_NAMESPACE
+    if not NAMESPACE_PATTERN.match(namespace):
+        raise ValueError(
+            f"Invalid namespace {namespace!r}: use up to 63 lowercase letters, digits, '-' or '_', "
+            f"starting and ending with a letter or digit"
+        )
+    return namespace
+
+
+class UnknownNamespace(LookupError):
+    """A namespace was read before anything was stored in it"""
+
+
+def _namespace_dir(namespace):
+    return os.path.join(NAMESPACES_DIR, namespace)
+
+
+def namespace_exists(namespace):
+    """Whether a namespace has stored data; the default namespace always exists"""
+    namespace = normalize_namespace(namespace)
+    return namespace == DEFAULT_NAMESPACE or os.path.isdir(_namespace_dir(namespace))
+
+
+def create_namespace(namespace):
+    """Create a namespace's directory if needed; only ingestion and imports call this, so
+    reading a mistyped namespace never leaves one behind"""
+    namespace = normalize_namespace(namespace)
+    if namespace != DEFAULT_NAMESPACE:
+        os.makedirs(_namespace_dir(namespace), exist_ok=True)
+    return namespace
+
+
+def require_namespace(namespace):
+    """Validated name of an existing namespace; raises UnknownNamespace otherwise"""
+    namespace = normalize_namespace(namespace)
+    if not namespace_exists(namespace):
+        raise UnknownNamespace(f"Unknown namespace {namespace!r}: nothing has been ingested into it")
+    return namespace
+
+
+def namespace_path(namespace, default_path):
+    """Where a namespace keeps the store found at default_path for the default namespace"""
+    namespace = normalize_namespace(namespace)
+    if namespace == DEFAULT_NAMESPACE:
+        return default_path
+    return os.path.join(_namespace_dir(namespace), os.path.basename(os.path.normpath(default_path)))
+
+
+def list_namespaces():
+    """The default namespace plus every namespace that has stored data"""
+    names = {DEFAULT_NAMESPACE}
+    if os.path.isdir(NAMESPACES_DIR):
+        names.update(
+            name for name in os.listdir(NAMESPACES_DIR)
+            if NAMESPACE_PATTERN.match(name) and os.path.isdir(os.path.join(NAMESPACES_DIR, name))
+        )
+    return sorted(names)
+
+
+class HandleCache:
+    """Per-namespace handles opened on first use, at most max_open of them at a time.
+
+    Going over the limit drops the least recently used handle. It is not closed explicitly:
+    a caller still using it (e.g. a long ingestion) can finish, and it is released after.
+    Opening a handle never creates a namespace: it raises UnknownNamespace until
+    create_namespace has been called."""
+
+    def __init__(self, open_handle, max_open=MAX_OPEN_NAMESPACES):
+        self._open_handle = open_handle
+        self._max_open = max_open
+        self._lock = threading.Lock()
+        self._handles = OrderedDict()
+
+    def get(self, namespace):
+        namespace = normalize_namespace(namespace)
+        with self._lock:
+            handle = self._handles.get(namespace)
+            if handle is None:
+                handle = self._open_handle(require_namespace(namespace))
+                self._handles[namespace] = handle
+                while len(self._handles) > self._max_open:
+                    self._handles.popitem(last=False)
+            else:
+                self._handles.move_to_end(namespace)
+            return handle
+
+    def drop(self, namespace):
+        with self._lock:
+            self._handles.pop(normalize_namespace(namespace), None)
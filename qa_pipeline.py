@@ -1,14 +1,21 @@
+import asyncio
+import contextvars
+import math
 import os
-from langchain_chroma import Chroma
-from langchain.chains import ConversationalRetrievalChain
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_core.callbacks import StdOutCallbackHandler
-from langchain.memory import ConversationBufferMemory
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import get_buffer_string
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEmbeddings
 from pydantic import SecretStr
-
-CHROMA_DB_DIR = "./chroma_db"
+import metrics
+from answer_cache import SemanticAnswerCache
+from context_builder import build_context, count_tokens, fit_history
+from namespaces import DEFAULT_NAMESPACE, normalize_namespace
+from retrieval import HybridRetriever, retrieve_many
+from vectorstore import get_embeddings, get_vectordb, on_collection_change
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,64 +24,327 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("GROQ_API_KEY")
 OPENAI_API_BASE = os.getenv("GROQ_API_BASE")
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in environment variables. Please check your .env file.")
-if not OPENAI_API_BASE:
-    raise ValueError("OPENAI_API_BASE not found in environment variables. Please check your .env file.")
+MAX_SESSIONS = 256
+# LLM calls in flight at once for one batch of questions
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
 
-model_name = "sentence-transformers/all-mpnet-base-v2"
-model_kwargs = {'device': 'cpu'}
-encode_kwargs = {'normalize_embeddings': False}
-embeddings = HuggingFaceEmbeddings(
-    model_name=model_name,
-    model_kwargs=model_kwargs,
-    encode_kwargs=encode_kwargs
-)
+# Words that usually point back into the conversation and need the history to resolve
+FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "she", "him", "her",
+    "above", "previous", "earlier", "same", "also", "else", "again", "another", "other", "one", "ones",
+}
+FOLLOW_UP_PREFIXES = ("and ", "but ", "what about", "how about", "why not", "what else", "so ")
+# Raw-question retrieval is reused when the condensed question embeds this close to it
+CONDENSE_REUSE_SIMILARITY = 0.9
 
 
-def get_qa_chain():
-    vectordb = Chroma(
-        persist_directory=CHROMA_DB_DIR,
-        embedding_function=embeddings,
-        collection_name="docs_collection",
-    )
+def llm_config_error():
+    """Why the LLM cannot be used, or None if its credentials are configured"""
+    if not OPENAI_API_KEY:
+        return "GROQ_API_KEY not found in environment variables. Please check your .env file."
+    if not OPENAI_API_BASE:
+        return "GROQ_API_BASE not found in environment variables. Please check your .env file."
+    return None
 
-    print(f"Number of embedded documents: {vectordb._collection.count()}")
-    retriever = vectordb.as_retriever(search_kwargs={"k": 3})
 
+def needs_condensing(question):
+    """Fast local check whether a follow-up question depends on the chat history"""
+    text = question.strip().lower()
+    words = re.findall(r"[a-z']+", text)
+    if len(words) < 3 or text.startswith(FOLLOW_UP_PREFIXES):
+        return True
+    return any(word in FOLLOW_UP_WORDS for word in words)
 
-    llm = ChatOpenAI(
-        model="llama-3.1-8b-instant",
-        api_key=SecretStr(OPENAI_API_KEY) if OPENAI_API_KEY else None,
-        base_url=OPENAI_API_BASE,
-        temperature=0.2,
-    )
 
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
-    conversation_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm, 
-        retriever=retriever, 
-        memory=memory, 
-        callbacks=[StdOutCallbackHandler()]
-    )
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
 
-    return conversation_chain
 
+class QAEngine:
+    """Process-wide QA engine that keeps the vector store, retrievers and LLM client alive
+    between questions and holds conversation memory per Gradio session."""
 
-def answer_question(question):
-    qa_chain = get_qa_chain()
-    result = qa_chain.invoke({"question": question})
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._retrievers = {}
+        self._llm = None
+        self._sessions = OrderedDict()
+        self.answer_cache = SemanticAnswerCache()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="qa")
+        self.condense_stats = {"follow_ups": 0, "skipped": 0, "condensed": 0, "raw_retrieval_reused": 0}
 
-    answer = result["answer"]
-    
+    def invalidate(self, source_path=None, namespace=DEFAULT_NAMESPACE):
+        """Drop a namespace's cached retriever and its answers built from source_path"""
+        with self._lock:
+            self._retrievers.pop(namespace, None)
+        self.answer_cache.invalidate(source_path, namespace)
+
+    def _get_retriever(self, namespace=DEFAULT_NAMESPACE):
+        vectordb = get_vectordb(namespace)
+        with self._lock:
+            retriever = self._retrievers.get(namespace)
+            if retriever is None:
+                print(f"Number of embedded documents in {namespace}: {vectordb._collection.count()}")
+                retriever = self._retrievers[namespace] = HybridRetriever(namespace=namespace)
+            return retriever
+
+    def _get_llm(self):
+        # A single ChatOpenAI client keeps its HTTP connection pool between requests
+        error = llm_config_error()
+        if error:
+            raise ValueError(error)
+        with self._lock:
+            if self._llm is None:
+                from langchain_openai import ChatOpenAI
+
+                self._llm = ChatOpenAI(
+                    model="llama-3.1-8b-instant",
+                    api_key=SecretStr(OPENAI_API_KEY) if OPENAI_API_KEY else None,
+                    base_url=OPENAI_API_BASE,
+                    temperature=0.2,
+                )
+            return self._llm
+
+    def _get_session(self, session_id):
+        """Return (memory, lock) for a session, evicting the least recently used one"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                from langchain.memory import ConversationBufferMemory
+
+                memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
+                session = (memory, threading.Lock())
+                self._sessions[session_id] = session
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def _count(self, *keys):
+        with self._lock:
+            for key in keys:
+                self.condense_stats[key] += 1
+        for key in keys:
+            metrics.inc("qa_condense_total", outcome=key)
+
+    def _condense_and_retrieve(self, question, chat_history, llm, namespace):
+        """Return (standalone question, retrieved documents or None).
+
+        Standalone-looking follow-ups skip the condense call. Otherwise retrieval for the raw
+        question runs while the LLM condenses it, and its results are kept if the condensed
+        question turns out to mean the same thing."""
+        self._count("follow_ups")
+        if not needs_condensing(question):
+            self._count("skipped")
+            return question, None
+
+        from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+
+        self._count("condensed")
+        raw_docs = self._executor.submit(
+            contextvars.copy_context().run, self._get_retriever(namespace).invoke, question
+        )
+        with metrics.span("qa.condense"):
+            standalone_question = llm.invoke(
+                CONDENSE_QUESTION_PROMPT.format(chat_history=get_buffer_string(chat_history), question=question)
+            ).content
+        embeddings = get_embeddings()
+        if _cosine(embeddings.embed_query(question), embeddings.embed_query(standalone_question)) >= CONDENSE_REUSE_SIMILARITY:
+            self._count("raw_retrieval_reused")
+            return standalone_question, raw_docs.result()
+        raw_docs.cancel()
+        return standalone_question, None
+
+    def get_condense_stats(self):
+        with self._lock:
+            return dict(self.condense_stats)
+
+    def stream_answer(self, question, session_id="default", info=None, namespace=DEFAULT_NAMESPACE):
+        """Yield answer tokens as they arrive from the LLM.
+
+        Follows ConversationalRetrievalChain: condense the follow-up into a standalone
+        question, retrieve for it from namespace, then stream the answer to the stuffed
+        context. Answers to near-duplicate standalone questions come from the semantic answer
+        cache; info, if given, is filled with whether the answer was cached and the sources used."""
+        info = {} if info is None else info
+        namespace = normalize_namespace(namespace)
+        memory, session_lock = self._get_session(session_id)
+        llm = self._get_llm()
+        started = time.perf_counter()
+        # Questions from the same session are serialized so their history stays ordered
+        with metrics.trace(), metrics.span("qa.total") as total_span, session_lock:
+            # Old turns beyond the history budget are dropped so long sessions stay bounded
+            chat_history, history_tokens = fit_history(memory.load_memory_variables({})["chat_history"])
+            standalone_question, docs = question, None
+            if chat_history:
+                standalone_question, docs = self._condense_and_retrieve(question, chat_history, llm, namespace)
+            else:
+                history_tokens = 0
+
+            with metrics.span("qa.answer_cache"):
+                question_vector = get_embeddings().embed_query(standalone_question)
+                cached = self.answer_cache.get(question_vector, namespace)
+            if cached is not None:
+                info.update(cached=True, sources=sorted(cached["sources"]))
+                total_span["cached"] = True
+                metrics.inc("qa_questions_total", cached="true")
+                memory.save_context({"question": question}, {"answer": cached["answer"]})
+                print(f"Answer cache hit in {(time.perf_counter() - started) * 1000:.1f}ms "
+                      f"(similarity {cached['similarity']:.3f})")
+                yield cached["answer"]
+                return
+
+            if docs is None:
+                with metrics.span("qa.retrieval"):
+                    docs = self._get_retriever(namespace).invoke(standalone_question)
+            from langchain.chains.question_answering.stuff_prompt import CHAT_PROMPT
+
+            sources = {doc.metadata.get("source_path", "") for doc in docs}
+            context, context_tokens, _ = build_context(docs)
+            messages = CHAT_PROMPT.format_messages(context=context, question=standalone_question)
+            question_tokens = count_tokens(standalone_question)
+            metrics.inc("llm_prompt_tokens_total", context_tokens, part="context")
+            metrics.inc("llm_prompt_tokens_total", question_tokens, part="question")
+            metrics.inc("llm_prompt_tokens_total", history_tokens, part="history")
+            print(f"Prompt tokens: {context_tokens} context, {question_tokens} question, {history_tokens} history")
+
+            first_token_at = None
+            parts = []
+            with metrics.span("qa.generate") as generate_span:
+                for chunk in llm.stream(messages):
+                    if not chunk.content:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        metrics.observe("qa_time_to_first_token_seconds", first_token_at - started)
+                    parts.append(chunk.content)
+                    yield chunk.content
+                generate_span["chunks"] = len(docs)
+
+            answer = "".join(parts)
+            memory.save_context({"question": question}, {"answer": answer})
+            self.answer_cache.put(question_vector, standalone_question, answer, sources, namespace)
+            info.update(cached=False, sources=sorted(sources))
+            total_span["cached"] = False
+            metrics.inc("qa_questions_total", cached="false")
+
+        total = time.perf_counter() - started
+        ttft = (first_token_at or time.perf_counter()) - started
+        print(f"Answered in {total:.2f}s (time to first token {ttft:.2f}s)")
+        stats = self.get_condense_stats()
+        print(
+            f"Condense calls avoided for {stats['skipped']}/{stats['follow_ups']} follow-ups, "
+            f"raw retrieval reused {stats['raw_retrieval_reused']}/{stats['condensed']} times"
+        )
+        print(get_embeddings().format_stats())
+
+    async def answer_batch(self, questions, concurrency=BATCH_LLM_CONCURRENCY, namespace=DEFAULT_NAMESPACE):
+        """Answer independent questions (no chat history) from one namespace together.
+
+        The questions are embedded in one batch and retrieved together on a worker thread,
+        then the LLM calls run concurrently through the async client, at most concurrency at
+        a time, so the event loop is never blocked. Returns one {"answer", "sources", "cached"}
+        dict per question, or {"error"} if that question failed."""
+        from langchain.chains.question_answering.stuff_prompt import CHAT_PROMPT
+
+        namespace = normalize_namespace(namespace)
+        llm = self._get_llm()
+        results = [None] * len(questions)
+        with metrics.trace(), metrics.span("qa.batch", questions=len(questions)):
+            vectors = await asyncio.to_thread(get_embeddings().embed_queries, questions)
+            pending = []
+            for i, vector in enumerate(vectors):
+                cached = self.answer_cache.get(vector, namespace)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    results[i] = {"answer": cached["answer"], "sources": sorted(cached["sources"]), "cached": True}
+                    metrics.inc("qa_questions_total", cached="true")
+
+            with metrics.span("qa.retrieval", questions=len(pending)):
+                retrieved = await asyncio.to_thread(retrieve_many, [questions[i] for i in pending], namespace=namespace)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def generate(i, docs):
+                sources = {doc.metadata.get("source_path", "") for doc in docs}
+                context, _, _ = build_context(docs)
+                messages = CHAT_PROMPT.format_messages(context=context, question=questions[i])
+                try:
+                    async with semaphore:
+                        with metrics.span("qa.generate", chunks=len(docs)):
+                            response = await llm.ainvoke(messages)
+                except Exception as e:
+                    print(f"Error answering batch question {i}: {str(e)}")
+                    results[i] = {"error": str(e)}
+                    return
+                self.answer_cache.put(vectors[i], questions[i], response.content, sources, namespace)
+                results[i] = {"answer": response.content, "sources": sorted(sources), "cached": False}
+                metrics.inc("qa_questions_total", cached="false")
+
+            await asyncio.gather(*(generate(i, docs) for i, docs in zip(pending, retrieved)))
+        return results
+
+    def warm_up(self):
+        """Load the prompt and memory classes and create the retriever and LLM client ahead of the first question"""
+        from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+        from langchain.chains.question_answering.stuff_prompt import CHAT_PROMPT
+        from langchain.memory import ConversationBufferMemory
+
+        # Used once here, so the first question does not pay for their imports and validators
+        CONDENSE_QUESTION_PROMPT.format(chat_history="", question="")
+        CHAT_PROMPT.format_messages(context="", question="")
+        ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
+
+        self._get_retriever()
+        self._get_llm()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the shared QAEngine, creating it on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = QAEngine()
+            on_collection_change(_engine.invalidate)
+        return _engine
+
+
+def format_answer(answer, complete=True, cached=False):
     # Format the answer for better markdown display
+    footer = ""
+    if complete and cached:
+        footer = "---\n*⚡ Cached answer to a previously asked question*"
+    elif complete:
+        footer = "---\n*Generated using AI-powered document analysis*"
     formatted_answer = f"""
 ## Answer
 
 {answer}
 
----
-*Generated using AI-powered document analysis*
+{footer}
 """
     
     return formatted_answer
+
+
+def answer_question_stream(question, session_id="default", namespace=DEFAULT_NAMESPACE):
+    """Yield the markdown answer as it grows, token by token"""
+    info = {}
+    answer = ""
+    for token in get_engine().stream_answer(question, session_id, info, namespace=namespace):
+        answer += token
+        yield format_answer(answer, complete=False)
+    yield format_answer(answer, cached=info.get("cached", False))
+
+
+metrics.describe("qa_time_to_first_token_seconds", "Time from question to the first streamed answer token")
+metrics.describe("qa_questions_total", "Questions answered, by whether the answer cache was hit")
+metrics.describe("qa_condense_total", "Follow-up questions by condensing outcome")
+metrics.describe("llm_prompt_tokens_total", "Prompt tokens sent to the LLM, by prompt part")
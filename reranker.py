@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "200"))
+PROBE_EVERY = 20
+
+
+class Reranker:
+    """CPU cross-encoder that reorders first-stage candidates within a latency budget.
+
+    The per-pair cost is tracked as a moving average. If scoring all candidates is expected
+    to exceed the budget, or scoring runs over it part way, the first-stage order is kept."""
+
+    def __init__(self, model_name=RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self._lock = threading.Lock()
+        self._model = None
+        self._ms_per_pair = None
+        self._skipped = 0
+        self.stats = {"queries": 0, "reranked": 0, "fallbacks": 0, "pairs": 0, "total_ms": 0.0}
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                started = time.perf_counter()
+                self._model = CrossEncoder(self.model_name, device="cpu")
+                print(f"Loaded reranker {self.model_name} in {time.perf_counter() - started:.2f}s")
+            return self._model
+
+    def load(self):
+        """Load the cross-encoder now rather than on the first query"""
+        self._get_model()
+
+    def _record(self, reranked, pairs, elapsed_ms):
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["reranked" if reranked else "fallbacks"] += 1
+            self.stats["pairs"] += pairs
+            self.stats["total_ms"] += elapsed_ms
+            if pairs:
+                cost = elapsed_ms / pairs
+                self._ms_per_pair = cost if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * cost
+
+    def rerank(self, query, docs, top_n):
+        """Return (top_n documents, cost report) for the query"""
+        if len(docs) <= 1:
+            return docs[:top_n], {"reranked": False, "pairs": 0, "ms": 0.0, "reason": "too few candidates"}
+
+        with self._lock:
+            over_budget = self._ms_per_pair is not None and self._ms_per_pair * len(docs) > self.budget_ms
+            # Re-measure now and then so a transient slowdown does not disable reranking for good
+            if over_budget:
+                self._skipped += 1
+                if self._skipped >= PROBE_EVERY:
+                    self._skipped = 0
+                    over_budget = False
+        if over_budget:
+            self._record(False, 0, 0.0)
+            return docs[:top_n], {"reranked": False, "pairs": 0, "ms": 0.0, "reason": "over budget (estimated)"}
+
+        model = self._get_model()
+        started = time.perf_counter()
+        scores = []
+        for i in range(0, len(docs), self.batch_size):
+            batch = docs[i:i + self.batch_size]
+            scores.extend(model.predict([(query, doc.page_content) for doc in batch], batch_size=self.batch_size))
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms > self.budget_ms and len(scores) < len(docs):
+                self._record(False, len(scores), elapsed_ms)
+                return docs[:top_n], {"reranked": False, "pairs": len(scores), "ms": elapsed_ms, "reason": "over budget"}
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._record(True, len(docs), elapsed_ms)
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[:top_n]], {"reranked": True, "pairs": len(docs), "ms": elapsed_ms}
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, ms_per_pair=self._ms_per_pair)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Return the shared Reranker, creating it on first use"""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
@@ -0,0 +1,119 @@
+import os
+import threading
+from typing import List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+import metrics
+from lexical_index import get_lexical_index
+from namespaces import DEFAULT_NAMESPACE
+from reranker import get_reranker
+from vectorstore import get_embeddings, get_vectordb
+
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+# Candidates taken from each of the dense and lexical rankings before fusion
+FUSION_CANDIDATES = int(os.getenv("FUSION_CANDIDATES", "20"))
+# Standard reciprocal rank fusion constant
+RRF_K = 60
+# Fused candidates handed to the cross-encoder, which narrows them down to RETRIEVAL_K
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+
+_backfill_lock = threading.Lock()
+# Namespaces whose lexical index has been checked against their collection
+_backfilled = set()
+
+
+def _ensure_lexical_index(collection, namespace):
+    """Build a namespace's lexical index from Chroma once if it is missing, e.g. for an older chroma_db"""
+    with _backfill_lock:
+        if namespace in _backfilled:
+            return
+        index = get_lexical_index(namespace)
+        if index.count() == 0 and collection.count() > 0:
+            index.rebuild_from_collection(collection)
+        _backfilled.add(namespace)
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """Fuse several ranked ID lists into one, scoring each ID by sum(1 / (rrf_k + rank))"""
+    scores = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def hybrid_search_many(questions, k=RETRIEVAL_K, candidates=FUSION_CANDIDATES, namespace=DEFAULT_NAMESPACE):
+    """Retrieve the top k chunks of a namespace for each question by fusing dense and BM25 rankings.
+
+    All questions are embedded in one batch and share one Chroma query and one fetch of
+    lexical-only hits."""
+    if not questions:
+        return []
+    collection = get_vectordb(namespace)._collection
+    _ensure_lexical_index(collection, namespace)
+
+    with metrics.span("retrieval.query_embedding", questions=len(questions)):
+        question_vectors = get_embeddings().embed_queries(questions)
+    with metrics.span("retrieval.dense_search", questions=len(questions)):
+        dense = collection.query(
+            query_embeddings=question_vectors,
+            n_results=candidates,
+            include=["documents", "metadatas"],
+        )
+    found = {}
+    for ids, texts, metadatas in zip(dense["ids"], dense["documents"], dense["metadatas"]):
+        for id, text, metadata in zip(ids, texts, metadatas):
+            found[id] = Document(page_content=text, metadata=metadata or {}, id=id)
+    with metrics.span("retrieval.lexical_search", questions=len(questions)):
+        lexical = [get_lexical_index(namespace).search(question, k=candidates) for question in questions]
+
+    fused = [reciprocal_rank_fusion([dense_ids, lexical_ids])[:k] for dense_ids, lexical_ids in zip(dense["ids"], lexical)]
+    missing = list({id for ids in fused for id in ids if id not in found})
+    if missing:
+        with metrics.span("retrieval.fetch_lexical_hits"):
+            result = collection.get(ids=missing, include=["documents", "metadatas"])
+        for id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+            found[id] = Document(page_content=text, metadata=metadata or {}, id=id)
+    # An ID can be missing from Chroma if the lexical index briefly lags a delete
+    return [[found[id] for id in ids if id in found] for ids in fused]
+
+
+def _rerank(question, candidates, k):
+    with metrics.span("retrieval.rerank") as rerank_span:
+        docs, report = get_reranker().rerank(question, candidates, top_n=k)
+        rerank_span.update(report)
+    metrics.inc("rerank_queries_total", outcome="reranked" if report["reranked"] else "fallback")
+    metrics.inc("rerank_pairs_total", report["pairs"])
+    if report["reranked"]:
+        print(f"Reranked {report['pairs']} candidates in {report['ms']:.1f}ms")
+    else:
+        print(f"Kept first-stage order ({report['reason']}, {report['pairs']} pairs, {report['ms']:.1f}ms)")
+    return docs
+
+
+def retrieve_many(questions, k=RETRIEVAL_K, namespace=DEFAULT_NAMESPACE):
+    """Over-fetch fused candidates for each question together and rerank them down to the top k"""
+    if not RERANK_ENABLED:
+        return hybrid_search_many(questions, k=k, namespace=namespace)
+
+    candidates = hybrid_search_many(questions, k=RERANK_CANDIDATES, candidates=RERANK_CANDIDATES, namespace=namespace)
+    return [_rerank(question, docs, k) for question, docs in zip(questions, candidates)]
+
+
+def retrieve(question, k=RETRIEVAL_K, namespace=DEFAULT_NAMESPACE):
+    """Over-fetch fused candidates and rerank them down to the top k"""
+    return retrieve_many([question], k=k, namespace=namespace)[0]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever fusing dense Chroma search with the BM25 lexical index, then reranking"""
+
+    k: int = RETRIEVAL_K
+    namespace: str = DEFAULT_NAMESPACE
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return retrieve(query, k=self.k, namespace=self.namespace)
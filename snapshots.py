@@ -0,0 +1,406 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+import numpy as np
+from hnsw_index import all_ids, discard_staging, index_maintenance, index_settings, staging_collection, swap_in
+from jobs import JobCancelled, get_job_queue
+from ingestion import chunk_id
+from lexical_index import discard_staging_lexical_index, get_lexical_index, staging_lexical_index
+from namespaces import DEFAULT_NAMESPACE, create_namespace, normalize_namespace
+from source_registry import get_source_registry
+from sources import upload_dir
+from vectorstore import (
+    EMBEDDING_TAG,
+    LEGACY_EMBEDDING_MODEL,
+    collection_write_lock,
+    get_vectordb,
+    notify_collection_change,
+    track_writes,
+)
+
+SNAPSHOT_DIR = "./snapshots"
+# float16 halves the file; embeddings are unit length, so the rounding barely moves rankings
+SNAPSHOT_DTYPE = os.getenv("SNAPSHOT_DTYPE", "float16")
+SNAPSHOT_DTYPES = ("float16", "float32")
+
+# A snapshot file is SNAPSHOT_MAGIC, the header length (8 bytes, little-endian), the JSON header,
+# zero padding up to a multiple of SNAPSHOT_ALIGNMENT, the vectors as a raw little-endian
+# count x dim array (so they can be memory-mapped), and last the zlib-compressed JSON records:
+# chunk ids, texts and metadata in vector order, plus the source registry
+SNAPSHOT_MAGIC = b"DDSNAP01"
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_ALIGNMENT = 64
+
+_save_lock = threading.Lock()
+
+
+def _align(offset):
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+def _sha256(data, block=1 << 24):
+    digest = hashlib.sha256()
+    view = memoryview(data).cast("B")
+    for start in range(0, len(view), block):
+        digest.update(view[start:start + block])
+    return digest.hexdigest()
+
+
+class Snapshot:
+    """A snapshot file opened for reading. vectors is memory-mapped, so opening a snapshot reads
+    only its header; records() decompresses the chunk texts, metadata and source registry."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a snapshot file")
+            length = int.from_bytes(f.read(8), "little")
+            self.header = json.loads(f.read(length))
+        if self.header.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} has snapshot format {self.header.get('format')}, expected {SNAPSHOT_FORMAT}")
+        self._data_offset = _align(len(SNAPSHOT_MAGIC) + 8 + length)
+        dtype = np.dtype(self.header["dtype"]).newbyteorder("<")
+        shape = (self.header["count"], self.header["dim"])
+        if self.header["count"]:
+            self.vectors = np.memmap(path, dtype=dtype, mode="r", offset=self._data_offset, shape=shape)
+        else:
+            self.vectors = np.zeros(shape, dtype=dtype)
+
+    def _records_payload(self):
+        with open(self.path, "rb") as f:
+            f.seek(self._data_offset + self.header["vectors_bytes"])
+            return f.read(self.header["records_bytes"])
+
+    def records(self):
+        return json.loads(zlib.decompress(self._records_payload()))
+
+    def verify(self):
+        """Raise ValueError if the file was truncated or corrupted"""
+        if _sha256(self.vectors) != self.header["vectors_sha256"]:
+            raise ValueError(f"{self.path}: vector checksum mismatch")
+        if _sha256(self._records_payload()) != self.header["records_sha256"]:
+            raise ValueError(f"{self.path}: record checksum mismatch")
+
+
+def _read_chunks(collection, ids, batch_size=1000, progress=None, cancel_event=None):
+    """{id: (vector, text, metadata)} of the given chunks that are still in a collection"""
+    chunks = {}
+    for start in range(0, len(ids), batch_size):
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled()
+        result = collection.get(ids=ids[start:start + batch_size], include=["embeddings", "documents", "metadatas"])
+        for id, vector, text, metadata in zip(result["ids"], result["embeddings"], result["documents"], result["metadatas"]):
+            chunks[id] = (vector, text, metadata or {})
+        if progress is not None:
+            progress(chunks_processed=len(chunks))
+    return chunks
+
+
+def _registry_records(namespace, metadatas):
+    """Registry records of the sources in a snapshot, with chunk counts taken from its chunks"""
+    registry = get_source_registry(namespace)
+    records = {}
+    for metadata in metadatas:
+        path = metadata.get("source_path", "")
+        record = records.get(path)
+        if record is None:
+            # Sources whose ingestion was still finishing may not have a record yet
+            record = records[path] = registry.get(path) or {
+                "source_path": path,
+                "source_type": metadata.get("source_type", "file"),
+                "content_hash": None,
+                "embedding_model": metadata.get("embedding_model", LEGACY_EMBEDDING_MODEL),
+                "ingested_at": time.time(),
+            }
+            record["chunk_count"] = 0
+        record["chunk_count"] += 1
+    return list(records.values())
+
+
+def export_snapshot(path, namespace=DEFAULT_NAMESPACE, dtype=SNAPSHOT_DTYPE, batch_size=1000, progress=None, cancel_event=None):
+    """Write a namespace's chunks, vectors and source registry to a snapshot file.
+
+    Safe while the app is serving: chunks are read without blocking anything while the ids of
+    chunks written or deleted meanwhile are tracked, then writes are held only while those are
+    read again, so the snapshot matches the collection at one point in time. Returns the
+    snapshot header."""
+    namespace = normalize_namespace(namespace)
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Unknown snapshot dtype {dtype!r}, expected one of {', '.join(SNAPSHOT_DTYPES)}")
+    started = time.perf_counter()
+    with track_writes(namespace) as written:
+        collection = get_vectordb(namespace)._collection
+        chunks = _read_chunks(collection, all_ids(collection), batch_size, progress, cancel_event)
+        with collection_write_lock(namespace):
+            collection = get_vectordb(namespace)._collection
+            written = sorted(written)
+            for id in written:
+                chunks.pop(id, None)
+            chunks.update(_read_chunks(collection, written, batch_size))
+            if len(chunks) != collection.count():
+                raise RuntimeError(f"Snapshot has {len(chunks)} chunks, expected {collection.count()}")
+            sources = _registry_records(namespace, [metadata for _, _, metadata in chunks.values()])
+            settings = index_settings(namespace)["hnsw"]
+
+    ids = list(chunks)
+    dim = len(chunks[ids[0]][0]) if ids else 0
+    vectors = np.asarray([chunks[id][0] for id in ids], dtype=np.dtype(dtype).newbyteorder("<")).reshape(len(ids), dim)
+    payload = zlib.compress(json.dumps({
+        "ids": ids,
+        "documents": [chunks[id][1] for id in ids],
+        "metadatas": [chunks[id][2] for id in ids],
+        "sources": sources,
+    }).encode("utf-8"))
+    models = {}
+    for _, _, metadata in chunks.values():
+        tag = metadata.get("embedding_model", LEGACY_EMBEDDING_MODEL)
+        models[tag] = models.get(tag, 0) + 1
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "created_at": time.time(),
+        "namespace": namespace,
+        "hnsw": settings,
+        "embedding_models": models,
+        "count": len(ids),
+        "dim": dim,
+        "dtype": dtype,
+        "vectors_bytes": vectors.nbytes,
+        "vectors_sha256": _sha256(vectors),
+        "records_bytes": len(payload),
+        "records_sha256": _sha256(payload),
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Written next to the target and renamed, so a snapshot file is never seen half-written
+    try:
+        with open(path + ".tmp", "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(vectors.tobytes())
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+    except BaseException:
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+        raise
+    print(
+        f"Exported {len(ids)} chunks of namespace {namespace} to {path} "
+        f"({os.path.getsize(path) / (1024 * 1024):.1f} MB, {dtype}) in {time.perf_counter() - started:.2f}s."
+    )
+    return header
+
+
+def _check_embedding_models(header, force):
+    others = {tag: count for tag, count in header["embedding_models"].items() if tag != EMBEDDING_TAG}
+    if others and not force:
+        details = ", ".join(f"{count} chunks from {tag}" for tag, count in others.items())
+        raise ValueError(f"Snapshot has {details}, but questions are embedded with {EMBEDDING_TAG}")
+
+
+def _move_uploads(records, origin, namespace):
+    """Point the sources a snapshot has from the origin namespace's upload directory at the target
+    namespace's, re-deriving their chunk ids, so they can be managed and re-ingested there"""
+    old_dir, new_dir = upload_dir(origin), upload_dir(namespace)
+    if old_dir == new_dir:
+        return
+
+    def moved(path):
+        return os.path.join(new_dir, os.path.basename(path)) if os.path.dirname(path) == old_dir else path
+
+    for i, (metadata, text) in enumerate(zip(records["metadatas"], records["documents"])):
+        path = (metadata or {}).get("source_path", "")
+        if moved(path) != path:
+            metadata["source_path"] = moved(path)
+            if metadata.get("source") == path:
+                metadata["source"] = metadata["source_path"]
+            records["ids"][i] = chunk_id(metadata["source_path"], text)
+    for record in records["sources"]:
+        record["source_path"] = moved(record["source_path"])
+
+
+def import_snapshot(path, namespace=None, force=False, batch_size=1000, progress=None, cancel_event=None):
+    """Replace a namespace's chunks, lexical index and source registry with a snapshot's, without
+    re-embedding anything. namespace defaults to the one the snapshot was taken from.
+
+    The collection and lexical index are bulk-loaded under staging names with the snapshot's HNSW
+    settings and swapped in like a rebuilt index, so questions keep being answered meanwhile and
+    writes are held only for the swap. Raises ValueError if the chunks were embedded by another
+    model than the current one, unless force."""
+    started = time.perf_counter()
+    snapshot = Snapshot(path)
+    snapshot.verify()
+    header = snapshot.header
+    namespace = normalize_namespace(namespace or header["namespace"])
+    _check_embedding_models(header, force)
+    records = snapshot.records()
+    _move_uploads(records, header["namespace"], namespace)
+
+    create_namespace(namespace)
+    with index_maintenance(namespace):
+        staging = staging_collection(namespace, header["hnsw"])
+        lexical_staging = staging_lexical_index(namespace)
+        try:
+            for start in range(0, header["count"], batch_size):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+                end = min(start + batch_size, header["count"])
+                metadatas = records["metadatas"][start:end]
+                staging.add(
+                    ids=records["ids"][start:end],
+                    embeddings=np.asarray(snapshot.vectors[start:end], dtype=np.float32),
+                    documents=records["documents"][start:end],
+                    metadatas=[metadata or None for metadata in metadatas],
+                )
+                lexical_staging.add(
+                    records["ids"][start:end],
+                    records["documents"][start:end],
+                    [(metadata or {}).get("source_path", "") for metadata in metadatas],
+                )
+                if progress is not None:
+                    progress(chunks_processed=end, chunks_added=end)
+            lexical_staging.close()
+            with collection_write_lock(namespace):
+                swap_in(namespace, staging)
+                get_source_registry(namespace).replace_all(records["sources"])
+                get_lexical_index(namespace).replace_with(lexical_staging.path)
+        except BaseException:
+            discard_staging(namespace)
+            lexical_staging.close()
+            discard_staging_lexical_index(lexical_staging.path)
+            raise
+    notify_collection_change(namespace=namespace)
+    print(
+        f"Imported {header['count']} chunks from {path} into namespace {namespace} "
+        f"in {time.perf_counter() - started:.2f}s."
+    )
+    return header
+
+
+def snapshot_path(namespace=DEFAULT_NAMESPACE):
+    """New file name in SNAPSHOT_DIR for a snapshot of a namespace"""
+    return os.path.join(SNAPSHOT_DIR, f"{normalize_namespace(namespace)}-{time.strftime('%Y%m%d-%H%M%S')}.snap")
+
+
+def snapshot_file(name):
+    """Path of a snapshot in SNAPSHOT_DIR by file name, or None if there is no such snapshot"""
+    path = os.path.join(SNAPSHOT_DIR, os.path.basename(name))
+    return path if name.endswith(".snap") and os.path.isfile(path) else None
+
+
+def save_snapshot(source, filename):
+    """Copy an uploaded snapshot (a binary file object) into SNAPSHOT_DIR and return its path.
+    A name already taken gets a numbered suffix, so no snapshot is ever overwritten. Raises
+    ValueError, keeping nothing, if it is not a snapshot file."""
+    name = os.path.basename(filename or "") or "upload"
+    stem = name[:-len(".snap")] if name.endswith(".snap") else name
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    # Checked under a temporary name, so an invalid upload never touches an existing snapshot
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=SNAPSHOT_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(source, f)
+        try:
+            Snapshot(tmp_path)
+        except (ValueError, KeyError):
+            raise ValueError(f"{name} is not a snapshot file")
+        with _save_lock:
+            path = os.path.join(SNAPSHOT_DIR, stem + ".snap")
+            suffix = 1
+            while os.path.exists(path):
+                path = os.path.join(SNAPSHOT_DIR, f"{stem}-{suffix}.snap")
+                suffix += 1
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def list_snapshots():
+    """Name, size and header summary of every snapshot in SNAPSHOT_DIR, newest first"""
+    snapshots = []
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return snapshots
+    for name in os.listdir(SNAPSHOT_DIR):
+        path = os.path.join(SNAPSHOT_DIR, name)
+        if not name.endswith(".snap"):
+            continue
+        try:
+            header = Snapshot(path).header
+        except (OSError, ValueError) as e:
+            print(f"Skipping unreadable snapshot {path}: {str(e)}")
+            continue
+        snapshots.append({
+            "name": name,
+            "bytes": os.path.getsize(path),
+            **{key: header[key] for key in ("namespace", "created_at", "count", "dim", "dtype", "embedding_models", "hnsw")},
+        })
+    return sorted(snapshots, key=lambda snapshot: snapshot["created_at"], reverse=True)
+
+
+def submit_snapshot_export(namespace=DEFAULT_NAMESPACE, dtype=SNAPSHOT_DTYPE):
+    """Queue a snapshot export in the background, returning (job id, snapshot path)"""
+    namespace = normalize_namespace(namespace)
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Unknown snapshot dtype {dtype!r}, expected one of {', '.join(SNAPSHOT_DTYPES)}")
+    path = snapshot_path(namespace)
+
+    def run(progress, cancel_event):
+        return export_snapshot(path, namespace, dtype, progress=progress, cancel_event=cancel_event)
+
+    return get_job_queue().submit("snapshot_export", path, run), path
+
+
+def submit_snapshot_import(path, namespace=None, force=False):
+    """Queue a snapshot import in the background, returning the job id. A snapshot embedded by
+    another model raises ValueError before anything is queued, unless force."""
+    _check_embedding_models(Snapshot(path).header, force)
+    namespace = normalize_namespace(namespace) if namespace else None
+
+    def run(progress, cancel_event):
+        return import_snapshot(path, namespace, force=force, progress=progress, cancel_event=cancel_event)
+
+    return get_job_queue().submit("snapshot_import", path, run)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export or import a namespace snapshot. While app.py is running, use the "
+                    "/api/snapshots endpoints instead, so its writes are held during the snapshot."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write a namespace to a snapshot file")
+    export_parser.add_argument("--namespace", default=DEFAULT_NAMESPACE)
+    export_parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default=SNAPSHOT_DTYPE)
+    export_parser.add_argument("--output", help=f"snapshot file (default: a new file in {SNAPSHOT_DIR})")
+    import_parser = commands.add_parser("import", help="replace a namespace with a snapshot's contents")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--namespace", help="target namespace (default: the snapshot's)")
+    import_parser.add_argument("--force", action="store_true", help="import chunks embedded by another model")
+    info_parser = commands.add_parser("info", help="print a snapshot's header and verify its checksums")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_snapshot(args.output or snapshot_path(args.namespace), args.namespace, args.dtype)
+    elif args.command == "import":
+        import_snapshot(args.path, args.namespace, force=args.force)
+    else:
+        snapshot = Snapshot(args.path)
+        snapshot.verify()
+        print(json.dumps(snapshot.header, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+import time
+import metrics
+from namespaces import DEFAULT_NAMESPACE, HandleCache, list_namespaces, namespace_path
+from vectorstore import EMBEDDING_TAG, LEGACY_EMBEDDING_MODEL, collection_name
+
+SOURCE_REGISTRY_PATH = "./sources.db"
+
+
+class SourceRegistry:
+    """One row per ingested file or URL of a namespace, kept in step with its collection by ingestion.
+
+    Records the source type, content hash, chunk count, embedding model tag and ingest time,
+    so listing sources never scans the upload directory or the collection."""
+
+    def __init__(self, path=SOURCE_REGISTRY_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS sources (
+                source_path TEXT PRIMARY KEY,
+                source_type TEXT NOT NULL,
+                content_hash TEXT,
+                chunk_count INTEGER NOT NULL,
+                embedding_model TEXT,
+                ingested_at REAL NOT NULL
+            )"""
+        )
+        # Serves the per-type listings in source_path order, so pages never need a sort
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sources_type_path ON sources (source_type, source_path)")
+        self._conn.commit()
+
+    def upsert(self, source_path, source_type, content_hash, chunk_count, embedding_model):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources "
+                "(source_path, source_type, content_hash, chunk_count, embedding_model, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (source_path, source_type, content_hash, chunk_count, embedding_model, time.time()),
+            )
+
+    def remove(self, source_path):
+        """Delete a source's record, returning whether it existed"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sources WHERE source_path = ?", (source_path,)).rowcount > 0
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sources")
+
+    def replace_all(self, records):
+        """Replace every record in one transaction, keeping their hashes and ingest times"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sources")
+            self._conn.executemany(
+                "INSERT INTO sources (source_path, source_type, content_hash, chunk_count, embedding_model, ingested_at) "
+                "VALUES (:source_path, :source_type, :content_hash, :chunk_count, :embedding_model, :ingested_at)",
+                records,
+            )
+
+    def get(self, source_path):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sources WHERE source_path = ?", (source_path,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, source_type=None, offset=0, limit=100):
+        """One page of source records ordered by path, optionally of a single type"""
+        with self._lock:
+            if source_type is None:
+                rows = self._conn.execute(
+                    "SELECT * FROM sources ORDER BY source_type, source_path LIMIT ? OFFSET ?", (limit, offset)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM sources WHERE source_type = ? ORDER BY source_path LIMIT ? OFFSET ?",
+                    (source_type, limit, offset),
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, source_type=None):
+        with self._lock:
+            if source_type is None:
+                return self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM sources WHERE source_type = ?", (source_type,)).fetchone()[0]
+
+    def embedding_models(self):
+        """Number of chunks per embedding model tag, summed over the sources"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT COALESCE(embedding_model, ?) AS model, SUM(chunk_count) FROM sources GROUP BY model",
+                (LEGACY_EMBEDDING_MODEL,),
+            ).fetchall()
+        return {model: count for model, count in rows}
+
+    def rebuild_from_collection(self, collection, batch_size=5000):
+        """Re-create every record from the chunk metadata stored in a Chroma collection"""
+        sources = {}
+        offset = 0
+        while True:
+            result = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not result["ids"]:
+                break
+            for metadata in result["metadatas"]:
+                metadata = metadata or {}
+                record = sources.setdefault(metadata.get("source_path", ""), {
+                    "source_type": metadata.get("source_type", "file"),
+                    "embedding_model": metadata.get("embedding_model", LEGACY_EMBEDDING_MODEL),
+                    "chunk_count": 0,
+                })
+                record["chunk_count"] += 1
+            offset += len(result["ids"])
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sources")
+            # The original content is not stored, so rebuilt records have no content hash
+            self._conn.executemany(
+                "INSERT INTO sources (source_path, source_type, content_hash, chunk_count, embedding_model, ingested_at) "
+                "VALUES (?, ?, NULL, ?, ?, ?)",
+                [
+                    (path, record["source_type"], record["chunk_count"], record["embedding_model"], now)
+                    for path, record in sources.items()
+                ],
+            )
+        print(f"Rebuilt source registry with {len(sources)} sources from {offset} chunks.")
+
+
+_registries = HandleCache(lambda namespace: SourceRegistry(namespace_path(namespace, SOURCE_REGISTRY_PATH)))
+
+
+def get_source_registry(namespace=DEFAULT_NAMESPACE):
+    """Return the SourceRegistry of a namespace, opening it on first use"""
+    return _registries.get(namespace)
+
+
+def check_embedding_models():
+    """Warning text if any namespace holds chunks from another embedding model than the current
+    one. Read from the registries, so the check takes the same time however many chunks there are."""
+    mixed = []
+    for namespace in list_namespaces():
+        counts = get_source_registry(namespace).embedding_models()
+        for tag, count in counts.items():
+            metrics.set_gauge("collection_chunks", count, namespace=namespace, embedding_model=tag)
+        others = {tag: count for tag, count in counts.items() if tag != EMBEDDING_TAG}
+        if others:
+            details = ", ".join(f"{count} chunks from {tag}" for tag, count in others.items())
+            mixed.append(f"{collection_name(namespace)} ({details})")
+    if not mixed:
+        return None
+    return (
+        f"Collections mix embedding models with the current {EMBEDDING_TAG}: {'; '.join(mixed)}; "
+        f"re-ingest those sources or clear the database."
+    )
+
+
+metrics.describe("collection_chunks", "Chunks in each namespace's collection per embedding model tag, as of the last check")
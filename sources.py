@@ -0,0 +1,203 @@
+import html
+import math
+import os
+import shutil
+from chunking import chunk_stats
+from context_builder import count_tokens
+from crawler import CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES, crawl_and_ingest
+from ingestion import delete_embeddings_by_source, load_and_ingest_file, load_and_ingest_url
+from jobs import get_job_queue
+from namespaces import DEFAULT_NAMESPACE, create_namespace, namespace_exists, namespace_path, normalize_namespace
+from source_registry import get_source_registry
+from vectorstore import get_vectordb
+
+# Uploads of the default namespace; other namespaces keep theirs in namespaces/<name>/uploads
+UPLOAD_DIR = "./uploads"
+# Sources per page in the Manage Data dropdowns and the API listing
+SOURCES_PAGE_SIZE = int(os.getenv("SOURCES_PAGE_SIZE", "100"))
+
+
+def upload_dir(namespace=DEFAULT_NAMESPACE):
+    return namespace_path(namespace, UPLOAD_DIR)
+
+
+def _upload_path(filename, namespace):
+    return os.path.join(upload_dir(namespace), os.path.basename(filename))
+
+
+def save_upload(source, filename, namespace=DEFAULT_NAMESPACE):
+    """Copy an uploaded file (a path or a binary file object) into the namespace's upload
+    directory and return its path"""
+    file_path = _upload_path(filename, create_namespace(namespace))
+    os.makedirs(upload_dir(namespace), exist_ok=True)
+    if isinstance(source, str):
+        shutil.copy2(source, file_path)
+    else:
+        with open(file_path, "wb") as f:
+            shutil.copyfileobj(source, f)
+    return file_path
+
+
+def submit_file_ingestion(file_path, namespace=DEFAULT_NAMESPACE):
+    """Queue an uploaded file for background ingestion, returning the job id"""
+    namespace = normalize_namespace(namespace)
+
+    def run(progress, cancel_event):
+        return load_and_ingest_file(file_path, progress=progress, cancel_event=cancel_event, namespace=namespace)
+
+    return get_job_queue().submit("file", file_path, run)
+
+
+def submit_url_ingestion(url, namespace=DEFAULT_NAMESPACE):
+    """Queue a URL for background ingestion, returning the job id"""
+    namespace = normalize_namespace(namespace)
+
+    def run(progress, cancel_event):
+        return load_and_ingest_url(url, progress=progress, cancel_event=cancel_event, namespace=namespace)
+
+    return get_job_queue().submit("url", url, run)
+
+
+def submit_crawl_ingestion(url, namespace=DEFAULT_NAMESPACE, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES):
+    """Queue a crawl of the site under url for background ingestion, returning the job id"""
+    namespace = normalize_namespace(namespace)
+
+    def run(progress, cancel_event):
+        return crawl_and_ingest(
+            url, namespace, max_depth=max_depth, max_pages=max_pages, progress=progress, cancel_event=cancel_event,
+        )
+
+    return get_job_queue().submit("crawl", url, run)
+
+
+def backfill_source_registry():
+    """Fill the registry from docs_collection if it is empty, e.g. for data ingested before it existed"""
+    registry = get_source_registry()
+    collection = get_vectordb()._collection
+    if registry.count() == 0 and collection.count() > 0:
+        registry.rebuild_from_collection(collection)
+
+
+def page_count(source_type, namespace=DEFAULT_NAMESPACE):
+    if not namespace_exists(namespace):
+        return 1
+    return max(1, math.ceil(get_source_registry(namespace).count(source_type) / SOURCES_PAGE_SIZE))
+
+
+def _page(source_type, page, namespace):
+    # A namespace typed into the UI is only created by its first ingestion
+    if not namespace_exists(namespace):
+        return []
+    return get_source_registry(namespace).list(
+        source_type, offset=(max(page, 1) - 1) * SOURCES_PAGE_SIZE, limit=SOURCES_PAGE_SIZE
+    )
+
+
+def get_saved_urls(page=1, namespace=DEFAULT_NAMESPACE) -> str:
+    urls = get_saved_urls_list(page, namespace)
+    if not urls:
+        return "<i>No URLs ingested yet.</i>"
+    return "".join(
+        f'<div style="margin: 2px 0; padding: 8px; border: 1px solid #ddd; border-radius: 5px; background-color: #f9f9f9;">'
+        f'<a href="{html.escape(url)}" target="_blank">{html.escape(url)}</a></div>'
+        for url in urls
+    )
+
+
+def get_saved_urls_list(page=1, namespace=DEFAULT_NAMESPACE):
+    """Get one page of ingested URLs for dropdown"""
+    return [record["source_path"] for record in _page("url", page, namespace)]
+
+
+def delete_url_by_url(url_to_delete: str, namespace=DEFAULT_NAMESPACE):
+    """Delete URL by its actual URL string and its embeddings"""
+    record = get_source_registry(namespace).get(url_to_delete) if namespace_exists(namespace) else None
+    if record is None or record["source_type"] != "url":
+        return f"URL not found: {url_to_delete}"
+    embeddings_result = delete_embeddings_by_source(url_to_delete, namespace)
+    return f"Deleted URL: {url_to_delete}\n{embeddings_result}"
+
+
+def delete_uploaded_file(filename: str, namespace=DEFAULT_NAMESPACE):
+    """Delete an uploaded file and its embeddings"""
+    try:
+        file_path = _upload_path(filename, namespace)
+        on_disk = os.path.exists(file_path)
+        if not on_disk and (not namespace_exists(namespace) or get_source_registry(namespace).get(file_path) is None):
+            return f"File not found: {filename}"
+        if on_disk:
+            os.remove(file_path)
+        embeddings_result = delete_embeddings_by_source(file_path, namespace)
+        return f"Deleted file: {filename}\n{embeddings_result}"
+    except Exception as e:
+        return f"Error deleting file: {str(e)}"
+
+
+def get_uploaded_files_list(page=1, namespace=DEFAULT_NAMESPACE):
+    """Get one page of uploaded file names for dropdown"""
+    return [os.path.basename(record["source_path"]) for record in _page("file", page, namespace)]
+
+
+def list_sources(source_type=None, offset=0, limit=SOURCES_PAGE_SIZE, namespace=DEFAULT_NAMESPACE):
+    """(one page of source records, total matching sources)"""
+    if not namespace_exists(namespace):
+        return [], 0
+    registry = get_source_registry(namespace)
+    return registry.list(source_type, offset=offset, limit=limit), registry.count(source_type)
+
+
+def delete_source(source, namespace=DEFAULT_NAMESPACE):
+    """Delete a source by path, URL or uploaded file name, with its embeddings; None if unknown"""
+    if not namespace_exists(namespace):
+        return None
+    registry = get_source_registry(namespace)
+    record = registry.get(source) or registry.get(_upload_path(source, namespace))
+    if record is None:
+        return None
+    source_path = record["source_path"]
+    if record["source_type"] == "url":
+        return delete_url_by_url(source_path, namespace)
+    if os.path.dirname(source_path) == upload_dir(namespace):
+        return delete_uploaded_file(os.path.basename(source_path), namespace)
+    return delete_embeddings_by_source(source_path, namespace)
+
+
+def clear_uploads(namespace=DEFAULT_NAMESPACE):
+    """Delete every uploaded file of a namespace, returning one line per file"""
+    directory = upload_dir(namespace)
+    result = ""
+    if os.path.exists(directory):
+        for filename in os.listdir(directory):
+            file_path = os.path.join(directory, filename)
+            if os.path.isfile(file_path):
+                try:
+                    os.remove(file_path)
+                    result += f"Deleted file: {filename}\n"
+                except Exception as e:
+                    result += f"Error deleting {filename}: {str(e)}\n"
+    return result
+
+
+def chunk_report(source_path=None, batch_size=5000, namespace=DEFAULT_NAMESPACE):
+    """Chunk count and token size distribution per source, plus totals, read from a namespace's collection"""
+    collection = get_vectordb(namespace)._collection
+    where = {"source_path": source_path} if source_path else None
+    tokens_by_source = {}
+    offset = 0
+    while True:
+        result = collection.get(where=where, include=["metadatas", "documents"], limit=batch_size, offset=offset)
+        if not result["ids"]:
+            break
+        for metadata, document in zip(result["metadatas"], result["documents"]):
+            metadata = metadata or {}
+            # Chunks from before token-sized chunking have no chunk_tokens
+            tokens = metadata.get("chunk_tokens")
+            if tokens is None:
+                tokens = count_tokens(document or "")
+            tokens_by_source.setdefault(metadata.get("source_path", ""), []).append(tokens)
+        offset += len(result["ids"])
+
+    return {
+        "sources": {path: chunk_stats(tokens) for path, tokens in sorted(tokens_by_source.items())},
+        "total": chunk_stats([tokens for counts in tokens_by_source.values() for tokens in counts]),
+    }
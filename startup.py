@@ -0,0 +1,110 @@
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+
+# Imported first by app.py, so phase times add up to the time since the app started loading
+STARTED_AT = time.perf_counter()
+
+_lock = threading.Lock()
+_phases = {}
+_state = {"warming": False, "ready": False, "error": None, "ready_after": None, "warnings": []}
+_thread = None
+
+
+def record_phase(name, seconds):
+    with _lock:
+        _phases[name] = seconds
+    metrics.set_gauge("startup_phase_seconds", seconds, phase=name)
+
+
+@contextmanager
+def phase(name):
+    """Time a startup phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+def _warm_up():
+    # Heavy modules are only imported here, off the thread that serves the UI
+    from qa_pipeline import get_engine, llm_config_error
+    from reranker import get_reranker
+    from retrieval import RERANK_ENABLED, retrieve
+    from hnsw_index import check_index_upgrades
+    from source_registry import check_embedding_models
+    from sources import backfill_source_registry
+    from vectorstore import get_embeddings
+
+    error = None
+    try:
+        with phase("embedding_model"):
+            # Run the model itself once, past the embedding cache, to pay its first-call cost now
+            get_embeddings().embeddings.embed_query("warm up")
+        with phase("vector_store"):
+            # Backfilled first: the registries tell us if any collection mixes embedding models.
+            # Opening the collections tells us if any still holds vectors stored before
+            # embeddings were normalized
+            backfill_source_registry()
+            warnings = [warning for warning in (check_embedding_models(), check_index_upgrades()) if warning]
+        for warning in warnings:
+            print(f"Warning: {warning}")
+            with _lock:
+                _state["warnings"].append(warning)
+        if RERANK_ENABLED:
+            with phase("reranker"):
+                get_reranker().load()
+        with phase("retrieval"):
+            # Loads the HNSW index into memory and backfills the lexical index if needed
+            retrieve("warm up")
+        error = llm_config_error()
+        if error is None:
+            with phase("qa_pipeline"):
+                get_engine().warm_up()
+    except Exception as e:
+        error = f"Warm-up failed: {str(e)}"
+
+    elapsed = time.perf_counter() - STARTED_AT
+    with _lock:
+        _state.update(warming=False, ready=error is None, error=error, ready_after=elapsed if error is None else None)
+        phases = dict(_phases)
+    metrics.set_gauge("app_ready", 1 if error is None else 0)
+
+    breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items())
+    if error is None:
+        print(f"Ready {elapsed:.2f}s after start ({breakdown})")
+    else:
+        print(f"Not ready: {error} ({breakdown})")
+
+
+def start_warmup():
+    """Load models and open the stores in a background thread, once"""
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return
+        _state["warming"] = True
+        _thread = threading.Thread(target=_warm_up, name="warmup", daemon=True)
+    metrics.set_gauge("app_ready", 0)
+    _thread.start()
+
+
+def get_startup_status():
+    """Readiness plus the seconds spent in each startup phase so far and the embedding model's
+    load time and memory cost"""
+    from vectorstore import get_model_stats
+
+    with _lock:
+        return dict(
+            _state,
+            warnings=list(_state["warnings"]),
+            seconds_since_start=time.perf_counter() - STARTED_AT,
+            phases={name: round(seconds, 3) for name, seconds in _phases.items()},
+            embedding_model=get_model_stats(),
+        )
+
+
+metrics.describe("startup_phase_seconds", "Seconds spent in each startup phase")
+metrics.describe("app_ready", "1 once models are loaded and the app can answer questions")
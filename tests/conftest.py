@@ -0,0 +1,25 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def app_dir(tmp_path_factory):
+    """Run the tests in an empty app directory, so ./chroma_db and the SQLite stores are scratch copies"""
+    directory = tmp_path_factory.mktemp("app")
+    cwd = os.getcwd()
+    os.chdir(directory)
+    yield directory
+    os.chdir(cwd)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def fake_embeddings(app_dir):
+    """Deterministic embeddings in place of the Hugging Face model, so nothing is downloaded"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import vectorstore
+    from embedding_cache import CachedEmbeddings
+
+    vectorstore._embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=32), model_name="fake", normalize=False)
@@ -0,0 +1,123 @@
+import asyncio
+import functools
+import random
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+WORDS = [f"word{i}" for i in range(3000)]
+
+
+def _text(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def _serve(directory):
+    """Serve directory on a local port; returns (server, base URL, list of requested paths)"""
+    requested = []
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requested.append(self.path)
+            super().do_GET()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=str(directory)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", requested
+
+
+@pytest.fixture
+def sites(tmp_path):
+    """A docs site with copies of one page, a robots.txt exclusion, a link chain and links to
+    another host, plus that other host"""
+    offsite_dir = tmp_path / "offsite"
+    offsite_dir.mkdir()
+    (offsite_dir / "page.html").write_text("<html><body><p>Another site</p></body></html>")
+    offsite, offsite_url, offsite_requested = _serve(offsite_dir)
+
+    site_dir = tmp_path / "site"
+    (site_dir / "private").mkdir(parents=True)
+    rng = random.Random(0)
+    # Every page shares its navigation text, as pages of one docs site do
+    nav = _text(rng, 40)
+
+    def page(body, links=(), header=""):
+        anchors = " ".join(f"<a href='{link}'>{link}</a>" for link in links)
+        return f"<html><body><nav>{header} {nav} {anchors}</nav><h1>Docs</h1><p>{body}</p></body></html>"
+
+    article = _text(rng, 150)
+    (site_dir / "index.html").write_text(page(_text(rng, 100), [
+        "/a.html", "/a-copy.html", "/a-print.html", "/b.html", "/chain1.html",
+        "/private/secret.html", "/logo.png", f"{offsite_url}/page.html",
+    ]))
+    (site_dir / "a.html").write_text(page(article + " Last updated 2024-01-01 12:00"))
+    (site_dir / "a-copy.html").write_text(page(article + " Last updated 2024-01-01 12:00"))
+    # Same article with other boilerplate: a badge and another timestamp
+    (site_dir / "a-print.html").write_text(page(article + " Last updated 2025-06-30 08:15", header="New print view"))
+    (site_dir / "b.html").write_text(page(_text(rng, 150)))
+    for index in (1, 2, 3):
+        (site_dir / f"chain{index}.html").write_text(page(_text(rng, 100), [f"/chain{index + 1}.html"]))
+    (site_dir / "private" / "secret.html").write_text(page(_text(rng, 100)))
+    (site_dir / "logo.png").write_bytes(b"\x89PNG")
+    (site_dir / "robots.txt").write_text("User-agent: *\nDisallow: /private/\n")
+    site, site_url, site_requested = _serve(site_dir)
+
+    yield site_url, site_requested, offsite_requested
+    site.shutdown()
+    offsite.shutdown()
+
+
+def _crawl(root_url, **options):
+    from crawler import Crawler
+
+    ingested = []
+    lock = threading.Lock()
+
+    def ingest_page(doc):
+        with lock:
+            ingested.append(doc.metadata["source"])
+        return {"added": 1, "unchanged": 0, "deleted": 0}
+
+    crawler = Crawler(root_url, ingest_page, rate_limit=0, **options)
+    return asyncio.run(crawler.run()), ingested
+
+
+def test_crawl_stays_on_site_and_respects_robots_depth_and_duplicates(sites):
+    site_url, requested, offsite_requested = sites
+    stats, ingested = _crawl(f"{site_url}/index.html", max_depth=2, max_pages=50)
+
+    pages = {url.removeprefix(site_url) for url in ingested}
+    assert len(ingested) == len(pages)
+    # One of the three copies of the article is kept, whichever was fetched first
+    assert len(pages & {"/a.html", "/a-copy.html", "/a-print.html"}) == 1
+    assert pages - {"/a.html", "/a-copy.html", "/a-print.html"} == {
+        "/index.html", "/b.html", "/chain1.html", "/chain2.html",
+    }
+    assert stats["skipped"] == {"duplicate": 2, "disallowed": 1}
+
+    assert "/chain3.html" not in requested and "/chain4.html" not in requested
+    assert not any(path.startswith("/private/") or path.endswith(".png") for path in requested)
+    assert offsite_requested == []
+
+
+def test_crawl_stops_at_page_budget(sites):
+    site_url, requested, _ = sites
+    stats, ingested = _crawl(f"{site_url}/index.html", max_depth=2, max_pages=3)
+
+    assert len([path for path in requested if path != "/robots.txt"]) == 3
+    assert len(ingested) + stats["pages_skipped"] == 3
+
+
+def test_near_duplicate_index():
+    from crawler import NearDuplicateIndex, minhash
+
+    rng = random.Random(1)
+    nav = _text(rng, 40)
+    article = _text(rng, 80)
+    index = NearDuplicateIndex(0.8)
+    assert index.add(minhash(f"{nav} {article} Updated 2024-01-01"))
+    assert not index.add(minhash(f"{nav} New {article} Updated 2025-06-30"))
+    assert index.add(minhash(f"{nav} {_text(rng, 80)}"))
@@ -0,0 +1,34 @@
+def _write_source(tmp_path, name, paragraphs):
+    path = tmp_path / name
+    path.write_text("\n\n".join(f"{name} paragraph {i}: " + "lorem ipsum dolor " * 20 for i in range(paragraphs)))
+    return str(path)
+
+
+def test_rebuild_keeps_writes_made_during_the_copy(tmp_path):
+    from hnsw_index import rebuild_index
+    from ingestion import delete_embeddings_by_source, load_and_ingest_file
+    from vectorstore import get_vectordb
+
+    namespace = "rebuild"
+    kept = _write_source(tmp_path, "kept.txt", 12)
+    deleted = _write_source(tmp_path, "deleted.txt", 12)
+    added = _write_source(tmp_path, "added.txt", 12)
+    load_and_ingest_file(kept, namespace=namespace)
+    load_and_ingest_file(deleted, namespace=namespace)
+    collection = get_vectordb(namespace)._collection
+    expected = set(collection.get(where={"source_path": kept}, include=[])["ids"])
+
+    def progress(**counts):
+        # Once, after the first batch: delete chunks not copied yet and add new ones
+        if not progress.done:
+            progress.done = True
+            delete_embeddings_by_source(deleted, namespace)
+            load_and_ingest_file(added, namespace=namespace)
+
+    progress.done = False
+    settings = rebuild_index(namespace, ef_search=50, batch_size=3, progress=progress)
+
+    collection = get_vectordb(namespace)._collection
+    expected |= set(collection.get(where={"source_path": added}, include=[])["ids"])
+    assert settings["hnsw"]["ef_search"] == 50
+    assert set(collection.get(include=[])["ids"]) == expected
@@ -0,0 +1,30 @@
+from unittest import mock
+
+PAGE = "<html><head><title>Auth</title></head><body><h1>Auth</h1><p>Tokens expire after an hour.</p></body></html>"
+
+
+def _response(status_code, headers=None):
+    response = mock.Mock(status_code=status_code, text=PAGE, headers=headers or {}, apparent_encoding="utf-8")
+    response.raise_for_status.return_value = None
+    return response
+
+
+def test_url_validators_are_stored_and_sent_on_refetch():
+    from ingestion import load_and_ingest_url
+    from vectorstore import get_vectordb
+
+    url = "https://docs.example.com/auth"
+    headers = {"ETag": '"v1"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    with mock.patch("requests.Session.get", return_value=_response(200, headers)):
+        assert load_and_ingest_url(url)["added"] > 0
+
+    metadatas = get_vectordb()._collection.get(where={"source_path": url}, include=["metadatas"])["metadatas"]
+    assert metadatas
+    assert all(metadata["etag"] == '"v1"' for metadata in metadatas)
+    assert all(metadata["last_modified"] == headers["Last-Modified"] for metadata in metadatas)
+
+    with mock.patch("requests.Session.get", return_value=_response(304)) as get:
+        assert load_and_ingest_url(url)["not_modified"]
+    sent = get.call_args.kwargs["headers"]
+    assert sent["If-None-Match"] == '"v1"'
+    assert sent["If-Modified-Since"] == headers["Last-Modified"]
@@ -0,0 +1,22 @@
+import pytest
+
+
+def test_reads_never_create_a_namespace(tmp_path):
+    from ingestion import load_and_ingest_file
+    from namespaces import UnknownNamespace, list_namespaces
+    from sources import delete_source, list_sources, page_count
+    from vectorstore import get_vectordb
+
+    assert list_sources(namespace="typo") == ([], 0)
+    assert page_count("file", "typo") == 1
+    assert delete_source("a.txt", "typo") is None
+    with pytest.raises(UnknownNamespace):
+        get_vectordb("typo")
+    assert "typo" not in list_namespaces()
+    assert "ns_typo" not in {collection.name for collection in get_vectordb()._client.list_collections()}
+
+    path = tmp_path / "a.txt"
+    path.write_text("Tokens expire after an hour.")
+    load_and_ingest_file(str(path), namespace="typo")
+    assert "typo" in list_namespaces()
+    assert list_sources(namespace="typo")[1] == 1
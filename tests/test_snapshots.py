@@ -0,0 +1,86 @@
+import io
+import os
+import pytest
+
+
+def _write_source(tmp_path, name, paragraphs):
+    path = tmp_path / name
+    path.write_text("\n\n".join(f"{name} paragraph {i}: " + "lorem ipsum dolor " * 20 for i in range(paragraphs)))
+    return str(path)
+
+
+def test_export_matches_the_collection_after_writes_during_the_read(tmp_path):
+    from ingestion import delete_embeddings_by_source, load_and_ingest_file
+    from snapshots import Snapshot, export_snapshot
+    from vectorstore import get_vectordb
+
+    namespace = "export"
+    deleted = _write_source(tmp_path, "deleted.txt", 12)
+    load_and_ingest_file(_write_source(tmp_path, "kept.txt", 12), namespace=namespace)
+    load_and_ingest_file(deleted, namespace=namespace)
+
+    def progress(**counts):
+        # Once, after the first batch: delete chunks not read yet and add new ones
+        if not progress.done:
+            progress.done = True
+            delete_embeddings_by_source(deleted, namespace)
+            load_and_ingest_file(_write_source(tmp_path, "added.txt", 12), namespace=namespace)
+
+    progress.done = False
+    path = str(tmp_path / "export.snap")
+    header = export_snapshot(path, namespace, batch_size=3, progress=progress)
+
+    snapshot = Snapshot(path)
+    snapshot.verify()
+    ids = get_vectordb(namespace)._collection.get(include=[])["ids"]
+    assert header["count"] == len(ids)
+    assert sorted(snapshot.records()["ids"]) == sorted(ids)
+
+
+def test_uploads_never_replace_a_snapshot(tmp_path, monkeypatch):
+    import snapshots
+    from ingestion import load_and_ingest_file
+
+    monkeypatch.setattr(snapshots, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    path = str(tmp_path / "exported.snap")
+    load_and_ingest_file(_write_source(tmp_path, "upload.txt", 3), namespace="upload")
+    snapshots.export_snapshot(path, "upload")
+    with open(path, "rb") as f:
+        data = f.read()
+
+    first = snapshots.save_snapshot(io.BytesIO(data), "backup.snap")
+    with pytest.raises(ValueError):
+        snapshots.save_snapshot(io.BytesIO(b"not a snapshot"), "backup.snap")
+    second = snapshots.save_snapshot(io.BytesIO(data), "backup.snap")
+
+    assert first.endswith("backup.snap") and second.endswith("backup-1.snap")
+    with open(first, "rb") as f:
+        assert f.read() == data
+    assert sorted(os.listdir(snapshots.SNAPSHOT_DIR)) == ["backup-1.snap", "backup.snap"]
+
+
+def test_import_into_another_namespace_moves_uploads_and_swaps_the_lexical_index(tmp_path):
+    from ingestion import load_and_ingest_file
+    from lexical_index import get_lexical_index
+    from snapshots import export_snapshot, import_snapshot
+    from sources import delete_uploaded_file, list_sources, save_upload, upload_dir
+    from vectorstore import get_vectordb
+
+    source = save_upload(_write_source(tmp_path, "guide.txt", 3), "guide.txt", "origin")
+    load_and_ingest_file(source, namespace="origin")
+    # Replaced by the import
+    load_and_ingest_file(save_upload(_write_source(tmp_path, "old.txt", 3), "old.txt", "target"), namespace="target")
+    path = str(tmp_path / "origin.snap")
+    export_snapshot(path, "origin")
+    import_snapshot(path, "target")
+
+    moved = os.path.join(upload_dir("target"), "guide.txt")
+    assert [record["source_path"] for record in list_sources(namespace="target")[0]] == [moved]
+    ids = get_vectordb("target")._collection.get(where={"source_path": moved}, include=[])["ids"]
+    assert ids
+    assert set(get_lexical_index("target").search("guide.txt paragraph lorem", k=100)) == set(ids)
+    assert not os.path.exists(get_lexical_index("target").path + ".staging")
+
+    assert "Deleted embeddings" in delete_uploaded_file("guide.txt", "target")
+    assert get_vectordb("target")._collection.count() == 0
+    assert get_lexical_index("target").count() == 0
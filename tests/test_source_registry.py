@@ -0,0 +1,12 @@
+def test_mixed_embedding_models_are_reported_per_namespace():
+    from namespaces import create_namespace
+    from source_registry import check_embedding_models, get_source_registry
+    from vectorstore import EMBEDDING_TAG
+
+    registry = get_source_registry(create_namespace("models"))
+    registry.upsert("current.txt", "file", "hash1", 5, EMBEDDING_TAG)
+    assert "ns_models" not in (check_embedding_models() or "")
+
+    registry.upsert("old.txt", "file", "hash2", 3, "old-model")
+    registry.upsert("older.txt", "file", "hash3", 4, "old-model")
+    assert "ns_models (7 chunks from old-model)" in check_embedding_models()
@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+import resource
+from contextlib import contextmanager
+import metrics
+from embedding_cache import CachedEmbeddings
+from namespaces import DEFAULT_NAMESPACE, HandleCache, normalize_namespace
+
+CHROMA_DB_DIR = "./chroma_db"
+# Collection of the default namespace; every other namespace gets NAMESPACE_COLLECTION_PREFIX + name
+COLLECTION_NAME = "docs_collection"
+NAMESPACE_COLLECTION_PREFIX = "ns_"
+# During an index swap the old collection is renamed with RETIRED_SUFFIX before the rebuilt one
+# takes its name (see hnsw_index.py)
+RETIRED_SUFFIX = "__retired"
+
+# HNSW settings of new collections. Cosine matches the normalized embeddings; max_neighbors (M),
+# ef_construction and space are fixed when a collection is built, and Chroma keeps a loaded
+# index's ef_search, so changing any of them on an existing collection takes a rebuild
+HNSW_SPACE = os.getenv("HNSW_SPACE", "cosine")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+HNSW_SPACES = ("cosine", "l2", "ip")
+
+# sentence-transformers/all-MiniLM-L6-v2 is a smaller, faster alternative
+model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+# torch, onnx (ONNX Runtime, fp32) or onnx-int8 (ONNX Runtime with int8 dynamic quantization)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Instruction set the int8 model is quantized for: avx512_vnni, avx512, avx2 or arm64
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "avx2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# CPU threads per encode call; 0 keeps the library default of one per core
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Where models without a published int8 ONNX file are exported and quantized
+ONNX_EXPORT_DIR = "./onnx_models"
+# Chunks stored before embeddings were tagged all came from this model
+LEGACY_EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+model_kwargs = {'device': 'cpu'}
+# Unit-length vectors make cosine, inner product and L2 rank chunks the same way
+encode_kwargs = {'normalize_embeddings': True, 'batch_size': EMBEDDING_BATCH_SIZE}
+
+_lock = threading.Lock()
+_embeddings = None
+_model_stats = {}
+
+# Callbacks notified whenever a collection changes, e.g. to drop cached retrievers
+_collection_listeners = []
+
+_write_locks_lock = threading.Lock()
+_write_locks = {}
+# Per namespace, the id sets of the track_writes blocks running on it
+_write_trackers = {}
+
+
+def _current_rss_mb():
+    """Resident memory of this process in MB (falls back to peak RSS off Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def embedding_tag(model=model_name, backend=EMBEDDING_BACKEND):
+    """Model/version tag stored with every chunk. The fp32 backends produce the same
+    vectors, so they share the plain model name; int8 vectors get their own tag."""
+    if backend == "onnx-int8":
+        return f"{model}:int8-{EMBEDDING_QUANTIZATION}"
+    return model
+
+
+EMBEDDING_TAG = embedding_tag()
+
+
+def _quantized_onnx_model(model):
+    """(model path, file name) of the int8 ONNX model, quantizing it locally if the hub repo has none"""
+    file_name = f"onnx/model_qint8_{EMBEDDING_QUANTIZATION}.onnx"
+    try:
+        from huggingface_hub import hf_hub_download
+
+        hf_hub_download(model, file_name)
+        return model, file_name
+    except Exception:
+        pass
+
+    local_dir = os.path.join(ONNX_EXPORT_DIR, model.replace("/", "--"))
+    if not os.path.exists(os.path.join(local_dir, file_name)):
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        print(f"Exporting {model} to ONNX with {EMBEDDING_QUANTIZATION} int8 quantization...")
+        exported = SentenceTransformer(model, device="cpu", backend="onnx")
+        exported.save_pretrained(local_dir)
+        export_dynamic_quantized_onnx_model(exported, EMBEDDING_QUANTIZATION, local_dir)
+    return local_dir, file_name
+
+
+def build_embeddings(model=model_name, backend=EMBEDDING_BACKEND):
+    """Uncached embedding model for a sentence-transformers model on the given backend"""
+    # Imported here so starting the app does not wait for torch and sentence-transformers
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    kwargs = dict(model_kwargs)
+    path = model
+    if backend in ("onnx", "onnx-int8"):
+        kwargs["backend"] = "onnx"
+        onnx_kwargs = {}
+        if EMBEDDING_THREADS:
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = EMBEDDING_THREADS
+            onnx_kwargs["session_options"] = options
+        if backend == "onnx-int8":
+            path, onnx_kwargs["file_name"] = _quantized_onnx_model(model)
+        kwargs["model_kwargs"] = onnx_kwargs
+    elif backend == "torch":
+        if EMBEDDING_THREADS:
+            import torch
+
+            torch.set_num_threads(EMBEDDING_THREADS)
+    else:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected torch, onnx or onnx-int8")
+    return HuggingFaceEmbeddings(model_name=path, model_kwargs=kwargs, encode_kwargs=encode_kwargs)
+
+
+def get_embeddings():
+    """Return the shared (cached) embedding model, loading it on first use"""
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            rss_before = _current_rss_mb()
+            started = time.perf_counter()
+            # The cache is keyed by tag so int8 vectors never mix with fp32 ones
+            _embeddings = CachedEmbeddings(
+                build_embeddings(),
+                model_name=EMBEDDING_TAG,
+                normalize=encode_kwargs["normalize_embeddings"],
+            )
+            _model_stats.update(
+                model_name=model_name,
+                backend=EMBEDDING_BACKEND,
+                embedding_tag=EMBEDDING_TAG,
+                load_seconds=time.perf_counter() - started,
+                rss_delta_mb=_current_rss_mb() - rss_before,
+            )
+            metrics.set_gauge("embedding_model_load_seconds", _model_stats["load_seconds"], embedding_model=EMBEDDING_TAG)
+            metrics.set_gauge("embedding_model_rss_mb", _model_stats["rss_delta_mb"], embedding_model=EMBEDDING_TAG)
+            print(
+                f"Loaded embedding model {EMBEDDING_TAG} ({EMBEDDING_BACKEND}) in {_model_stats['load_seconds']:.2f}s "
+                f"(+{_model_stats['rss_delta_mb']:.0f} MB RSS)"
+            )
+        return _embeddings
+
+
+def collection_name(namespace=DEFAULT_NAMESPACE):
+    return COLLECTION_NAME if namespace == DEFAULT_NAMESPACE else NAMESPACE_COLLECTION_PREFIX + namespace
+
+
+def hnsw_configuration(space=HNSW_SPACE, max_neighbors=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, ef_search=HNSW_EF_SEARCH):
+    """Chroma collection configuration for the given HNSW settings"""
+    if space not in HNSW_SPACES:
+        raise ValueError(f"Unknown HNSW space {space!r}, expected one of {', '.join(HNSW_SPACES)}")
+    if min(max_neighbors, ef_construction, ef_search) < 1:
+        raise ValueError("max_neighbors, ef_construction and ef_search must be at least 1")
+    return {"hnsw": {
+        "space": space, "max_neighbors": max_neighbors, "ef_construction": ef_construction, "ef_search": ef_search,
+    }}
+
+
+def _restore_interrupted_swap(client, name):
+    """Rename the old collection back if the process stopped between the two renames of an index swap"""
+    names = {collection.name for collection in client.list_collections()}
+    if name not in names and name + RETIRED_SUFFIX in names:
+        client.get_collection(name + RETIRED_SUFFIX).modify(name=name)
+        print(f"Restored collection {name} after an interrupted index swap.")
+
+
+def _open_vectordb(namespace):
+    import chromadb
+    from langchain_chroma import Chroma
+
+    client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+    _restore_interrupted_swap(client, collection_name(namespace))
+    return Chroma(
+        client=client,
+        collection_name=collection_name(namespace),
+        embedding_function=get_embeddings(),
+        collection_configuration=hnsw_configuration(),
+    )
+
+
+_vectordbs = HandleCache(_open_vectordb)
+
+
+def get_vectordb(namespace=DEFAULT_NAMESPACE):
+    """Return the Chroma handle for a namespace's collection, opening it on first use"""
+    return _vectordbs.get(namespace)
+
+
+def reopen_vectordb(namespace=DEFAULT_NAMESPACE):
+    """Drop a namespace's Chroma handle so the next get_vectordb opens its collection by name again"""
+    _vectordbs.drop(namespace)
+
+
+def collection_write_lock(namespace=DEFAULT_NAMESPACE):
+    """Lock held around every write to a namespace's collection, so an index swap never loses one"""
+    namespace = normalize_namespace(namespace)
+    with _write_locks_lock:
+        return _write_locks.setdefault(namespace, threading.Lock())
+
+
+@contextmanager
+def track_writes(namespace=DEFAULT_NAMESPACE):
+    """Collect the ids of chunks written to or deleted from a namespace's collection while the
+    block runs, so a copy of the collection can catch up on just those (see hnsw_index.py)"""
+    namespace = normalize_namespace(namespace)
+    written = set()
+    # Registered under the write lock, so no write is half done when tracking starts
+    with collection_write_lock(namespace), _write_locks_lock:
+        _write_trackers.setdefault(namespace, []).append(written)
+    try:
+        yield written
+    finally:
+        with _write_locks_lock:
+            _write_trackers[namespace] = [other for other in _write_trackers[namespace] if other is not written]
+
+
+def mark_written(namespace, ids):
+    """Record chunk ids written or deleted; called with collection_write_lock(namespace) held"""
+    with _write_locks_lock:
+        for written in _write_trackers.get(normalize_namespace(namespace), ()):
+            written.update(ids)
+
+
+def get_model_stats():
+    """Load time and memory cost of the embedding model (only rss_mb, the current resident
+    memory of the process, until it is loaded); reported by /ready"""
+    return dict(_model_stats, rss_mb=_current_rss_mb())
+
+
+def on_collection_change(callback):
+    """Register a callback(source_path, namespace) run after a collection is modified"""
+    _collection_listeners.append(callback)
+
+
+def notify_collection_change(source_path=None, namespace=DEFAULT_NAMESPACE):
+    for callback in _collection_listeners:
+        try:
+            callback(source_path, namespace)
+        except Exception as e:
+            print(f"Error in collection change listener: {str(e)}")
+
+
+metrics.describe("embedding_model_load_seconds", "Seconds taken to load the embedding model")
+metrics.describe("embedding_model_rss_mb", "Resident memory in MB added by loading the embedding model")